@@ -3,19 +3,14 @@
 import sys
 import os
 import time
-import pandas as pd
 import numpy as np
 import math
-import sympy as sy
-import matplotlib
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from pyomo.environ import *
-from gurobipy import *
-import os
-import networkx as nx
-import matplotlib.pyplot as plt
 from collections import OrderedDict
+from formulation_general import LazyModule, plot_status
+
+plt = LazyModule('matplotlib.pyplot')
+nx = LazyModule('networkx')
+pm = LazyModule('pyomo.environ')
 
 
 def get_variable_value_gurobi(rho, iter_bus, iter_time):
@@ -27,31 +22,23 @@ def get_variable_value_gurobi(rho, iter_bus, iter_time):
     return RHO
 
 
-def plot_binary_evolution(UL, iter_line, str):
+def plot_binary_evolution(UL, iter_line, str, filename=None):
     # plot a binary evolution figure
     # U should be a dictionary, where keys will be the iterm
     # In each iterm, a list of 0 and 1 represents the time evolution
+    # the figure is saved to filename instead of being shown if it is given
 
-    # get size
-    y_axis = UL.keys()
-    number_y = len(y_axis)
-    iter_time = np.arange(0, len(UL[y_axis[0]]))
+    # status matrix of (item, time), drawn as one image
+    status = np.array([np.asarray(UL[i], dtype=float) for i in UL.keys()])
 
     # plotting
-    plt.figure(figsize=(15, 8))
-    plt.xlabel('Time (step)')
-    plt.ylabel('Index')
-    k=0
-    for i in y_axis:
-        for t in iter_time:
-            if UL[i][t] == False:
-                plt.scatter(t, y_axis[k], c='red', s=50, alpha=0.5, edgecolors='none')
-            else:
-                plt.scatter(t, y_axis[k], c='green', s=50, alpha=0.5, edgecolors='none')
-        k = k + 1
-    plt.yticks(y_axis, iter_line)
-    plt.title(str)
-    plt.show()
+    fig, ax = plt.subplots(figsize=(15, 8))
+    plot_status(ax, status, list(iter_line), 'Time (step)', 'Index', str)
+    if filename is None:
+        plt.show()
+    else:
+        fig.savefig(filename)
+        plt.close(fig)
 
 
 
@@ -75,34 +62,34 @@ def crew_dispatch_MIP_pyomo(model, res, vrp, ppc):
         res[c]['route'] = [] # empty list
         for i in iter_vertex:
             for j in iter_vertex:
-                res[c]['x'][i, j] = value(model.x[c, i, j])
-                if value(model.x[c, i, j]) == 1:
+                res[c]['x'][i, j] = pm.value(model.x[c, i, j])
+                if pm.value(model.x[c, i, j]) == 1:
                     res[c]['route'].append((i, j))
 
         res[c]['y'] = {}
         for i in iter_vertex:
-            res[c]['y'][i] = value(model.y[c, i])
+            res[c]['y'][i] = pm.value(model.y[c, i])
 
         res[c]['AT'] = [] # define a list for plotting
         for i in iter_vertex:
-            res[c]['AT'].append(value(model.AT[c, i]))
+            res[c]['AT'].append(pm.value(model.AT[c, i]))
 
         # compute the available time of component
         res[c]['ava'] = []
         for i in iter_vertex:
-            res[c]['ava'].append(value(model.AT[c, i]) + vrp['repair'][c][i])
+            res[c]['ava'].append(pm.value(model.AT[c, i]) + vrp['repair'][c][i])
 
         res[c]['f'] = {}
         for i in iter_vertex:
             res[c]['f'][i] = []
             for t in iter_time:
-                res[c]['f'][i].append(value(model.f[i, t]))
+                res[c]['f'][i].append(pm.value(model.f[i, t]))
 
         res[c]['z'] = {}
         for i in iter_vertex:
             res[c]['z'][i] = []
             for t in iter_time:
-                res[c]['z'][i].append(value(model.z[i, t]))
+                res[c]['z'][i].append(pm.value(model.z[i, t]))
 
 
     # add route to the graph
@@ -127,20 +114,9 @@ def crew_dispatch_MIP_pyomo(model, res, vrp, ppc):
     plt.show()
 
 
-    plt.figure(figsize=(15,5))
-    plt.xlabel('Time (step)')
-    plt.ylabel('Component name')
-    y_axis = np.arange(0, len(iter_vertex))
-    k =0
-    for i in vrp['ordered_vertex']:
-        for t in res['iter_time']:
-            if res[0]['z'][i][t] == 0:
-                plt.scatter(t, y_axis[k], c='red', s=50, alpha=0.5, edgecolors='none')
-            else:
-                plt.scatter(t, y_axis[k], c='green', s=50, alpha=0.5, edgecolors='none')
-        k = k + 1
-    plt.yticks(y_axis, vrp['ordered_vertex'])
-    plt.title('Availability of components (CPLEX)')
+    fig, ax = plt.subplots(figsize=(15,5))
+    status = np.array([res[0]['z'][i] for i in vrp['ordered_vertex']], dtype=float)
+    plot_status(ax, status, vrp['ordered_vertex'], 'Time (step)', 'Component name', 'Availability of components (CPLEX)')
     # plt.legend(bbox_to_anchor=(1, 1), loc=2, borderaxespad=0.5)
     plt.show()
 
@@ -177,34 +153,34 @@ def network_flow_MIP(model, res, vrp, ppc):
     for i in iter_bus:
         res['V'][i] = []
         for t in iter_time:
-            res['V'][i].append(value(model.V[i, t]))
+            res['V'][i].append(pm.value(model.V[i, t]))
 
     for i in iter_line:
         res['P'][i] = []
         for t in iter_time:
-            res['P'][i].append(value(model.P[i, t]))
+            res['P'][i].append(pm.value(model.P[i, t]))
 
     for i in iter_line:
         res['Q'][i] = []
         for t in iter_time:
-            res['Q'][i].append(value(model.Q[i, t]))
+            res['Q'][i].append(pm.value(model.Q[i, t]))
 
     for i in iter_line:
         res['ul'][i] = []
         for t in iter_time:
-            res['ul'][i].append(int(value(model.ul[i, t])))
+            res['ul'][i].append(int(pm.value(model.ul[i, t])))
 
     for i in iter_bus:
         res['rho'][i] = []
         for t in iter_time:
-            res['rho'][i].append(int(value(model.rho[i, t])))
+            res['rho'][i].append(int(pm.value(model.rho[i, t])))
 
     for i in iter_gen:
         res['p'][i] = []
         res['q'][i] = []
         for t in iter_time:
-            res['p'][i].append(value(model.p[i, t]))
-            res['q'][i].append(value(model.q[i, t]))
+            res['p'][i].append(pm.value(model.p[i, t]))
+            res['q'][i].append(pm.value(model.q[i, t]))
 
     # Voltage change at each bus w.r.test_1 time
     fig = plt.figure(figsize=(12, 5))
@@ -238,37 +214,15 @@ def network_flow_MIP(model, res, vrp, ppc):
     # plt.show()
     plt.title('Active Power')
 
-    plt.figure(figsize=(15, 8))
-    plt.xlabel('Time (step)')
-    # plt.ylabel('Component name')
-    y_axis = np.arange(0, len(iter_line))
-    k = 0
-    for i in iter_line:
-        for t in iter_time:
-            if abs(res['ul'][i][t]) <= 0.01:
-                plt.scatter(t, y_axis[k], c='red', s=50, alpha=0.5, edgecolors='none')
-            else:
-                plt.scatter(t, y_axis[k], c='green', s=50, alpha=0.5, edgecolors='none')
-        k = k + 1
-    plt.yticks(y_axis, iter_line)
-    plt.title('Status of line')
+    fig, ax = plt.subplots(figsize=(15, 8))
+    status = np.array([res['ul'][i] for i in iter_line], dtype=float)
+    plot_status(ax, status, iter_line, 'Time (step)', '', 'Status of line')
     # plt.legend(bbox_to_anchor=(1, 1), loc=2, borderaxespad=0.5)
     plt.show()
 
-    plt.figure(figsize=(15, 8))
-    plt.xlabel('Time (step)')
-    # plt.ylabel('Component name')
-    y_axis = np.arange(0, len(iter_bus))
-    k = 0
-    for i in iter_bus:
-        for t in iter_time:
-            if abs(res['rho'][i][t]) <= 0.01:
-                plt.scatter(t, y_axis[k], c='red', s=50, alpha=0.5, edgecolors='none')
-            else:
-                plt.scatter(t, y_axis[k], c='green', s=50, alpha=0.5, edgecolors='none')
-        k = k + 1
-    plt.yticks(y_axis, iter_bus)
-    plt.title('Status of load')
+    fig, ax = plt.subplots(figsize=(15, 8))
+    status = np.array([res['rho'][i] for i in iter_bus], dtype=float)
+    plot_status(ax, status, iter_bus, 'Time (step)', '', 'Status of load')
     # plt.legend(bbox_to_anchor=(1, 1), loc=2, borderaxespad=0.5)
     plt.show()
 
@@ -2,17 +2,18 @@
 import sys
 import os
 import time
-import pandas as pd
 import numpy as np
 import math
-import sympy as sy
-import matplotlib
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from pyomo.environ import *
 import os
-import networkx as nx
-import matplotlib.pyplot as plt
+import hashlib
+import scipy.sparse as sparse
+import scipy.sparse.csgraph as csgraph
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from formulation_general import LazyModule
+
+nx = LazyModule('networkx')
 
 
 
@@ -40,10 +41,6 @@ def crew_dispatch_random():
     for i in vrp['ordered_vertex']:
         vrp['graph'].add_node(i)
 
-    plt.figure(figsize=(7, 5))
-    nx.draw(vrp['graph'], vrp['fault']['location'], with_labels=True)
-    plt.show()
-
 
     # -----------random data -----------
     # random repairing time of fault components by each crew
@@ -58,15 +55,9 @@ def crew_dispatch_random():
                 vrp['repair'][c][i] = np.random.randint(1, 10)
 
     # random traveling time to check robustness of the formulation
-    vrp['travel'] = {}
-    for i in vrp['ordered_vertex']:
-        vrp['travel'][i] = {}
-        if i == 'd':
-            for j in vrp['ordered_vertex']:
-                vrp['travel'][i][j] = 0
-        else:
-            for j in vrp['ordered_vertex']:
-                vrp['travel'][i][j] = np.random.randint(1, 10)
+    travel = np.random.randint(1, 10, (vrp['number_vertex'], vrp['number_vertex']))
+    travel[vrp['ordered_vertex'].index('d')] = 0
+    vrp['travel'] = TravelMatrix(travel, vrp['ordered_vertex'])
 
     return vrp
 
@@ -74,7 +65,12 @@ def crew_dispatch_random():
 
 
 
-def crew_dispatch_determ():
+def crew_dispatch_determ(road=None, cache_dir=None):
+    """
+    :param road: networkx road graph with node attribute 'pos', the travel time is the shortest path between the nodes
+                 nearest to the vertices instead of the straight-line distance if given
+    :param cache_dir: directory of the cached road travel times
+    """
     # define a dictionary for vehicle routing problem
     vrp = {}
 
@@ -116,14 +112,301 @@ def crew_dispatch_determ():
                 vrp['repair'][c][i] = int(5)
 
     # traveling time based on coordinates
-    vrp['travel'] = {}
-    for i in vrp['ordered_vertex']:
-        vrp['travel'][i] = {}
-        for j in vrp['ordered_vertex']:
-            vrp['travel'][i][j] = int(
-                round(math.sqrt((vrp['fault']['location'][i][0] - vrp['fault']['location'][j][0]) ** 2 + \
-                                (vrp['fault']['location'][i][1] - vrp['fault']['location'][j][1]) ** 2)))
+    location = np.array([vrp['fault']['location'][i] for i in vrp['ordered_vertex']])
+    if road is None:
+        travel = get_travel_matrix(location)
+    else:
+        travel = get_travel_matrix_road(road, get_nearest_node(road, location), cache_dir=cache_dir)
+    vrp['travel'] = TravelMatrix(travel, vrp['ordered_vertex'])
 
 
     return vrp
 
+
+
+
+
+def crew_dispatch_scenario(ppc, number_scenario=1, number_damaged=6, number_crew=1, number_depot=1, seed=0,
+                           storm_radius=None, repair_time=5, repair_sigma=0.4, crew_sigma=0.2, speed=1,
+                           road=None, chunk_size=2 ** 22):
+    """
+    Random damage scenarios of a feeder for stochastic and benchmark studies, each one a vrp dictionary in the format of
+    crew_dispatch_determ. The whole batch is drawn as arrays and no figure is drawn.
+    - damage: each scenario has a storm center near a random bus, the damaged lines are sampled without replacement
+      with a weight of the line length times a Gaussian decay of the distance of the line midpoint to the center, so the
+      damage is spatially correlated; tie lines are not damaged
+    - repair time: each crew has a log-normal skill factor shared by all scenarios, and the repair time of a damaged line
+      by a crew is log-normal with median repair_time times the skill factor, rounded to at least one time step
+    - depots: the first depot is at the substation and the others at random buses; the crews of a scenario start from
+      and return to the depot nearest to the damage ('0' and 'd' at the same location)
+    :param ppc: feeder data, e.g. from Fun_IEEETestCase, the bus locations are ppc['bus_location'] if given
+    :param number_damaged: number of damaged lines of each scenario
+    :param number_depot: number of depots
+    :param seed: seed of the random generator
+    :param storm_radius: standard deviation of the storm decay, a quarter of the feeder extent if None
+    :param repair_time: median repair time in time steps
+    :param repair_sigma: log-normal sigma of the repair time of a line
+    :param crew_sigma: log-normal sigma of the skill factor of the crews
+    :param speed: distance travelled in one time step
+    :param road: networkx road graph with node attribute 'pos' for the travel time by the shortest paths, see
+                 get_travel_matrix_road, straight-line distance if None
+    :param chunk_size: largest number of (scenario, line) weights drawn at once
+    :return: list of vrp dictionaries, with vrp['scenario'] the number of the scenario and vrp['fault']['center'] the
+             storm center
+    """
+    rng = np.random.default_rng(seed)
+    location = get_bus_location(ppc, seed)
+
+    ## candidate lines and their midpoint and length
+    bus_row = OrderedDict((int(b), k) for k, b in enumerate(ppc['bus'][:, 0]))
+    tieline = set(ppc['tieline'])
+    line = np.array([k for k, name in enumerate(ppc['iter_line']) if name not in tieline], dtype=int)
+    if number_damaged > line.shape[0]:
+        raise ValueError('cannot damage {} of {} lines'.format(number_damaged, line.shape[0]))
+    line_from = location[[bus_row[int(b)] for b in ppc['line'][line, 1]]]
+    line_to = location[[bus_row[int(b)] for b in ppc['line'][line, 2]]]
+    line_location = (line_from + line_to) / 2
+    line_length = np.maximum(np.hypot(*(line_from - line_to).T), 1e-9)
+    if storm_radius is None:
+        storm_radius = max((location.max(axis=0) - location.min(axis=0)).max() / 4, 1e-9)
+
+    ## depots and crews
+    depot = np.vstack((location[[bus_row[1]]], location[rng.choice(location.shape[0], number_depot - 1, replace=False)]))
+    crew_factor = rng.lognormal(0, crew_sigma, number_crew)
+
+    if road is not None:
+        node, A = get_road_matrix(road)
+        road_node = get_nearest_node(road, np.vstack((line_location, depot)))
+        road_row = np.array([node[n] for n in road_node])
+
+    vrp_list = []
+    chunk = max(1, chunk_size // line.shape[0])
+    for start in range(0, number_scenario, chunk):
+        number = min(chunk, number_scenario - start)
+
+        ## damaged lines: Gumbel top-k sampling without replacement of the storm weights
+        center = location[rng.integers(0, location.shape[0], number)] + rng.normal(0, storm_radius / 2, (number, 2))
+        key = rng.gumbel(size=(number, line.shape[0]))
+        key += np.log(line_length)[None, :]
+        key -= ((line_location[None, :, 0] - center[:, 0, None]) ** 2 + (line_location[None, :, 1] - center[:, 1, None]) ** 2) / (2 * storm_radius ** 2)
+        damaged = np.sort(np.argpartition(-key, number_damaged - 1, axis=1)[:, :number_damaged], axis=1)
+
+        ## depot nearest to the damage and repair time of (scenario, crew, damaged line)
+        centroid = line_location[damaged].mean(axis=1)
+        home = np.argmin(((centroid[:, None, :] - depot[None, :, :]) ** 2).sum(axis=2), axis=1)
+        repair = rng.lognormal(np.log(repair_time * crew_factor)[None, :, None], repair_sigma, (number, number_crew, number_damaged))
+        repair = np.maximum(np.rint(repair), 1).astype(int)
+
+        for s in range(number):
+            vrp = {}
+            vrp['scenario'] = start + s
+
+            # --------- crew --------------
+            vrp['number_crew'] = number_crew
+            vrp['iter_crew'] = np.arange(0, vrp['number_crew'])
+
+            # fault components and its location
+            name = [ppc['iter_line'][k] for k in line[damaged[s]]]
+            vrp['fault'] = {}
+            vrp['fault']['location'] = OrderedDict([('0', tuple(depot[home[s]])), ('d', tuple(depot[home[s]]))] +
+                                                   [(m, tuple(line_location[k].tolist())) for m, k in zip(name, damaged[s])])
+            vrp['fault']['center'] = tuple(center[s].tolist())
+
+            # get iterator
+            vrp['ordered_vertex'] = ['0'] + name + ['d']
+            vrp['iter_vertex'] = vrp['fault']['location'].keys()
+            vrp['number_vertex'] = len(vrp['iter_vertex'])
+            vrp['index_vertex'] = np.arange(vrp['number_vertex'])
+
+            # create a directed graph for visualization of vehicle routing problem
+            vrp['graph'] = nx.DiGraph()
+            vrp['graph'].add_nodes_from(vrp['ordered_vertex'])
+
+            # repairing time of fault components by each crew
+            vrp['repair'] = {}
+            for c in vrp['iter_crew']:
+                vrp['repair'][c] = OrderedDict([('0', 0)] + [(m, int(t)) for m, t in zip(name, repair[s, c])] + [('d', 0)])
+
+            # traveling time based on coordinates or roads
+            if road is None:
+                travel = get_travel_matrix(np.array([vrp['fault']['location'][i] for i in vrp['ordered_vertex']]), speed)
+            else:
+                site = np.concatenate(([line.shape[0] + home[s]], damaged[s], [line.shape[0] + home[s]]))
+                travel = get_road_travel(A, road_row[site], speed)
+            vrp['travel'] = TravelMatrix(travel, vrp['ordered_vertex'])
+
+            vrp_list.append(vrp)
+
+    return vrp_list
+
+
+
+
+
+def get_bus_location(ppc, seed=0):
+    """
+    get the (x, y) location of the buses, ppc['bus_location'] if given, otherwise a spring layout of the lines
+    scaled to a spacing of about one distance unit between neighbouring buses
+    :return: array of (bus, 2)
+    """
+    if 'bus_location' in ppc:
+        return np.asarray(ppc['bus_location'], dtype=float)
+
+    graph = nx.Graph()
+    graph.add_nodes_from(ppc['bus'][:, 0].astype(int))
+    graph.add_edges_from(ppc['line'][:, 1:3].astype(int).tolist())
+    position = nx.spring_layout(graph, seed=seed)
+    location = np.array([position[b] for b in ppc['bus'][:, 0].astype(int)])
+    spacing = np.median([np.hypot(*(position[i] - position[j])) for i, j in graph.edges])
+    return location / max(spacing, 1e-9)
+
+
+
+
+
+class TravelMatrix(Mapping):
+    """
+    travel time between the vertices kept as a NumPy array, read like the dictionary travel[i][j] by vertex names
+    """
+
+    def __init__(self, matrix, vertex):
+        self.matrix = np.asarray(matrix)
+        self.vertex = list(vertex)
+        self.row = OrderedDict((v, k) for k, v in enumerate(self.vertex))
+
+    def __getitem__(self, i):
+        return TravelRow(self.matrix[self.row[i]], self.row)
+
+    def __iter__(self):
+        return iter(self.vertex)
+
+    def __len__(self):
+        return len(self.vertex)
+
+    def get_matrix(self, vertex):
+        """
+        get the travel time matrix in the order of the given vertices
+        """
+        k = [self.row[v] for v in vertex]
+        return self.matrix[np.ix_(k, k)]
+
+
+
+class TravelRow(Mapping):
+    """
+    travel time from one vertex, read by the names of the destinations
+    """
+
+    def __init__(self, value, row):
+        self.value = value
+        self.row = row
+
+    def __getitem__(self, j):
+        return self.value[self.row[j]].item()
+
+    def __iter__(self):
+        return iter(self.row)
+
+    def __len__(self):
+        return len(self.row)
+
+
+
+
+
+def get_travel_matrix(location, speed=1):
+    """
+    get the travel time between all locations by the straight-line distance, rounded to time steps
+    :param location: array of (vertex, 2) coordinates
+    :param speed: distance travelled in one time step
+    :return: integer array of (vertex, vertex)
+    """
+    location = np.asarray(location, dtype=float)
+    distance = np.sqrt(((location[:, None, :] - location[None, :, :]) ** 2).sum(axis=2))
+    return np.rint(distance / speed).astype(int)
+
+
+
+
+
+def get_nearest_node(graph, location):
+    """
+    get the nodes of a road graph with node attribute 'pos' nearest to the locations
+    :return: list of nodes
+    """
+    from scipy.spatial import cKDTree
+
+    node = list(graph.nodes)
+    position = np.array([graph.nodes[n]['pos'] for n in node], dtype=float)
+    _, nearest = cKDTree(position).query(np.asarray(location, dtype=float))
+    return [node[k] for k in nearest]
+
+
+
+
+
+def get_travel_matrix_road(graph, site, weight='weight', speed=1, cache_dir=None):
+    """
+    get the travel time between the sites of a road graph by Dijkstra shortest paths from all sites, rounded to time steps
+    The result is cached in cache_dir under the hash of the graph and the sites
+    :param graph: networkx road graph, the edge attribute weight is the length
+    :param site: list of graph nodes of the vertices, e.g. from get_nearest_node
+    :param speed: distance travelled in one time step
+    :return: integer array of (site, site)
+    """
+    node, A = get_road_matrix(graph, weight)
+    source = np.array([node[n] for n in site])
+
+    if cache_dir is not None:
+        key = hashlib.sha1()
+        for a in (A.indptr, A.indices, A.data, source, np.array([speed, graph.is_directed()], dtype=float)):
+            key.update(np.ascontiguousarray(a).tobytes())
+        filename = os.path.join(cache_dir, 'travel_{}.npz'.format(key.hexdigest()))
+        if os.path.exists(filename):
+            with np.load(filename) as data:
+                return data['travel']
+
+    travel = get_road_travel(A, source, speed)
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        temporary = filename + '.{}.tmp.npz'.format(os.getpid())
+        np.savez(temporary, travel=travel)
+        os.replace(temporary, filename)
+
+    return travel
+
+
+
+
+
+def get_road_matrix(graph, weight='weight'):
+    """
+    get the sparse length matrix of a road graph, both directions of an undirected graph, the shortest of parallel roads
+    :return: OrderedDict of node to row, scipy CSR array of (node, node)
+    """
+    node = OrderedDict((n, k) for k, n in enumerate(graph.nodes))
+    edge = np.array([(node[i], node[j], w) for i, j, w in graph.edges(data=weight, default=1)], dtype=float).reshape(-1, 3)
+    if not graph.is_directed():
+        edge = np.vstack((edge, edge[:, [1, 0, 2]]))
+    key = edge[:, 0].astype(int) * len(node) + edge[:, 1].astype(int)
+    order = np.argsort(key, kind='stable')
+    key, first = np.unique(key[order], return_index=True)
+    A = sparse.csr_array((np.minimum.reduceat(edge[order, 2], first), (key // len(node), key % len(node))), shape=(len(node), len(node)))
+    return node, A
+
+
+
+
+
+def get_road_travel(A, source, speed=1):
+    """
+    get the travel time between the rows source of a road length matrix by Dijkstra shortest paths from the distinct
+    sources only, rounded to time steps
+    :return: integer array of (source, source)
+    """
+    unique, inverse = np.unique(source, return_inverse=True)
+    distance = csgraph.dijkstra(A, directed=True, indices=unique)[:, unique][np.ix_(inverse, inverse)]
+    if not np.all(np.isfinite(distance)):
+        raise ValueError('some sites cannot be reached on the road graph')
+    return np.rint(distance / speed).astype(int)
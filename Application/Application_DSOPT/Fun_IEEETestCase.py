@@ -631,6 +631,156 @@ def case33_dict():
 
 
 
+def case_synthetic(number_bus=1000, number_tieline=10, number_dg=0, seed=0, chain=0.8, load_P=0.06,
+                   line_capacity=5, dg_share=0.3, base_kv=12.66):
+    """
+    Random radial feeder in the format of case33_noDG_tieline
+    The tree is grown by attaching each new bus to the previous bus with probability chain (a feeder section) or to a
+    uniformly chosen earlier bus (a lateral), which gives a few long feeders with laterals and a depth of about
+    log(number_bus) / (1 - chain) sections. Each section has a random direction, a log-normal length in km and one of
+    a few overhead conductors, from which the per-unit R and X follow. Loads are log-normal with a random power factor.
+    Tie lines connect leaf buses to their nearest leaf buses; DG buses are generator buses (code 1) with a share of the
+    total load split among them. All quantities are drawn as arrays, so a 10k-bus feeder takes about 0.15 s including
+    the pre-processing functions.
+    :param number_bus: number of buses, bus_1 is the substation
+    :param number_tieline: number of normally open tie lines, numbered after the tree lines
+    :param number_dg: number of buses with distributed generation
+    :param seed: seed of the random generator
+    :param chain: probability that a bus continues the section of the previous bus
+    :param load_P: median active load of a bus in MW
+    :param line_capacity: smallest P and Q capacity of a line, lines are sized to 1.5 times their downstream load
+    :param dg_share: total DG capacity as a share of the total load
+    :param base_kv: base voltage in kV of the per-unit impedance on the 1 MVA base
+    :return: ppc dictionary with the additional key 'bus_location' of the (x, y) location of the buses in km
+    """
+    from scipy.spatial import cKDTree
+
+    rng = np.random.default_rng(seed)
+    ppc = {}
+    ppc["basemva"] = 1
+
+    ## radial tree: parent row of each bus, -1 for the substation
+    child = np.arange(1, number_bus)
+    lateral = rng.random(number_bus - 1) >= chain
+    parent = np.append(-1, np.where(lateral, rng.integers(0, child), child - 1))
+
+    ## location by summing the section offsets along the path from the substation
+    length = np.clip(rng.lognormal(np.log(0.8), 0.5, number_bus - 1), 0.05, 5)
+    angle = rng.uniform(0, 2 * np.pi, number_bus - 1)
+    offset = np.vstack((np.zeros((1, 2)), length[:, None] * np.stack((np.cos(angle), np.sin(angle)), axis=1)))
+    location = get_path_sum(parent, offset)
+
+    ## line impedance from (R, X) in ohm/km of a few overhead conductors
+    conductor = np.array([[0.306, 0.372], [0.512, 0.389], [0.821, 0.404], [1.380, 0.419]])
+    z_base = base_kv ** 2 / ppc["basemva"]
+    line_type = rng.choice(conductor.shape[0], number_bus - 1, p=[0.2, 0.3, 0.3, 0.2])
+    R = conductor[line_type, 0] * length / z_base
+    X = conductor[line_type, 1] * length / z_base
+
+    ## loads
+    P = np.clip(rng.lognormal(np.log(load_P), 0.6, number_bus), load_P / 10, load_P * 8)
+    P[0] = 0
+    Q = P * np.tan(np.arccos(rng.uniform(0.85, 0.98, number_bus)))
+
+    ## line capacity from the downstream load
+    downstream = get_subtree_sum(parent, np.hypot(P, Q))
+    capacity = np.maximum(line_capacity, np.ceil(1.5 * downstream[child]))
+
+    ## tie lines between leaf buses and their nearest leaf buses
+    leaf = np.setdiff1d(child, parent)
+    tie_from, tie_to = np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    if number_tieline > 0:
+        if leaf.shape[0] < 2:
+            raise ValueError('a feeder of {} buses has no leaf buses to connect by tie lines'.format(number_bus))
+        ## candidate pairs of the leaves in random order with their nearest, second nearest, ... leaf
+        rank = min(leaf.shape[0], 2 * number_tieline // leaf.shape[0] + 3)
+        nearest = leaf[cKDTree(location[leaf]).query(location[leaf], k=rank)[1][:, 1:]]
+        order = rng.permutation(leaf.shape[0])
+        pair = np.sort(np.stack((np.repeat(leaf[order], rank - 1), nearest[order].ravel()), axis=1)
+                       .reshape(-1, rank - 1, 2).transpose(1, 0, 2).reshape(-1, 2), axis=1)
+        pair = pair[np.sort(np.unique(pair[:, 0] * number_bus + pair[:, 1], return_index=True)[1])][:number_tieline]
+        if pair.shape[0] < number_tieline:
+            raise ValueError('a feeder of {} buses has only {} tie lines between nearest leaf buses'.format(number_bus, pair.shape[0]))
+        tie_from, tie_to = pair[:, 0], pair[:, 1]
+    tie_length = np.maximum(np.hypot(*(location[tie_from] - location[tie_to]).T), 0.05)
+    tie_capacity = np.maximum(capacity[tie_from - 1], capacity[tie_to - 1])
+
+    ## DG buses with a share of the total load
+    dg = np.sort(rng.choice(child, number_dg, replace=False))
+    dg_P = dg_share * P.sum() * rng.dirichlet(np.ones(number_dg)) if number_dg > 0 else np.zeros(0)
+    code = np.zeros(number_bus)
+    code[0] = 1
+    code[dg] = 1
+
+# %        No  code Mag.    Degree   MW       Mvar      MW  Mvar     Qmin Qmax       Mvar
+    ppc["bus"] = np.zeros((number_bus, 11))
+    ppc["bus"][:, 0] = np.arange(1, number_bus + 1)
+    ppc["bus"][:, 1] = code
+    ppc["bus"][:, 2] = 1
+    ppc["bus"][:, 4] = P
+    ppc["bus"][:, 5] = Q
+
+#         No  from-bus  to-bus  R  X  Pmax  Qmax
+    number_line = number_bus - 1 + tie_from.shape[0]
+    ppc["line"] = np.zeros((number_line, 7))
+    ppc["line"][:, 0] = np.arange(1, number_line + 1)
+    ppc["line"][:, 1] = np.concatenate((parent[child], tie_from)) + 1
+    ppc["line"][:, 2] = np.concatenate((child, tie_to)) + 1
+    ppc["line"][:, 3] = np.concatenate((R, conductor[0, 0] * tie_length / z_base))
+    ppc["line"][:, 4] = np.concatenate((X, conductor[0, 1] * tie_length / z_base))
+    ppc["line"][:, 5] = np.concatenate((capacity, tie_capacity))
+    ppc["line"][:, 6] = ppc["line"][:, 5]
+
+    ppc['tieline'] = ['line_{}'.format(i) for i in range(number_bus, number_line + 1)]
+
+    ppc["gen"] = np.vstack(([[1, 1, 0, 100, -100, 100]],
+                            np.stack((np.arange(2, number_dg + 2), dg + 1, np.zeros(number_dg), dg_P, np.zeros(number_dg), 0.5 * dg_P), axis=1)))
+
+    ppc['bus_location'] = location
+
+    # call data pre-processing functions
+    ppc = get_iterator(ppc)
+    ppc = get_bus_line_gen(ppc)
+    ppc = get_total_load(ppc)
+
+    return ppc
+
+
+
+def get_path_sum(parent, value):
+    """
+    sum the value of the buses on the path from the root to each bus of a tree by pointer jumping,
+    which takes log(depth) vectorized steps
+    :param parent: array of the parent row of each bus, -1 for the root
+    :param value: array of the value of each bus, the first axis is the bus
+    """
+    total = np.array(value, dtype=float)
+    jump = np.array(parent, dtype=int)
+    active = np.flatnonzero(jump >= 0)
+    while active.shape[0] > 0:
+        total[active] = total[active] + total[jump[active]]
+        jump[active] = jump[jump[active]]
+        active = active[jump[active] >= 0]
+    return total
+
+
+
+def get_subtree_sum(parent, value):
+    """
+    sum the value of each bus and all the buses below it in a tree, one vectorized step for each depth
+    :param parent: array of the parent row of each bus, -1 for the root
+    :param value: array of the value of each bus
+    """
+    depth = get_path_sum(parent, (parent >= 0).astype(float)).astype(int)
+    total = np.array(value, dtype=float)
+    for d in range(depth.max(), 0, -1):
+        bus = np.flatnonzero(depth == d)
+        total += np.bincount(parent[bus], weights=total[bus], minlength=total.shape[0])
+    return total
+
+
+
+
 ##############################  Data pre-processing functions  #############################
 
 def get_bus_line_gen(ppc):
@@ -640,26 +790,24 @@ def get_bus_line_gen(ppc):
     # Assume a = 'bus_13', then int(a[a.find('_')+1:]) = 13
     ##########################
 
+    # get the bus number of each bus name
+    id = np.array([int(i[i.find('_') + 1:]) - 1 for i in ppc['iter_bus']], dtype=int)
+    bus_number = ppc['bus'][id, 0]
+
     # define a bus line relation dictionary, which the input is bus index and output is branch index
+    line_from_this_bus = get_incidence(bus_number, ppc['line'][:, 1])  # from bus at index column 1
+    line_to_this_bus = get_incidence(bus_number, ppc['line'][:, 2])  # from bus at index column 2
     bus_line = {}
-    for i in ppc['iter_bus']:
-        # get the matrix index from the component name
-        id = int(i[i.find('_') + 1:]) - 1
-
+    for k, i in enumerate(ppc['iter_bus']):
         bus_line[i] = {}
-        bus_line[i]["line_from_this_bus"] = np.where(True == (ppc['bus'][id, 0] == ppc['line'][:, 1]))[
-                                                0] + 1  # from bus at index column 1
-        bus_line[i]["line_to_this_bus"] = np.where(True == (ppc['bus'][id, 0] == ppc['line'][:, 2]))[
-                                              0] + 1  # from bus at index column 2
+        bus_line[i]["line_from_this_bus"] = line_from_this_bus[k]
+        bus_line[i]["line_to_this_bus"] = line_to_this_bus[k]
 
     # define a bus generator relation dictionary, which the input is bus index and output is generator index
+    gen_at_this_bus = get_incidence(bus_number, ppc['gen'][:, 1])
     bus_gen = {}
-    for i in ppc['iter_bus']:
-        # get the matrix index from the component name
-        id = int(i[i.find('_') + 1:]) - 1
-
-        bus_gen[i] = {}
-        bus_gen[i] = np.where(True == (ppc['bus'][id, 0] == ppc['gen'][:, 1]))[0] + 1
+    for k, i in enumerate(ppc['iter_bus']):
+        bus_gen[i] = gen_at_this_bus[k]
 
     ppc['bus_line'] = bus_line
     ppc['bus_gen'] = bus_gen
@@ -668,6 +816,21 @@ def get_bus_line_gen(ppc):
 
 
 
+def get_incidence(bus_number, column):
+    """
+    get the one-based rows of a table whose column equals each bus number, sorted by one pass over the table
+    instead of comparing the whole column with every bus
+    :param bus_number: array of bus numbers
+    :param column: bus number column of the line or generator table
+    :return: list of arrays of one-based rows in ascending order, one for each bus number
+    """
+    order = np.argsort(column, kind='stable')
+    start = np.searchsorted(column[order], bus_number, side='left')
+    end = np.searchsorted(column[order], bus_number, side='right')
+    return [order[s:e] + 1 for s, e in zip(start, end)]
+
+
+
 
 def get_iterator(ppc):
 
@@ -0,0 +1,615 @@
+import os
+import time
+import hashlib
+import multiprocessing
+import numpy as np
+from collections import OrderedDict
+
+from formulation_general import profile, Profiler
+
+
+
+class BendersEngine(object):
+    """
+    Combinatorial Benders decomposition of the outage management problem
+    The master problem decides the crew dispatch and the subproblem evaluates the served energy of its repair schedule.
+    Any OutageManage backend that implements solve_problem, get_objective, get_route, get_repair_status and
+    add_benders_cut can be the master problem, any backend that implements solve_problem, get_objective and
+    set_repair_schedule can be the subproblem.
+
+    Hooks:
+    warm_start: function called with the master problem before the first solve, e.g. to set a MIP start
+    oracle: function called with the master problem before the first solve returning a list of (route, repair_status)
+            that are evaluated and cut first, e.g. the exact crew dispatch of held_karp.oracle for small instances
+    cache: object with get(repair_status) returning (ObjVal_sp, line_status, load_status) or None and
+           put(repair_status, ObjVal_sp, line_status, load_status), e.g. SubproblemCache
+    pool: object with evaluate(list of repair_status) returning a list of (ObjVal_sp, line_status, load_status),
+          e.g. a process pool of subproblems
+    cut_pool: object with add(route, ObjVal_sp) and update() called after each master problem solve, e.g. CutPool,
+              without it the optimality cuts go to the master problem directly
+    """
+
+    def __init__(self, mp, sp, gap=1e-4, max_iter=1000, bound=True, warm_start=None, cache=None, pool=None, verbose=True,
+                 number_candidate=1, cut_pool=None, oracle=None):
+        """
+        :param mp: formulated master problem
+        :param sp: formulated subproblem
+        :param gap: relative gap between the master problem and the best evaluated schedule for termination
+        :param max_iter: maximum number of iterations
+        :param bound: screen the schedules by the graph-based restoration bounds before solving the subproblem
+        :param number_candidate: maximum number of candidate routes taken from the master problem per iteration,
+                                 one optimality cut is added for each
+        """
+        self.mp = mp
+        self.sp = sp
+        self.gap = gap
+        self.max_iter = max_iter
+        self.bound = bound
+        self.number_candidate = number_candidate
+        self.cut_pool = cut_pool
+        self.warm_start = warm_start
+        self.oracle = oracle
+        self.cache = cache
+        self.pool = pool
+        self.verbose = verbose
+
+        self.ObjVal_mp = np.inf
+        self.ObjVal_best = 0
+        self.route_best = None
+        self.history = []
+        self.count = OrderedDict([('cache', 0), ('bound', 0), ('sp', 0)])
+
+
+
+    def evaluate(self, repair_status):
+        """
+        get the served energy of a repair schedule from the cache, the graph-based bounds or the subproblem
+        :param repair_status: array of (vertex, time) in the order of ordered_vertex
+        :return: ObjVal_sp, source, ObjVal_cut, where ObjVal_cut is the upper bound of the served energy for the optimality cut
+        """
+        if self.cache is not None:
+            entry = self.cache.get(repair_status)
+            if entry is not None:
+                return entry[0], 'cache', entry[0]
+
+        bound = self.evaluate_bound(repair_status)
+        if bound is not None:
+            return bound[0], 'bound', bound[1]
+
+        entry = self.solve_subproblem(self.sp, repair_status, status=self.cache is not None)
+        if self.cache is not None:
+            self.cache.put(repair_status, *entry)
+        return entry[0], 'sp', entry[0]
+
+
+
+    def evaluate_bound(self, repair_status):
+        """
+        settle a schedule by the graph-based bounds without solving the subproblem
+        :return: (lower, upper) bound of the served energy if the bounds meet or the schedule is dominated
+                 by the best evaluated one, otherwise None
+        """
+        if not self.bound:
+            return None
+
+        upper, lower = self.sp.get_restoration_bound(repair_status)
+        ObjVal_ub = np.dot(upper, self.sp.time_weight) * self.sp.BasePower
+        ObjVal_lb = np.dot(lower, self.sp.time_weight) * self.sp.BasePower
+        ## ObjVal_best only changes in update together with its route, so a dominated schedule is compared with
+        ## the value of a route that is actually recorded
+        if ObjVal_ub - ObjVal_lb <= 1e-6 * max(ObjVal_ub, 1) or ObjVal_ub <= self.ObjVal_best:
+            # # the bounds meet or the schedule is dominated, the upper bound keeps the optimality cut valid
+            return ObjVal_lb, ObjVal_ub
+        else:
+            return None
+
+
+
+    @staticmethod
+    def solve_subproblem(sp, repair_status, status=False):
+        """
+        fix the repair schedule of the subproblem and solve it
+        :param status: also get the line and load status
+        :return: (ObjVal_sp, line_status, load_status), the status is None if not required
+        """
+        sp.set_repair_schedule(repair_status)
+        sp.solve_problem()
+        if status:
+            return (sp.get_objective(),) + tuple(sp.get_network_status())
+        else:
+            return sp.get_objective(), None, None
+
+
+
+    @profile('evaluate')
+    def evaluate_all(self, schedules):
+        """
+        evaluate a list of repair schedules, the subproblems left by the cache and the bounds go to the pool if given
+        :return: list of (ObjVal_sp, source, ObjVal_cut)
+        """
+        if self.pool is None:
+            return [self.evaluate(s) for s in schedules]
+
+        result = [None] * len(schedules)
+        ## schedules left for the subproblem, candidates with the same schedule share one solve
+        pending = OrderedDict()
+        for k, s in enumerate(schedules):
+            entry = self.cache.get(s) if self.cache is not None else None
+            if entry is not None:
+                result[k] = (entry[0], 'cache', entry[0])
+                continue
+            bound = self.evaluate_bound(s)
+            if bound is not None:
+                result[k] = (bound[0], 'bound', bound[1])
+                continue
+            pending.setdefault(np.rint(s).astype(np.int8).tobytes(), []).append(k)
+
+        group = list(pending.values())
+        entries = self.pool.evaluate([schedules[k[0]] for k in group], status=self.cache is not None)
+        for k, entry in zip(group, entries):
+            if self.cache is not None:
+                self.cache.put(schedules[k[0]], *entry)
+            for i in k:
+                result[i] = (entry[0], 'sp', entry[0])
+        return result
+
+
+
+    def get_candidates(self):
+        """
+        get the candidate routes of the solved master problem, duplicated routes are dropped
+        :return: list of (route, repair_status)
+        """
+        candidates = OrderedDict()
+        for route, repair_status in self.mp.get_candidates(self.number_candidate):
+            candidates.setdefault(route, repair_status)
+        return list(candidates.items())
+
+
+
+    def update(self, candidates, values):
+        """
+        record the evaluated candidates and keep the best one
+        """
+        for (route, repair_status), (ObjVal_sp, source, _) in zip(candidates, values):
+            self.count[source] = self.count[source] + 1
+            if ObjVal_sp > self.ObjVal_best or self.route_best is None:
+                self.ObjVal_best = ObjVal_sp
+                self.route_best = route
+                self.repair_status_best = repair_status
+
+
+
+    @profile('cut')
+    def add_cuts(self, candidates, values):
+        """
+        add the optimality cuts of the evaluated candidates to the master problem or to the cut pool
+        """
+        for (route, _), (_, _, ObjVal_cut) in zip(candidates, values):
+            if self.cut_pool is None:
+                self.mp.add_benders_cut(route, ObjVal_cut)
+            else:
+                self.cut_pool.add(route, ObjVal_cut)
+
+
+
+    def set_objective_max(self):
+        """
+        tighten the big-M of the optimality cuts by the graph-based bound with all damaged lines available from the start
+        """
+        if self.bound and self.mp.ObjVal_max is None:
+            upper, _ = self.sp.get_restoration_bound(np.ones((self.sp.number_vertex, len(self.sp.iter_time))))
+            self.mp.ObjVal_max = np.dot(upper, self.sp.time_weight) * self.sp.BasePower
+
+
+
+    @profile('evaluate')
+    def evaluate_oracle(self):
+        """
+        evaluate the candidates of the oracle before the first master problem solve
+        """
+        if self.oracle is None:
+            return
+
+        start = time.time()
+        candidates = self.oracle(self.mp)
+        if not candidates:
+            return
+        values = self.evaluate_all([s for _, s in candidates])
+        self.update(candidates, values)
+        self.add_cuts(candidates, values)
+        if self.verbose:
+            print('Oracle: SP objective {} from {}, {:.3f} s'.format([v[0] for v in values], [v[1] for v in values],
+                                                                   time.time() - start))
+
+
+
+    def get_gap(self):
+        """
+        relative gap between the master problem and the best evaluated schedule,
+        zero once the master problem cannot exceed the best schedule, e.g. after no-good cuts
+        """
+        return max(self.ObjVal_mp - self.ObjVal_best, 0) / max(abs(self.ObjVal_mp), 1e-9)
+
+
+
+    def run(self):
+        """
+        solve the master problem and the subproblems iteratively until the gap closes
+        :return: ObjVal_best, route_best
+        """
+        self.set_objective_max()
+        if self.warm_start is not None:
+            self.warm_start(self.mp)
+        self.evaluate_oracle()
+
+        for loop_count in range(1, self.max_iter + 1):
+            record = OrderedDict([('iteration', loop_count)])
+            Profiler.set_context(iteration=loop_count)
+
+            # ---------------------------------------------------
+            #       Solve master problem for repairing decision
+            # ---------------------------------------------------
+            start = time.time()
+            self.mp.solve_problem()
+            self.ObjVal_mp = self.mp.get_objective()
+            candidates = self.get_candidates()
+            if self.cut_pool is not None:
+                self.cut_pool.update()
+            record['time_MP'] = time.time() - start
+
+            # ---------------------------------------------------
+            #       Evaluate the repair schedules
+            # ---------------------------------------------------
+            start = time.time()
+            values = self.evaluate_all([s for _, s in candidates])
+            self.update(candidates, values)
+            record['time_SP'] = time.time() - start
+            record['source'] = [v[1] for v in values]
+            record['ObjVal_mp'] = self.ObjVal_mp
+            record['ObjVal_sp'] = [v[0] for v in values]
+            record['ObjVal_best'] = self.ObjVal_best
+            record['gap'] = self.get_gap()
+            self.history.append(record)
+
+            # ---------------------------------------------------
+            #       Check break condition
+            # ---------------------------------------------------
+            if record['gap'] <= self.gap:
+                self.log(record)
+                if self.verbose:
+                    print('Break in {}th loop with gap {} and objective {}'.format(loop_count, record['gap'], self.ObjVal_best))
+                    if self.cache is not None:
+                        print('Subproblem cache {}'.format(dict(self.cache.get_statistics())))
+                    if self.cut_pool is not None:
+                        print('Cut pool {}'.format(dict(self.cut_pool.get_statistics())))
+                break
+
+            # ---------------------------------------------------
+            #       Add optimality cuts to the master problem
+            # ---------------------------------------------------
+            start = time.time()
+            self.add_cuts(candidates, values)
+            record['time_cut'] = time.time() - start
+            self.log(record)
+
+        return self.ObjVal_best, self.route_best
+
+
+
+    def run_lazy(self):
+        """
+        solve the master problem once and evaluate each new incumbent in a callback, the cuts are added as lazy constraints
+        the master problem backend has to support solve_problem(callback)
+        :return: ObjVal_best, route_best
+        """
+        self.set_objective_max()
+        if self.warm_start is not None:
+            self.warm_start(self.mp)
+        self.evaluate_oracle()
+
+        def incumbent():
+            start = time.time()
+            record = OrderedDict([('iteration', len(self.history) + 1)])
+            Profiler.set_context(iteration=len(self.history) + 1)
+            self.ObjVal_mp = self.mp.get_objective()
+            candidates = self.get_candidates()
+            values = self.evaluate_all([s for _, s in candidates])
+            self.update(candidates, values)
+            self.add_cuts(candidates, values)
+            record['time_SP'] = time.time() - start
+            record['source'] = [v[1] for v in values]
+            record['ObjVal_mp'] = self.ObjVal_mp
+            record['ObjVal_sp'] = [v[0] for v in values]
+            record['ObjVal_best'] = self.ObjVal_best
+            record['gap'] = self.get_gap()
+            self.history.append(record)
+            self.log(record)
+
+        self.mp.solve_problem(callback=incumbent)
+
+        return self.ObjVal_best, self.route_best
+
+
+
+    def log(self, record):
+        """
+        print the record of an iteration
+        """
+        if not self.verbose:
+            return
+        print('Iteration {}: MP objective {}, SP objective {} from {}, best {}, gap {:.6f}'.format(
+            record['iteration'], record['ObjVal_mp'], record['ObjVal_sp'], record['source'], record['ObjVal_best'], record['gap']))
+        print('    ' + ', '.join('{} {:.3f} s'.format(k, v) for k, v in record.items() if k.startswith('time_')))
+
+
+
+
+class CutPool(object):
+    """
+    Pool of the combinatorial Benders cuts of the master problem
+    Each route gets at most one cut, keyed by its sorted arcs: a repeated route with a lower value tightens its cut,
+    otherwise it is dropped as a duplicate.
+    Cuts that stay slack at the master problem solution for max_slack_round solves in a row are removed;
+    a retired route that comes back is cut again and never retired a second time, so the iteration cannot cycle.
+    """
+
+    def __init__(self, mp, mode='optimality', max_slack_round=50, tolerance=1e-6):
+        """
+        :param mp: master problem that implements add_benders_cut, remove_benders_cut and get_cut_slack
+        :param mode: 'optimality' caps the served energy of the route, 'nogood' rules out the route
+        :param max_slack_round: number of solves in a row with a slack cut before the cut is removed, None to keep all cuts
+        :param tolerance: slack below which a cut counts as binding
+        """
+        self.mp = mp
+        self.mode = mode
+        self.max_slack_round = max_slack_round
+        self.tolerance = tolerance
+        self.active = OrderedDict()
+        self.retired = OrderedDict()
+        self.count = OrderedDict([('added', 0), ('tightened', 0), ('duplicate', 0), ('retired', 0)])
+
+
+
+    @staticmethod
+    def get_key(route):
+        return tuple(sorted((int(k), i, j) for k, i, j in route))
+
+
+
+    def add(self, route, ObjVal_sp):
+        """
+        add the cut of an evaluated route unless the pool holds a cut at least as tight
+        """
+        key = self.get_key(route)
+        value = ObjVal_sp if self.mode == 'optimality' else None
+
+        if key in self.active:
+            cut = self.active[key]
+            if value is None or value >= cut['value'] - self.tolerance:
+                self.count['duplicate'] = self.count['duplicate'] + 1
+                return
+            if cut['handle'] is not None:
+                self.mp.remove_benders_cut(cut['handle'])
+            self.count['tightened'] = self.count['tightened'] + 1
+            sticky = cut['sticky']
+        else:
+            sticky = key in self.retired
+            self.retired.pop(key, None)
+            self.count['added'] = self.count['added'] + 1
+
+        self.active[key] = {'handle': self.mp.add_benders_cut(route, value), 'value': value, 'slack_round': 0, 'sticky': sticky}
+
+
+
+    @profile('cut')
+    def update(self):
+        """
+        count the solves in which each cut is slack and remove the cuts slack for too long
+        """
+        if self.max_slack_round is None:
+            return
+
+        for key in list(self.active.keys()):
+            cut = self.active[key]
+            if cut['handle'] is None or cut['sticky']:
+                continue
+            if self.mp.get_cut_slack(cut['handle']) > self.tolerance:
+                cut['slack_round'] = cut['slack_round'] + 1
+            else:
+                cut['slack_round'] = 0
+            if cut['slack_round'] >= self.max_slack_round:
+                self.mp.remove_benders_cut(cut['handle'])
+                self.retired[key] = cut['value']
+                del self.active[key]
+                self.count['retired'] = self.count['retired'] + 1
+
+
+
+    def get_statistics(self):
+        statistics = OrderedDict(self.count)
+        statistics['active'] = len(self.active)
+        return statistics
+
+
+
+
+class SubproblemCache(object):
+    """
+    Cache of subproblem results keyed by the repair schedule
+    Different crew routes often give the same availability of the damaged lines, so the subproblem is solved once per schedule.
+    The key is a hash of the damaged-line rows of the repair status, rounded to binary.
+    Results are kept in memory with least-recently-used eviction and optionally stored on disk as .npz files,
+    so that the disk tier can be shared between runs of the same study.
+    """
+
+    def __init__(self, index, max_size=1024, directory=None):
+        """
+        :param index: NetworkIndex of the subproblem
+        :param max_size: maximum number of results in memory
+        :param directory: directory of the disk tier, None for memory only
+        """
+        self.index = index
+        self.max_size = max_size
+        self.directory = directory
+        self.memory = OrderedDict()
+        self.count = OrderedDict([('hit', 0), ('hit_disk', 0), ('miss', 0)])
+
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+
+
+    def get_key(self, repair_status):
+        """
+        get the canonical hash of the damaged-line availability matrix
+        :param repair_status: array of (vertex, time) or dictionary of vertex name to a list over time
+        """
+        if isinstance(repair_status, dict):
+            repair_status = [repair_status[v] for v in self.index.vertex_row]
+        available = np.asarray(repair_status, dtype=float)[self.index.damaged_vertex] > 0.5
+        key = hashlib.sha1(np.asarray(available.shape, dtype=np.int64).tobytes())
+        key.update(np.packbits(available).tobytes())
+        return key.hexdigest()
+
+
+
+    def get(self, repair_status):
+        """
+        :return: (ObjVal_sp, line_status, load_status) or None
+        """
+        key = self.get_key(repair_status)
+
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.count['hit'] = self.count['hit'] + 1
+            return self.memory[key]
+
+        if self.directory is not None:
+            filename = os.path.join(self.directory, key + '.npz')
+            if os.path.isfile(filename):
+                with np.load(filename) as data:
+                    entry = (float(data['objective']), data['line_status'], data['load_status'])
+                self.store(key, entry)
+                self.count['hit_disk'] = self.count['hit_disk'] + 1
+                return entry
+
+        self.count['miss'] = self.count['miss'] + 1
+        return None
+
+
+
+    def put(self, repair_status, ObjVal_sp, line_status=None, load_status=None):
+        """
+        store the result of a subproblem, the line and load status are kept as binary arrays
+        """
+        key = self.get_key(repair_status)
+        entry = (float(ObjVal_sp),
+                 None if line_status is None else np.rint(line_status).astype(np.int8),
+                 None if load_status is None else np.rint(load_status).astype(np.int8))
+        self.store(key, entry)
+
+        if self.directory is not None and line_status is not None and load_status is not None:
+            ## write to a temporary file first so that a concurrent reader never sees a partial file
+            filename = os.path.join(self.directory, key + '.npz')
+            temporary = os.path.join(self.directory, '{}.{}.tmp.npz'.format(key, os.getpid()))
+            np.savez_compressed(temporary, objective=entry[0], line_status=entry[1], load_status=entry[2])
+            os.replace(temporary, filename)
+
+
+
+    def store(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+
+
+    def get_statistics(self):
+        """
+        :return: hit and miss counters with the hit rate
+        """
+        statistics = OrderedDict(self.count)
+        total = sum(self.count.values())
+        statistics['hit_rate'] = (self.count['hit'] + self.count['hit_disk']) / total if total > 0 else 0.0
+        statistics['size'] = len(self.memory)
+        return statistics
+
+
+
+
+## subproblem of a pool worker process
+_worker = {}
+
+
+
+def _initialize_worker(builder):
+    _worker['sp'] = builder()
+
+
+
+def _evaluate_worker(args):
+    repair_status, status = args
+    return BendersEngine.solve_subproblem(_worker['sp'], repair_status, status)
+
+
+
+class SubproblemPool(object):
+    """
+    Process pool that evaluates repair schedules in parallel
+    Each worker builds its own subproblem once with the builder and only changes the repair schedule afterwards.
+    The builder has to be picklable, i.e., a function defined at module level or a functools.partial of one,
+    and scripts using the pool need the if __name__ == "__main__" guard on platforms that spawn processes.
+    """
+
+    def __init__(self, builder, processes=None):
+        """
+        :param builder: function without arguments that returns a formulated subproblem
+        :param processes: number of worker processes, the number of CPUs by default
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        self.pool = multiprocessing.Pool(self.processes, initializer=_initialize_worker, initargs=(builder,))
+
+
+
+    def evaluate(self, schedules, status=False):
+        """
+        :param schedules: list of repair status arrays of (vertex, time)
+        :param status: also get the line and load status
+        :return: list of (ObjVal_sp, line_status, load_status)
+        """
+        if len(schedules) == 0:
+            return []
+        return self.pool.map(_evaluate_worker, [(np.asarray(s), status) for s in schedules], chunksize=1)
+
+
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, *args):
+        self.pool.terminate()
+        self.pool.join()
+
+
+
+def build_subproblem(cls, ppc, vrp, time_bucket=None):
+    """
+    build a subproblem, e.g. functools.partial(build_subproblem, OutageManageHighs, ppc, vrp, time_bucket) as the builder
+    of a pool
+    :param cls: OutageManage backend class
+    :param time_bucket: time buckets of the master problem, see data_preparation, None for unit time steps
+    """
+    sp = cls()
+    sp.data_preparation(ppc, vrp, time_bucket)
+    sp.form_sp()
+    return sp
@@ -0,0 +1,268 @@
+import time
+import functools
+import numpy as np
+from collections import OrderedDict
+
+
+
+class CrewRouting(object):
+    """
+    Construction and local search heuristic of the crew dispatch
+    The crews start from the depot at time 0 and the cost of the routes is the restoration-weighted completion time,
+    sum of weight[m] * finish time of the repair of m over the damaged vertices. The finish time of a vertex is the
+    finish time of its predecessor plus total_time[c, predecessor, vertex], i.e. travel plus repair time as in
+    ordered_total_time of data_preparation.
+    The routes are built by a weighted nearest-neighbour rule and improved by 2-opt and Or-opt moves within a route and
+    relocations between routes; all moves of a route are evaluated at once on the time matrix.
+    """
+
+    def __init__(self, total_time, damaged, origin=0, end=None, weight=None, max_round=100):
+        """
+        :param total_time: array of (crew, vertex, vertex) of travel plus repair time of the destination
+        :param damaged: rows of the damaged vertices
+        :param origin: row of the depot the crews start from
+        :param end: row of the depot the crews return to, None for open routes
+        :param weight: restoration weight of the vertices, ones if None
+        :param max_round: maximum number of improving rounds of the local search
+        """
+        self.total_time = np.asarray(total_time, dtype=float)
+        self.damaged = np.asarray(damaged, dtype=int)
+        self.origin = origin
+        self.end = end
+        self.weight = np.ones(self.total_time.shape[1]) if weight is None else np.asarray(weight, dtype=float)
+        self.max_round = max_round
+        self.number_crew = self.total_time.shape[0]
+
+
+
+    @classmethod
+    def from_model(cls, om, weight=None, **kwargs):
+        """
+        set up the heuristic from the data of an OutageManage object after data_preparation
+        :param weight: restoration weight of the vertices in the order of ordered_vertex, get_vertex_weight if None
+        """
+        repair = np.array([[om.vrp['repair'][c][m] for m in om.ordered_vertex] for c in om.iter_crew], dtype=float)
+        total_time = om.ordered_travel_time[None, :, :] + repair[:, None, :]
+        if weight is None:
+            weight = get_vertex_weight(om)
+
+        heuristic = cls(total_time, om.index.damaged_vertex, om.index.vertex_row['0'], om.index.vertex_row['d'], weight, **kwargs)
+        heuristic.om = om
+        return heuristic
+
+
+
+    def get_cost(self, c, sequence):
+        """
+        get the cost of a batch of sequences of crew c
+        :param sequence: array of (batch, vertex) of the damaged vertices in the order of the visits
+        :return: array of the costs
+        """
+        if sequence.shape[1] == 0:
+            return np.zeros(sequence.shape[0])
+        previous = np.hstack((np.full((sequence.shape[0], 1), self.origin), sequence[:, :-1]))
+        finish = np.cumsum(self.total_time[c][previous, sequence], axis=1)
+        return (self.weight[sequence] * finish).sum(axis=1)
+
+
+
+    def construct(self):
+        """
+        weighted nearest neighbour: the crew and vertex with the smallest finish time over weight go next
+        """
+        position = np.full(self.number_crew, self.origin)
+        ready = np.zeros(self.number_crew)
+        remaining = list(self.damaged)
+        self.sequence = [[] for c in range(self.number_crew)]
+
+        while remaining:
+            finish = ready[:, None] + self.total_time[np.arange(self.number_crew)[:, None], position[:, None], np.array(remaining)[None, :]]
+            c, k = np.unravel_index(np.argmin(finish / np.maximum(self.weight[remaining], 1e-9)[None, :]), finish.shape)
+            self.sequence[c].append(remaining[k])
+            position[c] = remaining[k]
+            ready[c] = finish[c, k]
+            del remaining[k]
+
+        return self.sequence
+
+
+
+    def improve_route(self, c):
+        """
+        apply the best 2-opt or Or-opt move of the route of crew c until no move improves it
+        :return: True if the route is improved
+        """
+        sequence = np.array(self.sequence[c], dtype=int)
+        if len(sequence) < 2:
+            return False
+
+        moves = get_moves(len(sequence))
+        cost = self.get_cost(c, sequence[None, :])[0]
+        improved = False
+        for loop_count in range(self.max_round):
+            candidate = sequence[moves]
+            candidate_cost = self.get_cost(c, candidate)
+            k = np.argmin(candidate_cost)
+            if candidate_cost[k] >= cost - 1e-9:
+                break
+            sequence, cost, improved = candidate[k], candidate_cost[k], True
+
+        self.sequence[c] = list(sequence)
+        return improved
+
+
+
+    def relocate(self):
+        """
+        apply the best relocation of a vertex from one route to any position of another route
+        :return: True if a vertex is relocated
+        """
+        cost = np.array([self.get_cost(c, np.array(self.sequence[c], dtype=int)[None, :])[0] for c in range(self.number_crew)])
+        best = (-1e-9, None)
+        for a in range(self.number_crew):
+            sequence_a = np.array(self.sequence[a], dtype=int)
+            n_a = len(sequence_a)
+            if n_a == 0:
+                continue
+            ## remove each vertex of route a
+            keep = np.array([np.delete(np.arange(n_a), i) for i in range(n_a)], dtype=int).reshape(n_a, n_a - 1)
+            gain_a = self.get_cost(a, sequence_a[keep]) - cost[a]
+
+            for b in range(self.number_crew):
+                if b == a:
+                    continue
+                ## insert each removed vertex at each position of route b
+                sequence_b = np.array(self.sequence[b], dtype=int)
+                n_b = len(sequence_b)
+                candidate = np.array([np.insert(sequence_b, k, v) for v in sequence_a for k in range(n_b + 1)], dtype=int)
+                gain = self.get_cost(b, candidate).reshape(n_a, n_b + 1) - cost[b] + gain_a[:, None]
+                i, k = np.unravel_index(np.argmin(gain), gain.shape)
+                if gain[i, k] < best[0]:
+                    best = (gain[i, k], (a, b, i, k))
+
+        if best[1] is None:
+            return False
+        a, b, i, k = best[1]
+        self.sequence[b].insert(k, self.sequence[a].pop(i))
+        return True
+
+
+
+    def solve(self):
+        """
+        construct the routes and improve them by local search
+        :return: routes as a list of vertex rows for each crew from the origin to the end
+        """
+        start = time.time()
+        self.construct()
+        for loop_count in range(self.max_round):
+            for c in range(self.number_crew):
+                self.improve_route(c)
+            if self.number_crew == 1 or not self.relocate():
+                break
+        self.time = time.time() - start
+        self.ObjVal = self.get_objective()
+        return self.get_path()
+
+
+
+    def get_objective(self):
+        """
+        get the restoration-weighted completion time of the routes
+        """
+        return sum(self.get_cost(c, np.array(self.sequence[c], dtype=int)[None, :])[0] for c in range(self.number_crew))
+
+
+
+    def get_path(self):
+        """
+        get the routes as lists of vertex rows from the origin to the end
+        """
+        end = [] if self.end is None else [self.end]
+        return [[self.origin] + [int(m) for m in s] + end for s in self.sequence]
+
+
+
+    def get_finish_time(self):
+        """
+        get the finish time of the vertices on the routes
+        :return: array of (crew, vertex), zero for the vertices a crew does not visit
+        """
+        finish = np.zeros(self.total_time.shape[:2])
+        for c, path in enumerate(self.get_path()):
+            finish[c, path[1:]] = np.cumsum(self.total_time[c][path[:-1], path[1:]])
+        return finish
+
+
+
+    def get_start(self):
+        """
+        get the routes in the form of the start solution of the OutageManage backends, see set_start
+        :return: route as a tuple of (crew, vertex, vertex) arcs, arrival as an OrderedDict of (crew, vertex): arrival time
+        """
+        om = self.om
+        repair = self.total_time - om.ordered_travel_time[None, :, :]
+        finish = self.get_finish_time()
+        route = []
+        arrival = OrderedDict(((c, m), 0.0) for c in om.iter_crew for m in om.ordered_vertex)
+        for c, path in zip(om.iter_crew, self.get_path()):
+            k = list(om.iter_crew).index(c)
+            route.extend((c, om.ordered_vertex[i], om.ordered_vertex[j]) for i, j in zip(path[:-1], path[1:]))
+            for j in path[1:]:
+                arrival[c, om.ordered_vertex[j]] = finish[k, j] - repair[k, 0, j]
+        return tuple(route), arrival
+
+
+
+
+@functools.lru_cache(maxsize=None)
+def get_moves(n, max_segment=3):
+    """
+    get the position permutations of the 2-opt moves (reverse a segment) and the Or-opt moves
+    (move a segment of at most max_segment vertices to another position) of a sequence of n vertices
+    :return: array of (move, n)
+    """
+    position = np.arange(n)
+    moves = []
+
+    ## 2-opt
+    i, j = np.triu_indices(n, 1)
+    moves.append(np.where((position >= i[:, None]) & (position <= j[:, None]), i[:, None] + j[:, None] - position, position))
+
+    ## Or-opt
+    for length in range(1, min(max_segment, n - 1) + 1):
+        for i in range(n - length + 1):
+            rest = np.concatenate((position[:i], position[i + length:]))
+            for k in range(len(rest) + 1):
+                if k != i:
+                    moves.append(np.concatenate((rest[:k], position[i:i + length], rest[k:]))[None, :])
+
+    return np.vstack(moves)
+
+
+
+def get_vertex_weight(om):
+    """
+    get the restoration weight of the vertices from the graph-based upper bound: the load that can be picked up
+    by repairing the vertex alone, plus a small weight so that vertices without load of their own keep an order
+    """
+    status = np.zeros((om.number_vertex, 1))
+    base = om.get_restoration_bound(status)[0][0]
+    weight = np.zeros(om.number_vertex)
+    for m in om.index.damaged_vertex:
+        status[m] = 1
+        weight[m] = om.get_restoration_bound(status)[0][0] - base
+        status[m] = 0
+    return weight + 1e-3 * max(weight.max(), 1)
+
+
+
+def warm_start(om, **kwargs):
+    """
+    set the heuristic routes as the start solution of an OutageManage backend, e.g. as the warm_start hook of BendersEngine
+    :return: the solved heuristic
+    """
+    heuristic = CrewRouting.from_model(om, **kwargs)
+    heuristic.solve()
+    om.set_start(*heuristic.get_start())
+    return heuristic
@@ -1,20 +1,224 @@
 import sys
 import os
 import time
-import pandas as pd
+import types
+import importlib
 import numpy as np
 import math
-import sympy as sy
-import matplotlib
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-import os
-import ast
-import networkx as nx
+import json
+import functools
+import contextlib
 import operator
-from collections import OrderedDict
+import scipy.sparse as sparse
+import scipy.sparse.csgraph as csgraph
+from collections import OrderedDict, namedtuple
 # import gurobipy as gb
-import pyomo.environ as pm
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+
+class LazyModule(types.ModuleType):
+    """
+    Module that is imported on the first access to one of its attributes
+    The plotting and modelling packages take about a second to import, so they are only loaded by the processes that
+    use them, e.g. matplotlib on the first plot call, and a headless solver worker starts without them.
+    """
+
+    def __getattr__(self, name):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, name)
+
+
+
+plt = LazyModule('matplotlib.pyplot')
+
+
+
+class Profiler(object):
+    """
+    Spans of the phases of the outage management pipeline: data preparation, the form_* blocks, the solver calls,
+    the solution extraction and the cut generation
+    Each span is a record of its name, phase, duration, self time (without the nested spans), the model size
+    (variables, constraints, nonzeros) after it and added by it, the peak memory of the process and the context,
+    e.g. the Benders iteration. The records go to the sinks, objects with write(record), e.g. ListSink and JsonlSink.
+    Profiling is off until enable is called; the methods decorated by profile then only check Profiler.sinks.
+    """
+    sinks = ()
+    stack = []
+    context = OrderedDict()
+
+    @classmethod
+    def enable(cls, *sinks):
+        """
+        send the records of all spans to the sinks
+        """
+        cls.sinks = sinks
+        cls.stack = []
+        cls.context = OrderedDict()
+
+
+
+    @classmethod
+    def disable(cls):
+        cls.sinks = ()
+
+
+
+    @classmethod
+    def set_context(cls, **context):
+        """
+        set fields added to all following records, e.g. set_context(iteration=3)
+        """
+        if cls.sinks:
+            cls.context.update(context)
+
+
+
+    @classmethod
+    def span(cls, name, phase, model=None, **attributes):
+        """
+        context manager of a span, does nothing if profiling is off
+        :param model: object with get_model_size(), e.g. an OutageManage backend, for the model size
+        :param attributes: fields added to the record
+        """
+        if not cls.sinks:
+            return contextlib.nullcontext()
+        return cls.record(name, phase, model, attributes)
+
+
+
+    @classmethod
+    @contextlib.contextmanager
+    def record(cls, name, phase, model, attributes):
+        size_start = get_model_size(model)
+        frame = {'child_time': 0.0}
+        cls.stack.append(frame)
+        wall = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            cls.stack.pop()
+            if cls.stack:
+                cls.stack[-1]['child_time'] += duration
+            size = get_model_size(model)
+
+            record = OrderedDict([('name', name), ('phase', phase), ('depth', len(cls.stack)), ('start', wall),
+                                  ('time', duration), ('self_time', duration - frame['child_time'])])
+            for k, key in enumerate(['variables', 'constraints', 'nonzeros']):
+                record[key] = size[k]
+                ## a model created inside the span has no size at its start
+                if size[k] is None:
+                    record['added_' + key] = None
+                else:
+                    record['added_' + key] = size[k] - (size_start[k] or 0)
+            record['peak_rss_mb'] = get_peak_rss()
+            record['error'] = error
+            record.update(cls.context)
+            record.update(attributes)
+            for sink in cls.sinks:
+                sink.write(record)
+
+
+
+def profile(phase):
+    """
+    decorator of the methods profiled as a span named class.method, with the model size of the object
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not Profiler.sinks:
+                return method(self, *args, **kwargs)
+            with Profiler.record('{}.{}'.format(type(self).__name__, method.__name__), phase, self, {}):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+
+def get_model_size(model):
+    """
+    get (variables, constraints, nonzeros) of an object with get_model_size, None for the sizes it does not know
+    """
+    try:
+        return model.get_model_size()
+    except (AttributeError, NotImplementedError):
+        return (None, None, None)
+
+
+
+def get_peak_rss():
+    """
+    get the peak resident memory of the process in MB, None if not available
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024.0 ** 2 if sys.platform == 'darwin' else peak / 1024.0
+
+
+
+class ListSink(object):
+    """
+    keep the profiling records in a list
+    """
+
+    def __init__(self):
+        self.records = []
+
+
+
+    def write(self, record):
+        self.records.append(record)
+
+
+
+    def get_summary(self):
+        """
+        get the count, total time and self time of the spans by name, the largest self time first
+        :return: OrderedDict of name to OrderedDict
+        """
+        summary = OrderedDict()
+        for record in self.records:
+            item = summary.setdefault(record['name'], OrderedDict([('phase', record['phase']), ('count', 0), ('time', 0.0),
+                                                                    ('self_time', 0.0), ('added_nonzeros', None)]))
+            item['count'] += 1
+            item['time'] += record['time']
+            item['self_time'] += record['self_time']
+            if record['added_nonzeros'] is not None:
+                item['added_nonzeros'] = (item['added_nonzeros'] or 0) + record['added_nonzeros']
+        return OrderedDict(sorted(summary.items(), key=lambda item: -item[1]['self_time']))
+
+
+
+class JsonlSink(object):
+    """
+    append the profiling records to a file as one JSON object per line
+    """
+
+    def __init__(self, filename, mode='a'):
+        self.file = open(filename, mode)
+
+
+
+    def write(self, record):
+        self.file.write(json.dumps(record, default=str) + '\n')
+        self.file.flush()
+
+
+
+    def close(self):
+        self.file.close()
 
 
 
@@ -33,16 +237,32 @@ class OutageManage:
     Voltage_Substation = 1.05
     epsilon = 0.1
     BasePower = 1000
+    Repair_Encoding = 'onehot'  # repair timing constraints (40-44): 'onehot' or 'cumulative'
+    ObjVal_max = None  # upper bound of the served energy for the optimality cut, see get_objective_max
 
     ## prepare optimization data
-    def data_preparation(self,ppc,vrp):
+    @profile('prepare')
+    def data_preparation(self,ppc,vrp,time_bucket=None):
         """
         read data of distribution network and vehicle routing problem
         Data is in the format of dictionary
+        :param time_bucket: widths of the time buckets in time steps, e.g. from get_time_bucket, None for unit time steps
         """
         self.ppc = ppc
         self.vrp = vrp
 
+        ## time grid: time index t stands for the time steps (time_point[t - 1], time_point[t]],
+        ## the energy of time index t is weighted by time_weight[t] in the objective
+        if time_bucket is None:
+            self.time_weight = np.ones(len(self.iter_time), dtype=int)
+        else:
+            self.time_weight = np.asarray(time_bucket, dtype=int)
+            if self.time_weight.ndim != 1 or np.any(self.time_weight < 1):
+                raise ValueError('time buckets must be a list of positive integer widths')
+            self.Total_Time = self.time_weight.shape[0]
+            self.iter_time = np.arange(0, self.Total_Time)
+        self.time_point = np.cumsum(self.time_weight) - 1
+
         ## get distribution network data
         self.number_bus = ppc['number_bus']
         self.number_line = ppc['number_line']
@@ -71,18 +291,12 @@ class OutageManage:
         self.line_static = set(self.iter_line) - set(ppc['tieline']) - self.line_damaged
 
 
-        ## Store travel time with the given order in a matrix for Z3
-        ordered_travel_time = np.zeros((self.number_vertex, self.number_vertex))
-        index_i = 0
-        for i in self.ordered_vertex:
-            index_j = 0
-            for j in self.ordered_vertex:
-                if i == j:
-                    ordered_travel_time[index_i, index_j] = 0
-                else:
-                    ordered_travel_time[index_i,index_j] = vrp['travel'][i][j]
-                index_j = index_j + 1
-            index_i = index_i + 1
+        ## Store travel time with the given order in a matrix for Z3, travel time kept as an array (TravelMatrix) is reordered
+        if hasattr(vrp['travel'], 'get_matrix'):
+            ordered_travel_time = vrp['travel'].get_matrix(self.ordered_vertex).astype(float)
+        else:
+            ordered_travel_time = np.array([[vrp['travel'][i][j] for j in self.ordered_vertex] for i in self.ordered_vertex], dtype=float)
+        np.fill_diagonal(ordered_travel_time, 0)
 
         ## store repair time with the given order in a array
         ordered_repair_time = np.zeros((self.number_vertex, 1))
@@ -92,30 +306,1169 @@ class OutageManage:
             index_i = index_i + 1
 
         ## get the total time by add the travel and repair time together
-        ordered_total_time = np.zeros((self.number_vertex,self.number_vertex))
-        for i in range(self.number_vertex):
-            for j in range(self.number_vertex):
-                ordered_total_time[i,j] = ordered_travel_time[i,j] + ordered_repair_time[j]
+        ordered_total_time = ordered_travel_time + ordered_repair_time.T
 
-        ## store ordered travel time
+        ## store ordered travel, repair and total time
+        self.ordered_travel_time = ordered_travel_time
+        self.ordered_repair_time = ordered_repair_time
         self.ordered_total_time = ordered_total_time
 
 
+        ## Get integer index of all components so that formulations do not parse names
+        self.index = NetworkIndex.build(ppc, vrp, self.line_damaged, self.line_switch)
+
+        ## orientation of a closed line in the spanning tree (see NetworkIndex.bus_arc_in)
+        self.iter_orientation = [0, 1]
+
         ## Get bus and line relation index using index not string as name
         bus_line_index = OrderedDict()
         for i in range(self.number_bus):
-            bus_name = 'bus_{}'.format(i+1)
-            bus_line_index[i] = []
-
-            # get line index where power flow variables flowing out from this bus
-            for j in self.bus_line[bus_name]["line_from_this_bus"]:
-                bus_line_index[i].append(j-1)
-            # get line index where power flow variables flowing into this bus
-            for j in self.bus_line[bus_name]["line_to_this_bus"]:
-                bus_line_index[i].append(j-1)
+            bus_line_index[i] = list(self.index.bus_line[i])
 
         self.bus_line_index = bus_line_index
 
+        ## Get sparse matrix form of the network
+        self.network = NetworkMatrix(ppc, self.index)
+
+
+
+    ## export the model for external solvers
+    def write_model(self, filename, name_map=True):
+        """
+        stream the model to an MPS or CPLEX-LP file depending on the file extension (.mps or .lp)
+        The file uses compact names C<column> and R<row>, the name map is written to <filename>.json
+        Only models assembled in sparse form (OutageManageHighs) are streamed from the coefficient arrays
+        :param filename: output file name
+        :param name_map: write the map from compact names to variable families and constraint blocks
+        """
+        if not isinstance(self.model, SparseModel):
+            raise TypeError('write_model streams models assembled in sparse form, use OutageManageHighs')
+
+        if filename.lower().endswith('.lp'):
+            self.model.write_lp(filename)
+        else:
+            self.model.write_mps(filename)
+
+        if name_map:
+            self.model.write_name_map(filename + '.json')
+
+
+
+    def load_solution(self, values):
+        """
+        load a solution of an exported model given as a mapping of compact column names to values
+        """
+        self.solution = self.model.read_solution(values)
+        return self.solution
+
+
+
+    def get_time_bucket_loss(self):
+        """
+        bound of the served energy given up by the time buckets compared with unit time steps over the same horizon
+        A line repaired inside a bucket only becomes available in the next bucket, so a bucket solution holds the load
+        served at the first step of each bucket. As the served load never decreases, the loss is at most
+        (largest width - 1) times the served load at the end, which is bounded by the graph bound with all lines available.
+        """
+        upper, _ = self.get_restoration_bound(np.ones((self.number_vertex, len(self.iter_time))))
+        return (self.time_weight.max() - 1) * upper.max() * self.BasePower
+
+
+
+    def get_restoration_bound(self, repair_status):
+        """
+        get graph-based upper and lower bounds of the restored load by time step for a repair schedule
+        :param repair_status: array of (vertex, time) or dictionary of vertex name to a list over time, e.g. z or Line_bin
+        :return: upper, lower
+        """
+        if not hasattr(self, 'restoration_bound'):
+            self.restoration_bound = RestorationBound(self.ppc, self.index, self.Voltage_Substation, self.Voltage_Variation)
+        return self.restoration_bound.evaluate(repair_status)
+
+
+
+    def get_model_size(self):
+        """
+        get the number of variables, constraints and nonzeros of the model for the profiling records,
+        None for a count the backend does not know
+        :return: (variables, constraints, nonzeros)
+        """
+        raise NotImplementedError('{} does not implement get_model_size'.format(type(self).__name__))
+
+
+
+    def get_solution_family(self, VariableName):
+        """
+        get the solution of all variables of a family by one query to the solver
+        :return: ndarray in the shape of the index sets of the family, list of the index sets
+        """
+        raise NotImplementedError('{} does not implement get_solution_family'.format(type(self).__name__))
+
+
+
+    def get_solution_array(self, VariableName, *ListIndex):
+        """
+        get the solution of a variable family as a dense array, e.g. bus x time for rho, line x time for ul and
+        crew x vertex x vertex for x
+        :param VariableName: variable name in string format
+        :param ListIndex: index list of each dimension to retrieve, e.g. iter_line and iter_time,
+                          the whole dimension in the order of the family if omitted or None
+        :return: ndarray, a view of the family solution if the whole family is retrieved in its order
+        """
+        value, sets = self.get_solution_family(VariableName)
+        for d, index in enumerate(ListIndex):
+            if index is None or list(index) == list(sets[d]):
+                continue
+            row = {k: i for i, k in enumerate(sets[d])}
+            value = value.take([row[k] for k in index], axis=d)
+        return value
+
+
+
+    ## interface of master problems and subproblems used by the Benders engine, implemented by each backend
+    def solve_problem(self):
+        """
+        solve the formulated problem
+        """
+        raise NotImplementedError('{} does not implement solve_problem'.format(type(self).__name__))
+
+
+
+    def get_objective(self):
+        """
+        get the served energy of the solved problem, i.e., sum of picked up load times BasePower
+        """
+        raise NotImplementedError('{} does not implement get_objective'.format(type(self).__name__))
+
+
+
+    def get_route(self):
+        """
+        get the crew dispatch route of the solved master problem as a tuple of (crew, vertex, vertex) arcs
+        """
+        raise NotImplementedError('{} does not implement get_route'.format(type(self).__name__))
+
+
+
+    def get_repair_status(self):
+        """
+        get the repair status of the solved master problem as an array of (vertex, time) in the order of ordered_vertex
+        """
+        raise NotImplementedError('{} does not implement get_repair_status'.format(type(self).__name__))
+
+
+
+    def get_candidates(self, number=1):
+        """
+        get candidate crew dispatch routes of the solved master problem, backends with a solution pool may return several
+        :param number: maximum number of candidates
+        :return: list of (route, repair_status)
+        """
+        return [(self.get_route(), self.get_repair_status())]
+
+
+
+    def set_repair_schedule(self, repair_status):
+        """
+        damaged lines of the subproblem cannot function before they are repaired
+        :param repair_status: array of (vertex, time) in the order of ordered_vertex
+        """
+        raise NotImplementedError('{} does not implement set_repair_schedule'.format(type(self).__name__))
+
+
+
+    def get_network_status(self):
+        """
+        get the line status and the load status of the solved subproblem
+        :return: line_status as an array of (line, time) in the order of iter_line, load_status as an array of (bus, time)
+        """
+        raise NotImplementedError('{} does not implement get_network_status'.format(type(self).__name__))
+
+
+
+    def add_benders_cut(self, route, ObjVal_sp=None):
+        """
+        add the combinatorial Benders cut of an evaluated route to the master problem
+        optimality cut: served energy <= ObjVal_sp + (ObjVal_max - ObjVal_sp) * (|route| - sum of x over the route)
+        no-good cut: sum of x over the route <= |route| - 1
+        :param route: tuple of (crew, vertex, vertex) arcs from get_route
+        :param ObjVal_sp: upper bound of the served energy of the route from the subproblem, None for the no-good cut
+        :return: handle of the cut for remove_benders_cut and get_cut_slack, None if the cut cannot be removed
+        """
+        raise NotImplementedError('{} does not implement add_benders_cut'.format(type(self).__name__))
+
+
+
+    def remove_benders_cut(self, handle):
+        raise NotImplementedError('{} does not implement remove_benders_cut'.format(type(self).__name__))
+
+
+
+    def get_cut_slack(self, handle):
+        """
+        get the slack of a cut at the solution of the master problem
+        """
+        raise NotImplementedError('{} does not implement get_cut_slack'.format(type(self).__name__))
+
+
+
+    ## interface of the windows of the rolling-horizon driver, implemented by each backend of the co-optimization
+    def get_arrival_time(self):
+        """
+        get the arrival time of the crews at the vertices of the solved problem
+        :return: OrderedDict of (crew, vertex): arrival time
+        """
+        raise NotImplementedError('{} does not implement get_arrival_time'.format(type(self).__name__))
+
+
+
+    def fix_route(self, route, arrival):
+        """
+        fix the crew dispatch decisions committed in earlier windows
+        :param route: tuple of (crew, vertex, vertex) arcs already travelled
+        :param arrival: OrderedDict of (crew, vertex): arrival time of the vertices on the committed arcs
+        """
+        raise NotImplementedError('{} does not implement fix_route'.format(type(self).__name__))
+
+
+
+    def set_initial_status(self, line_status, load_status, t=0):
+        """
+        carry the network state across the window boundary: damaged lines already closed stay closed and
+        loads already picked up stay served from time index t on, the time indices before t serve no load
+        :param line_status: array of the line status in the order of iter_line at the boundary
+        :param load_status: array of the load status in the order of iter_bus at the boundary
+        """
+        raise NotImplementedError('{} does not implement set_initial_status'.format(type(self).__name__))
+
+
+
+    def set_start(self, route, arrival):
+        """
+        set the crew dispatch of the previous window as the start solution of the next solve
+        """
+        raise NotImplementedError('{} does not implement set_start'.format(type(self).__name__))
+
+
+
+    def get_repair_start(self, route, arrival):
+        """
+        get the repair timing of a crew dispatch for the start solution: the repair of a vertex visited by crew c finishes
+        at arrival + repair time, f is one at the first time index whose time point is not earlier and z after it
+        :return: f, z as arrays of (vertex, time) in the order of ordered_vertex
+        """
+        f = np.zeros((self.number_vertex, len(self.iter_time)))
+        z = np.zeros((self.number_vertex, len(self.iter_time)))
+        for c, m in OrderedDict.fromkeys((k[0], v) for k in route for v in k[1:]):
+            finish = arrival[c, m] + self.vrp['repair'][c][m]
+            t = min(np.searchsorted(self.time_point, finish - 1e-6), len(self.iter_time) - 1)
+            f[self.index.vertex_row[m], t] = 1
+            z[self.index.vertex_row[m], t + 1:] = 1
+        return f, z
+
+
+
+    def get_objective_max(self):
+        """
+        get the upper bound of the served energy used as the big-M of the optimality cut,
+        ObjVal_max if it is set, e.g. from the graph-based bound with all lines available, otherwise all loads over the horizon
+        """
+        if self.ObjVal_max is None:
+            return self.index.bus_load_P.sum() * self.time_weight.sum() * self.BasePower
+        else:
+            return self.ObjVal_max
+
+
+
+
+def get_time_bucket(Total_Time=100, fine_time=15, growth=2, max_width=10):
+    """
+    get the widths of time buckets that are fine near the start and coarse later,
+    unit steps until fine_time, then widths growing by the factor growth up to max_width
+    :param Total_Time: number of unit time steps covered by the buckets
+    :return: list of bucket widths that add up to Total_Time
+    """
+    time_bucket = [1] * min(fine_time, Total_Time)
+    width = 1
+    while sum(time_bucket) < Total_Time:
+        width = min(width * growth, max_width)
+        time_bucket.append(min(width, Total_Time - sum(time_bucket)))
+    return time_bucket
+
+
+
+
+class NetworkIndex(namedtuple('NetworkIndex', ['bus_row', 'line_row', 'gen_row', 'vertex_row',
+                                               'line_from', 'line_to', 'bus_line_out', 'bus_line_in', 'bus_line', 'bus_arc_in',
+                                               'bus_gen', 'bus_load_P', 'bus_load_Q', 'substation',
+                                               'line_static', 'line_switch',
+                                               'vertex_line', 'line_vertex', 'damaged_vertex', 'damaged_line'])):
+    """
+    Immutable integer index of the network and crew dispatch data
+    It is built once in data_preparation so that constraint loops never parse component names
+    All index arrays are zero-based rows of ppc['bus'], ppc['line'], ppc['gen'] and vrp['ordered_vertex']
+    """
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, ppc, vrp, line_damaged, line_switch):
+        """
+        build the index from network data, vehicle routing data and the sorted line types
+        :param ppc: distribution network dictionary processed by get_iterator and get_bus_line_gen
+        :param vrp: vehicle routing dictionary
+        :param line_damaged: set of damaged line names
+        :param line_switch: set of tie line names
+        :return: NetworkIndex
+        """
+        ## name to row maps
+        bus_row = OrderedDict((name, k) for k, name in enumerate(ppc['iter_bus']))
+        line_row = OrderedDict((name, k) for k, name in enumerate(ppc['iter_line']))
+        gen_row = OrderedDict((name, k) for k, name in enumerate(ppc['iter_gen']))
+        vertex_row = OrderedDict((name, k) for k, name in enumerate(vrp['ordered_vertex']))
+
+        ## bus number in data tables to bus row
+        bus_number = ppc['bus'][:, 0].astype(int)
+        bus_number_row = np.full(bus_number.max() + 1, -1, dtype=int)
+        bus_number_row[bus_number] = np.arange(bus_number.shape[0])
+
+        ## from and to bus row of each line
+        line_from = bus_number_row[ppc['line'][:, 1].astype(int)]
+        line_to = bus_number_row[ppc['line'][:, 2].astype(int)]
+
+        ## incident lines of each bus
+        number_bus = bus_number.shape[0]
+        bus_line_out = tuple(np.flatnonzero(line_from == k) for k in range(number_bus))
+        bus_line_in = tuple(np.flatnonzero(line_to == k) for k in range(number_bus))
+        bus_line = tuple(np.concatenate((bus_line_out[k], bus_line_in[k])) for k in range(number_bus))
+
+        ## incoming arcs of each bus as (line, orientation) rows of the radiality variables,
+        ## orientation 0 means the from bus is the parent of the to bus, orientation 1 the reverse
+        arc_child = np.stack((line_to, line_from), axis=1)
+        bus_arc_in = tuple(np.argwhere(arc_child == k) for k in range(number_bus))
+
+        ## generator row at each bus with generation capability, -1 for load-only bus
+        bus_gen = np.full(number_bus, -1, dtype=int)
+        for k in range(number_bus):
+            if ppc['bus'][k, 1] == 1:
+                bus_gen[k] = ppc['bus_gen'][ppc['iter_bus'][k]][0] - 1
+
+        ## damaged component maps between vertex rows and line rows, -1 if not a damaged line
+        vertex_line = np.full(len(vertex_row), -1, dtype=int)
+        line_vertex = np.full(len(line_row), -1, dtype=int)
+        for name in line_damaged:
+            vertex_line[vertex_row[name]] = line_row[name]
+            line_vertex[line_row[name]] = vertex_row[name]
+        damaged_vertex = np.flatnonzero(vertex_line >= 0)
+        damaged_line = vertex_line[damaged_vertex]
+
+        ## line rows of fixed lines and tie lines
+        line_switch = np.array(sorted(line_row[name] for name in line_switch), dtype=int)
+        line_static = np.setdiff1d(np.arange(len(line_row)), np.union1d(damaged_line, line_switch))
+
+        index = cls(bus_row=bus_row, line_row=line_row, gen_row=gen_row, vertex_row=vertex_row,
+                    line_from=line_from, line_to=line_to,
+                    bus_line_out=bus_line_out, bus_line_in=bus_line_in, bus_line=bus_line, bus_arc_in=bus_arc_in,
+                    bus_gen=bus_gen, bus_load_P=ppc['bus'][:, 4].astype(float), bus_load_Q=ppc['bus'][:, 5].astype(float),
+                    substation=bus_row['bus_1'],
+                    line_static=line_static, line_switch=line_switch,
+                    vertex_line=vertex_line, line_vertex=line_vertex,
+                    damaged_vertex=damaged_vertex, damaged_line=damaged_line)
+
+        ## freeze all arrays so the index can be shared between models
+        for value in index:
+            for array in (value if isinstance(value, tuple) else (value,)):
+                if isinstance(array, np.ndarray):
+                    array.setflags(write=False)
+
+        return index
+
+
+
+
+class ColumnLayout(object):
+    """
+    Column layout of a model assembled in sparse matrix form
+    Each variable family occupies a contiguous range of columns stored in row-major order of its shape,
+    e.g. a (line, time) family stores column line * Total_Time + time
+    """
+
+    def __init__(self):
+        self.offset = OrderedDict()
+        self.shape = OrderedDict()
+        self.number_column = 0
+
+
+    def add(self, name, shape):
+        """
+        reserve the columns of a variable family
+        :param name: variable family name
+        :param shape: tuple of dimensions
+        """
+        self.offset[name] = self.number_column
+        self.shape[name] = tuple(int(k) for k in shape)
+        self.number_column = self.number_column + int(np.prod(self.shape[name]))
+
+
+    def __contains__(self, name):
+        return name in self.offset
+
+
+    def column(self, name, *index):
+        """
+        get the column of a variable family at the given (broadcastable) integer index arrays
+        """
+        return self.offset[name] + np.ravel_multi_index(np.broadcast_arrays(*index), self.shape[name])
+
+
+    def columns(self, name):
+        """
+        get the range of columns of a variable family
+        """
+        return np.arange(self.offset[name], self.offset[name] + int(np.prod(self.shape[name])))
+
+
+    def slice(self, name):
+        """
+        get the range of columns of a variable family as a slice, e.g. to take a view of the solution vector
+        """
+        return slice(self.offset[name], self.offset[name] + int(np.prod(self.shape[name])))
+
+
+
+
+class SparseBlock(namedtuple('SparseBlock', ['row', 'col', 'val', 'lower', 'upper', 'key'])):
+    """
+    A block of linear constraints lower <= A x <= upper in coordinate form
+    row, col and val hold the nonzeros, lower, upper and key hold one entry per row
+    key gives the order of rows when blocks are interleaved
+    """
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, row, col, val, lower, upper, number_row, key=None):
+        """
+        build a block with broadcasting of the nonzeros and the row bounds
+        """
+        row, col, val = (np.ravel(k) for k in np.broadcast_arrays(row, col, val))
+        lower = np.broadcast_to(np.asarray(lower, dtype=float), (number_row,)).copy()
+        upper = np.broadcast_to(np.asarray(upper, dtype=float), (number_row,)).copy()
+        if key is None:
+            key = np.arange(number_row)
+        return cls(row.astype(int), col.astype(int), val.astype(float), lower, upper, np.asarray(key))
+
+
+    @property
+    def number_row(self):
+        return self.lower.shape[0]
+
+
+    @property
+    def nnz(self):
+        return self.val.shape[0]
+
+
+    @classmethod
+    def stack(cls, *blocks):
+        """
+        stack blocks one after another
+        """
+        offset = np.cumsum([0] + [b.number_row for b in blocks])
+        return cls(np.concatenate([b.row + offset[k] for k, b in enumerate(blocks)]),
+                   np.concatenate([b.col for b in blocks]),
+                   np.concatenate([b.val for b in blocks]),
+                   np.concatenate([b.lower for b in blocks]),
+                   np.concatenate([b.upper for b in blocks]),
+                   np.arange(offset[-1]))
+
+
+    @classmethod
+    def interleave(cls, *blocks):
+        """
+        interleave blocks row by row according to their keys,
+        the k-th block goes after the first k blocks for rows with equal key
+        """
+        stacked = cls.stack(*blocks)
+        key = np.concatenate([b.key * len(blocks) + k for k, b in enumerate(blocks)])
+        order = np.argsort(key, kind='stable')
+        position = np.empty_like(order)
+        position[order] = np.arange(order.shape[0])
+        return cls(position[stacked.row], stacked.col, stacked.val,
+                   stacked.lower[order], stacked.upper[order], np.arange(order.shape[0]))
+
+
+    def tocsr(self, number_column):
+        """
+        get the constraint matrix in CSR format without explicit zeros
+        """
+        A = sparse.csr_matrix((self.val, (self.row, self.col)), shape=(self.number_row, number_column))
+        A.eliminate_zeros()
+        A.sort_indices()
+        return A
+
+
+
+
+class SparseModel(object):
+    """
+    Optimization model held in sparse arrays:
+    minimize cost x subject to lower <= A x <= upper and lb <= x <= ub, with integrality flags on x
+    Variables are added by family on a ColumnLayout and constraints as named SparseBlocks
+    """
+
+    def __init__(self):
+        self.layout = ColumnLayout()
+        self.index_sets = OrderedDict()
+        self.lb = np.zeros(0)
+        self.ub = np.zeros(0)
+        self.integrality = np.zeros(0, dtype=int)
+        self.cost = np.zeros(0)
+        self.blocks = OrderedDict()
+
+
+    def add_var(self, name, sets, lb=-np.inf, ub=np.inf, integer=False):
+        """
+        add a variable family
+        :param name: variable family name
+        :param sets: list of index lists, e.g. [iter_line, iter_time]
+        :param lb: lower bound, scalar or array of the family shape
+        :param ub: upper bound, scalar or array of the family shape
+        :param integer: True for integer and binary variables
+        """
+        shape = tuple(len(s) for s in sets)
+        self.layout.add(name, shape)
+        self.index_sets[name] = [list(s) for s in sets]
+
+        n = int(np.prod(shape))
+        self.lb = np.concatenate((self.lb, np.broadcast_to(np.asarray(lb, dtype=float), shape).ravel()))
+        self.ub = np.concatenate((self.ub, np.broadcast_to(np.asarray(ub, dtype=float), shape).ravel()))
+        self.integrality = np.concatenate((self.integrality, np.full(n, int(integer))))
+        self.cost = np.concatenate((self.cost, np.zeros(n)))
+
+
+    def add_constr(self, name, block):
+        """
+        add a named block of constraints, blocks added under an existing name are stacked after it
+        """
+        if name in self.blocks:
+            block = SparseBlock.stack(self.blocks[name], block)
+        self.blocks[name] = block
+
+
+    def set_cost(self, name, coef):
+        """
+        set the objective coefficients of a variable family
+        """
+        columns = self.layout.columns(name)
+        self.cost[columns] = np.broadcast_to(np.asarray(coef, dtype=float), self.layout.shape[name]).ravel()
+
+
+    @property
+    def number_column(self):
+        return self.layout.number_column
+
+
+    @property
+    def number_row(self):
+        return sum(b.number_row for b in self.blocks.values())
+
+
+    @property
+    def nnz(self):
+        return sum(b.nnz for b in self.blocks.values())
+
+
+    def get_matrix(self):
+        """
+        get the constraint matrix in CSR format and the row bounds
+        :return: A, lower, upper
+        """
+        block = SparseBlock.stack(*self.blocks.values())
+        return block.tocsr(self.number_column), block.lower, block.upper
+
+
+    ## compact names used in exported files, the name is the position of the column or row
+    @staticmethod
+    def column_name(j):
+        return 'C{}'.format(j)
+
+
+    @staticmethod
+    def row_name(i):
+        return 'R{}'.format(i)
+
+
+    @staticmethod
+    def format_number(value):
+        return '{:.12g}'.format(value)
+
+
+    def write_mps(self, filename, chunk_size=4096):
+        """
+        stream the model to a free MPS file column by column from the sparse arrays
+        :param filename: output file name
+        :param chunk_size: number of rows or columns formatted before each write
+        """
+        A, lower, upper = self.get_matrix()
+        A = A.tocsc()
+        num = self.format_number
+
+        ## row type: E for equality, L for upper bound only, G for lower bound, ranged G row
+        row_type = np.where(lower == upper, 'E', np.where(np.isinf(lower), np.where(np.isinf(upper), 'N', 'L'), 'G'))
+        rhs = np.where(row_type == 'L', upper, np.where(np.isinf(lower), 0, lower))
+        row_range = np.where((row_type == 'G') & ~np.isinf(upper), upper - lower, 0)
+
+        with open(filename, 'w') as f:
+            f.write('NAME DSOPT\nOBJSENSE\n    MIN\nROWS\n N  OBJ\n')
+            for start in range(0, self.number_row, chunk_size):
+                f.write(''.join(' {}  {}\n'.format(row_type[i], self.row_name(i))
+                                for i in range(start, min(start + chunk_size, self.number_row))))
+
+            ## columns, integer columns are enclosed by markers
+            f.write('COLUMNS\n')
+            integer = False
+            for start in range(0, self.number_column, chunk_size):
+                lines = []
+                for j in range(start, min(start + chunk_size, self.number_column)):
+                    if bool(self.integrality[j]) != integer:
+                        integer = bool(self.integrality[j])
+                        lines.append('    MARKER  \'MARKER\'  \'{}\'\n'.format('INTORG' if integer else 'INTEND'))
+                    name = self.column_name(j)
+                    if self.cost[j] != 0:
+                        lines.append('    {}  OBJ  {}\n'.format(name, num(self.cost[j])))
+                    for k in range(A.indptr[j], A.indptr[j + 1]):
+                        lines.append('    {}  {}  {}\n'.format(name, self.row_name(A.indices[k]), num(A.data[k])))
+                f.write(''.join(lines))
+            if integer:
+                f.write('    MARKER  \'MARKER\'  \'INTEND\'\n')
+
+            ## right hand side and ranges
+            f.write('RHS\n')
+            for i in np.flatnonzero(rhs != 0):
+                f.write('    RHS  {}  {}\n'.format(self.row_name(i), num(rhs[i])))
+            f.write('RANGES\n')
+            for i in np.flatnonzero(row_range != 0):
+                f.write('    RNG  {}  {}\n'.format(self.row_name(i), num(row_range[i])))
+
+            ## bounds, integer columns always get explicit bounds since readers differ on their defaults
+            f.write('BOUNDS\n')
+            for start in range(0, self.number_column, chunk_size):
+                f.write(''.join(self.mps_bound(j) for j in range(start, min(start + chunk_size, self.number_column))))
+            f.write('ENDATA\n')
+
+
+    def mps_bound(self, j):
+        """
+        get the bound lines of column j in MPS format
+        """
+        name = self.column_name(j)
+        lb, ub = self.lb[j], self.ub[j]
+        if self.integrality[j] and lb == 0 and ub == 1:
+            return ' BV BND  {}\n'.format(name)
+        if np.isinf(lb) and np.isinf(ub):
+            return ' FR BND  {}\n'.format(name)
+        if lb == ub:
+            return ' FX BND  {}  {}\n'.format(name, self.format_number(lb))
+        lines = ''
+        if np.isinf(lb):
+            lines = lines + ' MI BND  {}\n'.format(name)
+        elif lb != 0 or self.integrality[j]:
+            lines = lines + ' LO BND  {}  {}\n'.format(name, self.format_number(lb))
+        if np.isinf(ub):
+            if self.integrality[j]:
+                lines = lines + ' PL BND  {}\n'.format(name)
+        else:
+            lines = lines + ' UP BND  {}  {}\n'.format(name, self.format_number(ub))
+        return lines
+
+
+    def write_lp(self, filename, chunk_size=4096):
+        """
+        stream the model to a CPLEX-LP file row by row from the sparse arrays
+        Ranged rows are written as two rows named R<i>_lo and R<i>_up
+        :param filename: output file name
+        :param chunk_size: number of rows or columns formatted before each write
+        """
+        A, lower, upper = self.get_matrix()
+        num = self.format_number
+
+        def linear(columns, values):
+            return ' '.join('{} {} {}'.format('-' if v < 0 else '+', num(abs(v)), self.column_name(j))
+                            for j, v in zip(columns, values))
+
+        with open(filename, 'w') as f:
+            ## objective
+            cost = np.flatnonzero(self.cost)
+            f.write('Minimize\n obj: {}\nSubject To\n'.format(linear(cost, self.cost[cost]) if cost.shape[0] > 0 else '0 ' + self.column_name(0)))
+
+            ## constraints
+            for start in range(0, self.number_row, chunk_size):
+                lines = []
+                for i in range(start, min(start + chunk_size, self.number_row)):
+                    s, e = A.indptr[i], A.indptr[i + 1]
+                    expr = linear(A.indices[s:e], A.data[s:e]) if e > s else '0 ' + self.column_name(0)
+                    if lower[i] == upper[i]:
+                        lines.append(' {}: {} = {}\n'.format(self.row_name(i), expr, num(lower[i])))
+                    elif np.isinf(lower[i]) and not np.isinf(upper[i]):
+                        lines.append(' {}: {} <= {}\n'.format(self.row_name(i), expr, num(upper[i])))
+                    elif np.isinf(upper[i]) and not np.isinf(lower[i]):
+                        lines.append(' {}: {} >= {}\n'.format(self.row_name(i), expr, num(lower[i])))
+                    elif not np.isinf(lower[i]):
+                        lines.append(' {}_lo: {} >= {}\n'.format(self.row_name(i), expr, num(lower[i])))
+                        lines.append(' {}_up: {} <= {}\n'.format(self.row_name(i), expr, num(upper[i])))
+                f.write(''.join(lines))
+
+            ## bounds, the default bound of LP format is [0, inf)
+            f.write('Bounds\n')
+            for start in range(0, self.number_column, chunk_size):
+                lines = []
+                for j in range(start, min(start + chunk_size, self.number_column)):
+                    lb, ub = self.lb[j], self.ub[j]
+                    if lb == 0 and np.isinf(ub):
+                        continue
+                    name = self.column_name(j)
+                    if np.isinf(lb) and np.isinf(ub):
+                        lines.append(' {} free\n'.format(name))
+                    elif lb == ub:
+                        lines.append(' {} = {}\n'.format(name, num(lb)))
+                    else:
+                        lines.append(' {} <= {} <= {}\n'.format('-inf' if np.isinf(lb) else num(lb), name,
+                                                                '+inf' if np.isinf(ub) else num(ub)))
+                f.write(''.join(lines))
+
+            ## integer columns
+            f.write('General\n')
+            integer = np.flatnonzero(self.integrality)
+            for start in range(0, integer.shape[0], chunk_size):
+                f.write(''.join(' {}\n'.format(self.column_name(j)) for j in integer[start:start + chunk_size]))
+            f.write('End\n')
+
+
+    def write_name_map(self, filename):
+        """
+        write the map from compact names to variable families and constraint blocks in JSON
+        Column C<j> of family name is entry j - offset of the family in row-major order of its index sets
+        """
+        def plain(k):
+            return k.item() if isinstance(k, np.generic) else k
+
+        name_map = OrderedDict()
+        name_map['columns'] = OrderedDict()
+        for name in self.layout.offset:
+            name_map['columns'][name] = OrderedDict([('offset', self.layout.offset[name]),
+                                                     ('shape', list(self.layout.shape[name])),
+                                                     ('sets', [[plain(k) for k in s] for s in self.index_sets[name]])])
+        name_map['rows'] = OrderedDict()
+        offset = 0
+        for name, block in self.blocks.items():
+            name_map['rows'][name] = OrderedDict([('offset', offset), ('number_row', block.number_row)])
+            offset = offset + block.number_row
+
+        with open(filename, 'w') as f:
+            json.dump(name_map, f)
+
+
+    def read_solution(self, values):
+        """
+        get the solution vector from a mapping of compact column names to values, e.g. read from a solver solution file
+        Missing columns are set to zero as solvers usually omit them
+        """
+        solution = np.zeros(self.number_column)
+        for name, value in values.items():
+            solution[int(name[1:])] = value
+        return solution
+
+
+
+
+class NetworkMatrix(object):
+    """
+    Sparse matrix form of the distribution network operation constraints
+    The bus-line incidence matrix and line parameter vectors are formed once from ppc['line'],
+    every constraint family is then emitted as a time-expanded SparseBlock on a ColumnLayout
+    """
+
+    def __init__(self, ppc, index):
+        self.index = index
+        self.number_bus = ppc['number_bus']
+        self.number_line = ppc['number_line']
+        self.number_gen = ppc['number_gen']
+
+        ## bus-line incidence matrix: +1 for line flowing into the bus, -1 for line flowing out from the bus
+        line = np.arange(self.number_line)
+        self.incidence = sparse.csr_matrix(
+            (np.concatenate((np.ones(self.number_line), -np.ones(self.number_line))),
+             (np.concatenate((index.line_to, index.line_from)), np.concatenate((line, line)))),
+            shape=(self.number_bus, self.number_line))
+
+        ## bus-generator incidence matrix
+        bus_gen = np.flatnonzero(index.bus_gen >= 0)
+        self.gen_incidence = sparse.csr_matrix(
+            (np.ones(bus_gen.shape[0]), (bus_gen, index.bus_gen[bus_gen])), shape=(self.number_bus, self.number_gen))
+
+        ## line vectors
+        self.R = ppc['line'][:, 3].astype(float)
+        self.X = ppc['line'][:, 4].astype(float)
+        self.Pmax = ppc['line'][:, 5].astype(float)
+        self.Qmax = ppc['line'][:, 6].astype(float)
+
+
+    @staticmethod
+    def expand(A, T):
+        """
+        get the time-expanded coordinates of matrix A whose rows are ordered by (time, row of A)
+        :return: row, component, time of each nonzero and its value
+        """
+        A = A.tocoo()
+        t = np.repeat(np.arange(T), A.nnz)
+        return (t * A.shape[0] + np.tile(A.row, T),
+                np.tile(A.col, T), t, np.tile(A.data, T))
+
+
+    def block_power_balance(self, layout, T, flow='P', gen='p', load=None):
+        """
+        power balance at each bus: flow in + generation - flow out - load * rho = 0
+        rows are ordered by (time, bus)
+        """
+        B = self.number_bus
+        if load is None:
+            load = self.index.bus_load_P
+
+        row_f, k_f, t_f, v_f = self.expand(self.incidence, T)
+        row_g, k_g, t_g, v_g = self.expand(self.gen_incidence, T)
+        row_r, k_r, t_r, v_r = self.expand(sparse.diags(-np.asarray(load, dtype=float)).tocsr(), T)
+
+        return SparseBlock.build(np.concatenate((row_f, row_g, row_r)),
+                                 np.concatenate((layout.column(flow, k_f, t_f), layout.column(gen, k_g, t_g),
+                                                 layout.column('rho', k_r, t_r))),
+                                 np.concatenate((v_f, v_g, v_r)), 0, 0, T * B)
+
+
+    def block_voltage_drop(self, layout, T, BigM, Voltage_Substation):
+        """
+        voltage drop along each line when it is closed:
+        -M(1 - ul) <= V_to - V_from + (R P + X Q) / V0 <= M(1 - ul)
+        :return: the upper and lower side as two blocks with rows ordered by (time, line)
+        """
+        L = self.number_line
+        t = np.repeat(np.arange(T), L)
+        k = np.tile(np.arange(L), T)
+        row = np.arange(T * L)
+        col = np.stack((layout.column('V', self.index.line_to[k], t), layout.column('V', self.index.line_from[k], t),
+                        layout.column('P', k, t), layout.column('Q', k, t), layout.column('ul', k, t)))
+        val = np.stack((np.ones(T * L), -np.ones(T * L),
+                        self.R[k] / Voltage_Substation, self.X[k] / Voltage_Substation, np.full(T * L, float(BigM))))
+
+        upper = SparseBlock.build(row, col, val, -np.inf, BigM, T * L)
+        val[4] = -BigM
+        lower = SparseBlock.build(row, col, val, -BigM, np.inf, T * L)
+        return upper, lower
+
+
+    def block_line_limit(self, layout, T, flow, limit):
+        """
+        flow limit of each line: -limit * ul <= flow <= limit * ul
+        :return: the upper and lower side as two blocks with rows ordered by (time, line)
+        """
+        L = self.number_line
+        t = np.repeat(np.arange(T), L)
+        k = np.tile(np.arange(L), T)
+        row = np.arange(T * L)
+        col = np.stack((layout.column(flow, k, t), layout.column('ul', k, t)))
+        limit = np.broadcast_to(np.asarray(limit, dtype=float), (L,))[k]
+
+        upper = SparseBlock.build(row, col, np.stack((np.ones(T * L), -limit)), -np.inf, 0, T * L)
+        lower = SparseBlock.build(row, col, np.stack((np.ones(T * L), limit)), 0, np.inf, T * L)
+        return upper, lower
+
+
+    def block_voltage_limit(self, layout, T, Voltage_Substation, Voltage_Variation):
+        """
+        voltage limits: fixed voltage at the substation and a band at the other buses
+        :return: the substation, lower and upper blocks keyed by (time, bus)
+        """
+        B = self.number_bus
+        substation = self.index.substation
+        bus = np.setdiff1d(np.arange(B), [substation])
+        t = np.repeat(np.arange(T), bus.shape[0])
+        b = np.tile(bus, T)
+
+        fixed = SparseBlock.build(np.arange(T), layout.column('V', substation, np.arange(T)), 1,
+                                  Voltage_Substation, Voltage_Substation, T, key=np.arange(T) * B + substation)
+        lower = SparseBlock.build(np.arange(t.shape[0]), layout.column('V', b, t), 1,
+                                  1 - Voltage_Variation, np.inf, t.shape[0], key=t * B + b)
+        upper = SparseBlock.build(np.arange(t.shape[0]), layout.column('V', b, t), 1,
+                                  -np.inf, 1 + Voltage_Variation, t.shape[0], key=t * B + b)
+        return fixed, lower, upper
+
+
+    def block_radiality(self, layout, T):
+        """
+        tree topology constraints on the radiality variables beta[line, orientation, time]:
+        the substation bus does not have parent bus,
+        each bus has at most one parent bus,
+        a closed line has exactly one orientation
+        """
+        B = self.number_bus
+        L = self.number_line
+        time = np.arange(T)
+        arc_in = self.index.bus_arc_in
+
+        ## incoming arcs of the substation bus
+        arc = arc_in[self.index.substation]
+        t = np.repeat(time, arc.shape[0])
+        substation = SparseBlock.build(np.arange(t.shape[0]), layout.column('beta', np.tile(arc[:, 0], T), np.tile(arc[:, 1], T), t),
+                                       1, 0, 0, t.shape[0])
+
+        ## incoming arcs of all buses, one row per bus with at least one line
+        bus = np.array([j for j in range(B) if arc_in[j].shape[0] > 0], dtype=int)
+        arc = np.concatenate([arc_in[j] for j in bus])
+        arc_row = np.repeat(np.arange(bus.shape[0]), [arc_in[j].shape[0] for j in bus])
+        t = np.repeat(time, arc.shape[0])
+        parent = SparseBlock.build(t * bus.shape[0] + np.tile(arc_row, T),
+                                   layout.column('beta', np.tile(arc[:, 0], T), np.tile(arc[:, 1], T), t), 1,
+                                   -np.inf, 1, T * bus.shape[0])
+
+        t = np.repeat(time, L)
+        k = np.tile(np.arange(L), T)
+        orientation = SparseBlock.build(np.arange(T * L),
+                                        np.stack((layout.column('beta', k, 0, t), layout.column('beta', k, 1, t),
+                                                  layout.column('ul', k, t))),
+                                        np.array([1, 1, -1])[:, None], 0, 0, T * L)
+
+        return SparseBlock.stack(substation, parent, orientation)
+
+
+    def block_line_status(self, layout, T):
+        """
+        line status: static lines are always closed, a closed damaged line cannot open again
+        """
+        static = self.index.line_static
+        t = np.repeat(np.arange(T), static.shape[0])
+        k = np.tile(static, T)
+        fixed = SparseBlock.build(np.arange(t.shape[0]), layout.column('ul', k, t), 1, 1, 1, t.shape[0])
+
+        return SparseBlock.stack(fixed, self.block_monotone(layout, T, 'ul', self.index.damaged_line))
+
+
+    def block_load_status(self, layout, T):
+        """
+        load that has been picked up cannot be shed again
+        """
+        return self.block_monotone(layout, T, 'rho', np.arange(self.number_bus))
+
+
+    @staticmethod
+    def block_monotone(layout, T, name, component):
+        """
+        non-decreasing status in time: x[i, t] - x[i, t - 1] >= 0, rows ordered by (time, component)
+        """
+        t = np.repeat(np.arange(1, T), component.shape[0])
+        k = np.tile(component, T - 1)
+        n = t.shape[0]
+        return SparseBlock.build(np.arange(n)[None, :],
+                                 np.stack((layout.column(name, k, t), layout.column(name, k, t - 1))),
+                                 np.array([1, -1])[:, None], 0, np.inf, n)
+
+
+
+
+class RestorationBound(object):
+    """
+    Graph-based bounds on the energy a repair schedule can restore, without solving the network operation MIP
+    The sources are the substation and the generator (DG) buses, since the load of an island is only served by the
+    generators in it. The upper bound picks up every load connected to a source when all tie lines and available
+    damaged lines can be closed. The lower bound is a feasible point of the subproblem: radial trees grown from the
+    sources over time, one source per tree with the other generators at zero output, where loads are picked up in
+    breadth-first order as long as the line flow and voltage limits of the linearized DistFlow model hold
+    """
+
+    def __init__(self, ppc, index, Voltage_Substation=1.05, Voltage_Variation=0.1):
+        self.index = index
+        self.number_bus = ppc['number_bus']
+        self.number_line = ppc['number_line']
+        self.Voltage_Substation = Voltage_Substation
+        self.Voltage_Variation = Voltage_Variation
+
+        self.load_P = index.bus_load_P
+        self.load_Q = index.bus_load_Q
+        self.R = ppc['line'][:, 3].astype(float)
+        self.X = ppc['line'][:, 4].astype(float)
+        self.Pmax = ppc['line'][:, 5].astype(float)
+        self.Qmax = ppc['line'][:, 6].astype(float)
+
+        ## source buses, the substation first so that it is the root of its island
+        self.root = np.append(index.substation, np.setdiff1d(np.flatnonzero(index.bus_gen >= 0), [index.substation]))
+
+        ## islands formed by the static lines, which are always closed
+        static = index.line_static
+        self.static_adjacency = sparse.csr_matrix(
+            (np.ones(static.shape[0]), (index.line_from[static], index.line_to[static])), shape=(self.number_bus, self.number_bus))
+        self.number_island, self.island = csgraph.connected_components(self.static_adjacency, directed=False)
+        self.island_load = np.bincount(self.island, weights=self.load_P, minlength=self.number_island)
+
+
+    def get_line_availability(self, repair_status):
+        """
+        get the availability of each line by time step from the repair status of the damaged components
+        :param repair_status: array of (vertex, time) or dictionary of vertex name to a list over time, e.g. z or Line_bin
+        :return: boolean array of (line, time)
+        """
+        if isinstance(repair_status, dict):
+            repair_status = [repair_status[v] for v in self.index.vertex_row]
+        repair_status = np.asarray(repair_status, dtype=float) > 0.5
+
+        available = np.ones((self.number_line, repair_status.shape[1]), dtype=bool)
+        available[self.index.damaged_line] = repair_status[self.index.damaged_vertex]
+        return available
+
+
+    def get_upper_bound(self, available):
+        """
+        load connected to a source by time step when all available lines can be closed
+        """
+        upper = np.zeros(available.shape[1])
+
+        ## connectivity only changes when a damaged line becomes available or unavailable
+        pattern, inverse = np.unique(available, axis=1, return_inverse=True)
+        for k in range(pattern.shape[1]):
+            line = np.flatnonzero(pattern[:, k])
+            adjacency = sparse.csr_matrix((np.ones(line.shape[0]), (self.index.line_from[line], self.index.line_to[line])),
+                                          shape=(self.number_bus, self.number_bus))
+            _, component = csgraph.connected_components(adjacency, directed=False)
+            upper[inverse.ravel() == k] = self.load_P[np.isin(component, component[self.root])].sum()
+
+        return upper
+
+
+    def get_path_matrix(self, closed):
+        """
+        get the trees of closed lines connected to a source, rooted at the substation or else at the first
+        generator bus of the island
+        :return: connected buses in breadth-first order of each tree, and the sparse (line, bus) matrix
+                 whose entry is one if the line is on the path from the root to the bus
+        """
+        line = np.flatnonzero(closed)
+        adjacency = sparse.csr_matrix((np.ones(line.shape[0]), (self.index.line_from[line], self.index.line_to[line])),
+                                      shape=(self.number_bus, self.number_bus))
+        _, component = csgraph.connected_components(adjacency, directed=False)
+        root = self.root[np.unique(component[self.root], return_index=True)[1]]
+
+        ## parent bus of each bus, -1 for the roots and the buses not connected to a source
+        order = []
+        parent = np.full(self.number_bus, -1, dtype=int)
+        for r in root:
+            tree, predecessor = csgraph.breadth_first_order(adjacency, r, directed=False)
+            parent[tree[1:]] = predecessor[tree[1:]]
+            order.append(tree)
+        order = np.concatenate(order)
+        child = order[parent[order] >= 0]
+        if child.shape[0] == 0:
+            return order, sparse.csr_matrix((self.number_line, self.number_bus))
+
+        ## line between each bus and its parent bus
+        parent_line = np.full(self.number_bus, -1, dtype=int)
+        f_bus, t_bus = self.index.line_from[line], self.index.line_to[line]
+        down = parent[t_bus] == f_bus
+        up = parent[f_bus] == t_bus
+        parent_line[t_bus[down]] = line[down]
+        parent_line[f_bus[up]] = line[up]
+
+        ## walk up from every bus to its root
+        row = []
+        col = []
+        current = child.copy()
+        bus = child.copy()
+        while current.shape[0] > 0:
+            row.append(parent_line[current])
+            col.append(bus)
+            current = parent[current]
+            keep = parent[current] >= 0
+            current = current[keep]
+            bus = bus[keep]
+        row = np.concatenate(row)
+        col = np.concatenate(col)
+        path = sparse.csr_matrix((np.ones(row.shape[0]), (row, col)), shape=(self.number_line, self.number_bus))
+
+        return order, path
+
+
+    def is_feasible(self, picked, path, connected):
+        """
+        check line flow and voltage limits of the linearized DistFlow model for the picked loads
+        """
+        P = path.dot(picked * self.load_P)
+        Q = path.dot(picked * self.load_Q)
+        if np.any(np.abs(P) > self.Pmax + 1e-9) or np.any(np.abs(Q) > self.Qmax + 1e-9):
+            return False
+
+        V = self.Voltage_Substation - path.T.dot((self.R * P + self.X * Q) / self.Voltage_Substation)
+        V = V[connected]
+        return bool(np.all(V >= 1 - self.Voltage_Variation - 1e-9) and np.all(V <= 1 + self.Voltage_Variation + 1e-9))
+
+
+    def get_lower_bound(self, available):
+        """
+        load picked up by time step by a feasible radial restoration plan
+        Closed lines and picked-up loads are never released, and a damaged line is only closed
+        from the step after which it stays available, so the plan meets the monotone status constraints
+        """
+        idx = self.index
+        T = available.shape[1]
+        lower = np.zeros(T)
+
+        ## a line can be closed at step t if it is available at every step from t on
+        usable = np.minimum.accumulate(available[:, ::-1], axis=1)[:, ::-1]
+
+        closed = np.zeros(self.number_line, dtype=bool)
+        closed[idx.line_static] = True
+        connected = np.isin(self.island, self.island[self.root])
+        picked = np.zeros(self.number_bus, dtype=bool)
+        checked = np.zeros(self.number_bus, dtype=bool)
+        order, path = self.get_path_matrix(closed)
+
+        for t in range(T):
+            ## attach the island with the largest load through a usable line until no island can be reached,
+            ## among the lines reaching that island use the one electrically closest to the substation
+            while True:
+                line = np.flatnonzero(usable[:, t] & ~closed & (connected[idx.line_from] != connected[idx.line_to]))
+                if line.shape[0] == 0:
+                    break
+                inside = np.where(connected[idx.line_from[line]], idx.line_from[line], idx.line_to[line])
+                outside = np.where(connected[idx.line_from[line]], idx.line_to[line], idx.line_from[line])
+                resistance = path.T.dot(self.R)[inside] + self.R[line]
+                k = np.lexsort((resistance, -self.island_load[self.island[outside]]))[0]
+                closed[line[k]] = True
+                connected[self.island == self.island[outside[k]]] = True
+                order, path = self.get_path_matrix(closed)
+
+            ## pick up newly connected loads in breadth-first order, try all of them at once first
+            candidate = order[~checked[order]]
+            checked[candidate] = True
+            if candidate.shape[0] > 0:
+                trial = picked.copy()
+                trial[candidate] = True
+                if self.is_feasible(trial, path, connected):
+                    picked = trial
+                else:
+                    for b in candidate:
+                        picked[b] = True
+                        if not self.is_feasible(picked, path, connected):
+                            picked[b] = False
+
+            lower[t] = self.load_P[picked].sum()
+
+        return lower
+
+
+    def evaluate(self, repair_status):
+        """
+        get the upper and lower bounds of the restored load by time step for a repair schedule
+        :param repair_status: array of (vertex, time) or dictionary of vertex name to a list over time, e.g. z or Line_bin
+        :return: upper, lower
+        """
+        available = self.get_line_availability(repair_status)
+        return self.get_upper_bound(available), self.get_lower_bound(available)
+
 
 
 
@@ -125,6 +1478,22 @@ class SolutionDict(OrderedDict):
     Solution dictionary struture: D[name key]=time series data
     """
 
+    @classmethod
+    def from_array(cls, array, NameKey, SolDict=None):
+        """
+        get a solution dictionary of the rows of an array, e.g. from get_solution_array, without copying:
+        the time series are views of the array, which is kept in SolDict.array
+        :param NameKey: name key of each row
+        :param SolDict: solution dictionary the rows are added to, a new one if None
+        """
+        if SolDict is None:
+            SolDict = cls()
+        for k, i in enumerate(NameKey):
+            SolDict[i] = array[k]
+        SolDict.array = array
+        return SolDict
+
+
     def plot_2d(self, x_str='Time', y_str='Value', title_str='Results', figsize=(15,7), legendlist=None):
         """step plot"""
         plt.figure(figsize=figsize)
@@ -175,34 +1544,104 @@ class SolutionDict(OrderedDict):
         plt.show()
 
 
-    def plot_bin_2d(self, x_str='Time', y_str='Value', title_str='Results', figsize=(15,7)):
-        """step plot"""
-        plt.figure(figsize=figsize)
+    def plot_bin_2d(self, x_str='Time', y_str='Value', title_str='Results', figsize=(15,7), filename=None):
+        """
+        binary status plot, one image of the name key x time status matrix
+        :param filename: file the figure is saved to instead of being shown, the format is given by its extension
+        """
+        fig, ax = plt.subplots(figsize=figsize)
+        plot_status(ax, self.get_matrix(), list(self.keys()), x_str, y_str, title_str)
+        if filename is None:
+            plt.show()
+        else:
+            fig.savefig(filename)
+            plt.close(fig)
 
-        ## get key list
-        key_list = []
-        for i in self.keys():
-            key_list.append(i)
 
-        ## assume that all variables have the same time vector
-        total_time = len(self[key_list[0]])
+    def get_matrix(self):
+        """
+        get the time series of all name keys as a (name key, time) array
+        """
+        return np.array([np.asarray(self[i], dtype=float) for i in self.keys()])
 
-        y_axis = np.arange(0, len(key_list))
-        k = 0
-        for i in key_list:
-            for t in range(0, total_time):
-                if abs(self[i][t]) <= 0.01:
-                    plt.scatter(t, y_axis[k], c='red', s=50, alpha=0.5, edgecolors='none')
-                else:
-                    plt.scatter(t, y_axis[k], c='green', s=50, alpha=0.5, edgecolors='none')
-            k = k + 1
-        plt.yticks(y_axis, key_list)
-        plt.show()
-        plt.title(title_str)
-        plt.xlabel(x_str)
-        plt.ylabel(y_str)
 
 
 
+## colours of the off and on status, drawn with alpha 0.5 as the former scatter plots
+STATUS_COLOR = ['red', 'green']
+STATUS_ALPHA = 0.5
+## a status is off if its absolute value is at most the threshold
+STATUS_THRESHOLD = 0.01
+## largest number of row labels of a status plot, larger matrices label every k-th row
+MAX_STATUS_LABEL = 60
+
+
+
+def plot_status(ax, status, row_label, x_str='Time (step)', y_str='Index', title_str='Results', threshold=STATUS_THRESHOLD):
+    """
+    draw a (component, time) status matrix as one image, off in red and on in green, so the drawing time does not
+    depend on the number of cells
+    :param ax: matplotlib axes
+    :param status: array-like of (component, time), a value is off if its absolute value is at most threshold
+    :param row_label: label of each component, row k is drawn at y = k as in the scatter plots
+    :return: the image
+    """
+    from matplotlib.colors import ListedColormap
+
+    status = np.abs(np.asarray(status, dtype=float)) > threshold
+    image = ax.imshow(status, cmap=ListedColormap(STATUS_COLOR), vmin=0, vmax=1, alpha=STATUS_ALPHA, aspect='auto',
+                      interpolation='nearest', origin='lower')
+    step = max(1, int(math.ceil(len(row_label) / float(MAX_STATUS_LABEL))))
+    ax.set_yticks(np.arange(0, len(row_label), step))
+    ax.set_yticklabels(list(row_label)[::step])
+    ax.set_title(title_str)
+    ax.set_xlabel(x_str)
+    ax.set_ylabel(y_str)
+    return image
+
+
+
+def export_status(scenario, directory, row_label=None, fmt=('png',), x_str='Time (step)', y_str='Index',
+                  title_str='{}', figsize=(15,7), dpi=100):
+    """
+    save the status plots of many scenarios without a display, e.g. the load status of each damage scenario
+    The figure is drawn by the Agg canvas outside pyplot and reused: the image data of a scenario of the same shape
+    as the previous one is replaced instead of drawing the axes again.
+    :param scenario: OrderedDict of scenario name to status, a SolutionDict or an array of (component, time)
+    :param directory: directory of the files <scenario name>.<format>
+    :param row_label: label of each component, the name keys of a SolutionDict or the row numbers if None
+    :param fmt: file formats, e.g. ('png', 'svg')
+    :param title_str: title format, given the scenario name
+    :return: list of the files
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    image, label, files = None, None, []
+    for name, status in scenario.items():
+        if isinstance(status, SolutionDict):
+            status_label = list(status.keys()) if row_label is None else row_label
+            status = status.get_matrix()
+        else:
+            status = np.asarray(status, dtype=float)
+            status_label = list(range(status.shape[0])) if row_label is None else row_label
+
+        if image is not None and image.get_array().shape == status.shape and label == status_label:
+            image.set_data(np.abs(status) > STATUS_THRESHOLD)
+            ax.set_title(title_str.format(name))
+        else:
+            ax.clear()
+            image = plot_status(ax, status, status_label, x_str, y_str, title_str.format(name))
+            label = status_label
 
+        for f in fmt:
+            files.append(os.path.join(directory, '{}.{}'.format(name, f)))
+            fig.savefig(files[-1], format=f)
 
+    return files
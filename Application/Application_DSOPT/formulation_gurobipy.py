@@ -1,22 +1,18 @@
 import sys
 import os
 import time
-import pandas as pd
 import numpy as np
 import math
-import sympy as sy
-import matplotlib
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-import os
-import ast
-import networkx as nx
 import operator
+import itertools
 from collections import OrderedDict
 
 import gurobipy as gb
 from formulation_general import *
 
+plt = LazyModule('matplotlib.pyplot')
+nx = LazyModule('networkx')
+
 
 class OutageManageGurobi(OutageManage):
     """
@@ -34,6 +30,15 @@ class OutageManageGurobi(OutageManage):
 
 
 
+    def get_model_size(self):
+        if getattr(self, 'in_callback', False):
+            return (None, None, None)
+        self.model.update()
+        return (self.model.NumVars, self.model.NumConstrs, self.model.NumNZs)
+
+
+
+    @profile('form')
     def form_crew_dispatch(self, Route_Example=None):
         """
         formulate crew dispatch problem
@@ -44,7 +49,7 @@ class OutageManageGurobi(OutageManage):
         vrp = self.vrp
 
         # # define variables
-        self.AT = self.model.addVars(self.iter_crew, self.ordered_vertex, lb=0, ub=100, vtype=gb.GRB.CONTINUOUS, name='AT')
+        self.AT = self.model.addVars(self.iter_crew, self.ordered_vertex, lb=0, vtype=gb.GRB.CONTINUOUS, name='AT')
         self.f = self.model.addVars(self.ordered_vertex, self.iter_time, vtype=gb.GRB.BINARY, name='f')
         self.x = self.model.addVars(self.iter_crew, self.ordered_vertex, self.ordered_vertex, vtype=gb.GRB.BINARY, name='x')
         self.y = self.model.addVars(self.iter_crew, self.ordered_vertex, vtype=gb.GRB.BINARY, name='y')
@@ -91,13 +96,22 @@ class OutageManageGurobi(OutageManage):
                         self.AT[c, m] + vrp['repair'][c][m] + vrp['travel'][m][n] <= self.AT[c, n]
                         + (1 - self.x[c, m, n]) * self.BigM)
 
-        # # 40-42: the time a damaged component is repaired
+        # # cumulative encoding: g[m, t] is the sum of f[m, tau] for tau <= t, linked step by step
+        if self.Repair_Encoding == 'cumulative':
+            self.g = self.model.addVars(self.ordered_vertex, self.iter_time, lb=0, ub=1, vtype=gb.GRB.CONTINUOUS, name='g')
+
+        # # 40-42: the time a damaged component is repaired, on the time grid the repair finishes in the time steps
+        # # (time_point[t - 1], time_point[t]] of the time index t with f[m, t] = 1
         for m in self.iter_vertex:
-            self.model.addConstr(sum(self.f[m, t] for t in self.iter_time) == 1)
-            self.model.addConstr(sum(t * self.f[m, t] for t in self.iter_time) >=
-                                 sum(self.AT[c, m] + vrp['repair'][c][m] * self.y[c, m] for c in self.iter_crew))
-            self.model.addConstr(sum(t * self.f[m, t] for t in self.iter_time) <=
-                                 sum(self.AT[c, m]+ vrp['repair'][c][m] * self.y[c, m] for c in self.iter_crew) + 1 - self.epsilon)
+            repair_time = gb.quicksum(self.time_point[t] * self.f[m, t] for t in self.iter_time)
+            repair_start = gb.quicksum((self.time_point[t] - self.time_weight[t] + 1) * self.f[m, t] for t in self.iter_time)
+            finish_time = gb.quicksum(self.AT[c, m] + vrp['repair'][c][m] * self.y[c, m] for c in self.iter_crew)
+            if self.Repair_Encoding == 'cumulative':
+                self.model.addConstr(self.g[m, self.iter_time[-1]] == 1)
+            else:
+                self.model.addConstr(sum(self.f[m, t] for t in self.iter_time) == 1)
+            self.model.addConstr(repair_time >= finish_time)
+            self.model.addConstr(repair_start <= finish_time + 1 - self.epsilon)
 
         # # 43 If the damaged component is not repaired by a crew c then the arrival time and repair time
         # # for this crew should not affect constraints (41) and (42), which is realized by using constraint (43)
@@ -106,12 +120,23 @@ class OutageManageGurobi(OutageManage):
                 self.model.addConstr(self.AT[c, m] <= self.y[c, m] * self.BigM)
 
         # # 44 indicates that the restored component becomes available in all subsequent time periods
-        for t in self.iter_time:
-            for m in self.iter_vertex:
-                self.model.addConstr(self.z[m, t] <= sum(self.f[m, tau] for tau in np.arange(0, t)))
+        if self.Repair_Encoding == 'cumulative':
+            for t in self.iter_time:
+                for m in self.iter_vertex:
+                    if t == self.iter_time[0]:
+                        self.model.addConstr(self.g[m, t] == self.f[m, t])
+                        self.model.addConstr(self.z[m, t] <= 0)
+                    else:
+                        self.model.addConstr(self.g[m, t] == self.g[m, t - 1] + self.f[m, t])
+                        self.model.addConstr(self.z[m, t] <= self.g[m, t - 1])
+        else:
+            for t in self.iter_time:
+                for m in self.iter_vertex:
+                    self.model.addConstr(self.z[m, t] <= sum(self.f[m, tau] for tau in np.arange(0, t)))
 
 
 
+    @profile('form')
     def form_coupling(self):
         """
         Coupling: line availability and repairing indicator
@@ -123,6 +148,7 @@ class OutageManageGurobi(OutageManage):
 
 
 
+    @profile('form')
     def form_network_operation(self):
         """
         Define variables for convex optimization problems
@@ -138,7 +164,7 @@ class OutageManageGurobi(OutageManage):
         self.V = self.model.addVars(self.iter_bus, self.iter_time, lb=0, ub=1.5, vtype=gb.GRB.CONTINUOUS, name='V')
         self.rho = self.model.addVars(self.iter_bus, self.iter_time, vtype=gb.GRB.BINARY, name='rho')
         self.ul = self.model.addVars(self.iter_line, self.iter_time, vtype=gb.GRB.BINARY, name='ul')
-        self.beta = self.model.addVars(self.iter_bus, self.iter_bus, self.iter_time, vtype=gb.GRB.BINARY, name='beta')
+        self.beta = self.model.addVars(self.iter_line, self.iter_orientation, self.iter_time, vtype=gb.GRB.BINARY, name='beta')
 
         # ------------------ Notes -----------------
         # It is important to define the bound in gurobi-py
@@ -146,12 +172,14 @@ class OutageManageGurobi(OutageManage):
         # So for negative values, it is important to define the lower bound, as in this case, the line flow.
         # Bound for variables in "addVars" together with vtype define types like NonNegativeReals
 
+        idx = self.index
+        bus = self.iter_bus
+        line = self.iter_line
+        gen = self.iter_gen
+
         # # Line flow limits
         for t in self.iter_time:
-            for i in self.iter_line:
-                # get the matrix index from the component name
-                id = int(i[i.find('_') + 1:]) - 1
-
+            for id, i in enumerate(line):
                 self.model.addConstr(self.P[i, t] <= self.ul[i, t] * ppc['line'][id, 5], name='line_upper_P_' + i)
                 self.model.addConstr(self.P[i, t] >= -self.ul[i, t] * ppc['line'][id, 5], name='line_lower_P_' + i)
                 self.model.addConstr(self.Q[i, t] <= self.ul[i, t] * ppc['line'][id, 6], name='line_upper_Q_' + i)
@@ -160,7 +188,7 @@ class OutageManageGurobi(OutageManage):
         # # Voltage limits
         for t in self.iter_time:
             for i in self.iter_bus:
-                if i == 'bus_1':
+                if i == bus[idx.substation]:
                     self.model.addConstr(self.V[i, t] == self.Voltage_Substation, name='Voltage_substation')
                 else:
                     self.model.addConstr(self.V[i, t] >= 1 - self.Voltage_Variation, name='Voltage_upper_' + i)
@@ -168,88 +196,54 @@ class OutageManageGurobi(OutageManage):
 
         # # Power balance at bus i
         for t in self.iter_time:
-            for i in self.iter_bus:
-
-                P_out = 0
-                Q_out = 0
-                P_in = 0
-                Q_in = 0
-
-                # get the matrix index from the component name
-                id = int(i[i.find('_') + 1:]) - 1
-
-                # get power flow variables flowing out from this bus
-                iter_out = np.arange(0, len(self.bus_line[i]["line_from_this_bus"]))
-
-                if iter_out.shape[0] == 0:
-                    P_out = P_out
-                    Q_out = Q_out
-                else:
-                    for k in iter_out:
-                        P_out = P_out + self.P['line_{}'.format(self.bus_line[i]["line_from_this_bus"][k]), t]
-                        Q_out = Q_out + self.Q['line_{}'.format(self.bus_line[i]["line_from_this_bus"][k]), t]
-
-                # get power flow variables flowing into from this bus
-                iter_in = np.arange(0, len(self.bus_line[i]["line_to_this_bus"]))
-
-                if iter_in.shape[0] == 0:
-                    P_in = P_in
-                    Q_in = Q_in
-                else:
-                    for k in iter_in:
-                        P_in = P_in + self.P['line_{}'.format(self.bus_line[i]["line_to_this_bus"][k]), t]
-                        Q_in = Q_in + self.Q['line_{}'.format(self.bus_line[i]["line_to_this_bus"][k]), t]
+            for id, i in enumerate(bus):
+                # get power flow variables flowing out from and into this bus
+                P_out = gb.quicksum(self.P[line[k], t] for k in idx.bus_line_out[id])
+                Q_out = gb.quicksum(self.Q[line[k], t] for k in idx.bus_line_out[id])
+                P_in = gb.quicksum(self.P[line[k], t] for k in idx.bus_line_in[id])
+                Q_in = gb.quicksum(self.Q[line[k], t] for k in idx.bus_line_in[id])
 
                 # if this is a bus with generation capability and load, the power flow balance is
-                if ppc['bus'][id, 1] == 1:
+                if idx.bus_gen[id] >= 0:
                     self.model.addConstr(
-                        P_in + self.p['gen_{}'.format(self.bus_gen[i][0]), t] == P_out + ppc['bus'][id, 4] * self.rho[i, t],
+                        P_in + self.p[gen[idx.bus_gen[id]], t] == P_out + idx.bus_load_P[id] * self.rho[i, t],
                         name='Power_balance_P_' + i)
                     self.model.addConstr(
-                        Q_in + self.q['gen_{}'.format(self.bus_gen[i][0]), t] == Q_out + ppc['bus'][id, 5] * self.rho[i, t],
+                        Q_in + self.q[gen[idx.bus_gen[id]], t] == Q_out + idx.bus_load_Q[id] * self.rho[i, t],
                         name='Power_balance_Q_' + i)
 
                 # if this is a bus with only load
                 else:
-                    self.model.addConstr(P_in == P_out + ppc['bus'][id, 4] * self.rho[i, t], name='Power_balance_P_' + i)
-                    self.model.addConstr(Q_in == Q_out + ppc['bus'][id, 5] * self.rho[i, t], name='Power_balance_Q_' + i)
+                    self.model.addConstr(P_in == P_out + idx.bus_load_P[id] * self.rho[i, t], name='Power_balance_P_' + i)
+                    self.model.addConstr(Q_in == Q_out + idx.bus_load_Q[id] * self.rho[i, t], name='Power_balance_Q_' + i)
 
         # # Voltage drop along line k
         for t in self.iter_time:
-            for i in self.iter_line:
-                # get the matrix index from the component name
-                id = int(i[i.find('_') + 1:]) - 1
+            for id, i in enumerate(line):
+                # for this line, get the bus name
+                f_bus = bus[idx.line_from[id]]
+                t_bus = bus[idx.line_to[id]]
 
-                # for this line, get the bus index
-                f_bus = int(ppc['line'][id, 1])
-                t_bus = int(ppc['line'][id, 2])
-
-                self.model.addConstr(self.V['bus_{}'.format(t_bus), t] - self.V['bus_{}'.format(f_bus), t]
+                self.model.addConstr(self.V[t_bus, t] - self.V[f_bus, t]
                                      + (ppc['line'][id, 3] * self.P[i, t] + ppc['line'][id, 4] * self.Q[i, t]) / self.Voltage_Substation >= -(1 - self.ul[i, t]) * self.BigM)
-                self.model.addConstr(self.V['bus_{}'.format(t_bus), t] - self.V['bus_{}'.format(f_bus), t]
+                self.model.addConstr(self.V[t_bus, t] - self.V[f_bus, t]
                                      + (ppc['line'][id, 3] * self.P[i, t] + ppc['line'][id, 4] * self.Q[i, t]) / self.Voltage_Substation <= (1 - self.ul[i, t]) * self.BigM)
 
         # # substation bus does not have parent bus
         for t in self.iter_time:
-            self.model.addConstr(self.beta['bus_2', 'bus_1', t] == 0)  # hard coded
+            for k, o in idx.bus_arc_in[idx.substation]:
+                self.model.addConstr(self.beta[line[k], o, t] == 0)
 
         # # each bus will only at least have one parent bus
         for t in self.iter_time:
-            for j in self.iter_bus:
-                # model_flow.addConstr(beta.sum('*', j, t) <= 1)
-                self.model.addConstr(sum(self.beta[i, j, t] for i in self.iter_bus) <= 1)
+            for id in range(self.number_bus):
+                if len(idx.bus_arc_in[id]) > 0:
+                    self.model.addConstr(gb.quicksum(self.beta[line[k], o, t] for k, o in idx.bus_arc_in[id]) <= 1)
 
+        # # a closed line has exactly one orientation
         for t in self.iter_time:
-            for i in self.iter_line:
-                # get the matrix index from the component name
-                id = int(i[i.find('_') + 1:]) - 1
-
-                # for this line, get the bus index
-                f_bus = int(ppc['line'][id, 1])
-                t_bus = int(ppc['line'][id, 2])
-
-                self.model.addConstr(self.beta['bus_{}'.format(f_bus), 'bus_{}'.format(t_bus), t]
-                                     + self.beta['bus_{}'.format(t_bus), 'bus_{}'.format(f_bus), t] == self.ul[i, t])
+            for i in line:
+                self.model.addConstr(self.beta[i, 0, t] + self.beta[i, 1, t] == self.ul[i, t])
 
         # # Static lines cannot change
         for t in self.iter_time:
@@ -268,6 +262,7 @@ class OutageManageGurobi(OutageManage):
 
 
 
+    @profile('form')
     def form_network_operation_int(self):
         """
         Define a simplified network optimization using pure integer program
@@ -280,7 +275,7 @@ class OutageManageGurobi(OutageManage):
         self.P = self.model.addVars(self.iter_line, self.iter_time, lb=-500, ub=500, vtype=gb.GRB.INTEGER, name='P')
         self.rho = self.model.addVars(self.iter_bus, self.iter_time, vtype=gb.GRB.BINARY, name='rho')
         self.ul = self.model.addVars(self.iter_line, self.iter_time, vtype=gb.GRB.BINARY, name='ul')
-        self.beta = self.model.addVars(self.iter_bus, self.iter_bus, self.iter_time, vtype=gb.GRB.BINARY, name='beta')
+        self.beta = self.model.addVars(self.iter_line, self.iter_orientation, self.iter_time, vtype=gb.GRB.BINARY, name='beta')
 
         # ------------------ Notes -----------------
         # It is important to define the bound in gurobi-py
@@ -288,44 +283,27 @@ class OutageManageGurobi(OutageManage):
         # So for negative values, it is important to define the lower bound, as in this case, the line flow.
         # Bound for variables in "addVars" together with vtype define types like NonNegativeReals
 
+        idx = self.index
+        bus = self.iter_bus
+        line = self.iter_line
+        gen = self.iter_gen
+
         # # Line flow limits
         for t in self.iter_time:
-            for i in self.iter_line:
-                id = int(i[i.find('_') + 1:]) - 1 # get the matrix index from the component name
+            for i in line:
                 self.model.addConstr(self.P[i, t] <= self.ul[i, t] * 1000)
                 self.model.addConstr(self.P[i, t] >= -self.ul[i, t] * 1000)
 
         # # Power balance at bus i
         for t in self.iter_time:
-            for i in self.iter_bus:
-                P_out = 0
-                P_in = 0
-
-                # # get the matrix index from the component name
-                id = int(i[i.find('_') + 1:]) - 1
-
-                # # get power flow variables flowing out from this bus
-                iter_out = np.arange(0, len(self.bus_line[i]["line_from_this_bus"]))
-
-                if iter_out.shape[0] == 0:
-                    P_out = P_out
-                else:
-                    for k in iter_out:
-                        P_out = P_out + self.P['line_{}'.format(self.bus_line[i]["line_from_this_bus"][k]), t]
-
-                # # get power flow variables flowing into from this bus
-                iter_in = np.arange(0, len(self.bus_line[i]["line_to_this_bus"]))
-
-                if iter_in.shape[0] == 0:
-                    P_in = P_in
-                else:
-                    for k in iter_in:
-                        P_in = P_in + self.P['line_{}'.format(self.bus_line[i]["line_to_this_bus"][k]), t]
+            for id, i in enumerate(bus):
+                # # get power flow variables flowing out from and into this bus
+                P_out = gb.quicksum(self.P[line[k], t] for k in idx.bus_line_out[id])
+                P_in = gb.quicksum(self.P[line[k], t] for k in idx.bus_line_in[id])
 
                 # # if this is a bus with generation capability and load, the power flow balance is
-                if ppc['bus'][id, 1] == 1:
-                    self.model.addConstr(
-                        P_in + self.p['gen_{}'.format(self.bus_gen[i][0]), t] == P_out + self.rho[i, t],)
+                if idx.bus_gen[id] >= 0:
+                    self.model.addConstr(P_in + self.p[gen[idx.bus_gen[id]], t] == P_out + self.rho[i, t])
 
                 # # if this is a bus with only load
                 else:
@@ -334,25 +312,19 @@ class OutageManageGurobi(OutageManage):
 
         # # substation bus does not have parent bus
         for t in self.iter_time:
-            self.model.addConstr(self.beta['bus_2', 'bus_1', t] == 0)  # hard coded
+            for k, o in idx.bus_arc_in[idx.substation]:
+                self.model.addConstr(self.beta[line[k], o, t] == 0)
 
         # # each bus will only at least have one parent bus
         for t in self.iter_time:
-            for j in self.iter_bus:
-                # model_flow.addConstr(beta.sum('*', j, t) <= 1)
-                self.model.addConstr(sum(self.beta[i, j, t] for i in self.iter_bus) <= 1)
+            for id in range(self.number_bus):
+                if len(idx.bus_arc_in[id]) > 0:
+                    self.model.addConstr(gb.quicksum(self.beta[line[k], o, t] for k, o in idx.bus_arc_in[id]) <= 1)
 
+        # # a closed line has exactly one orientation
         for t in self.iter_time:
-            for i in self.iter_line:
-                # get the matrix index from the component name
-                id = int(i[i.find('_') + 1:]) - 1
-
-                # for this line, get the bus index
-                f_bus = int(ppc['line'][id, 1])
-                t_bus = int(ppc['line'][id, 2])
-
-                self.model.addConstr(self.beta['bus_{}'.format(f_bus), 'bus_{}'.format(t_bus), t]
-                                     + self.beta['bus_{}'.format(t_bus), 'bus_{}'.format(f_bus), t] == self.ul[i, t])
+            for i in line:
+                self.model.addConstr(self.beta[i, 0, t] + self.beta[i, 1, t] == self.ul[i, t])
 
         # # Static lines cannot change
         for t in self.iter_time:
@@ -371,6 +343,7 @@ class OutageManageGurobi(OutageManage):
 
 
 
+    @profile('form')
     def define_objective(self):
         """
         maximize the load pickup
@@ -380,9 +353,8 @@ class OutageManageGurobi(OutageManage):
 
         obj = 0
         for t in self.iter_time:
-            for i in self.iter_bus:
-                id = int(i[i.find('_') + 1:]) - 1 # get the matrix index from the component name
-                obj = obj + self.rho[i, t] * self.ppc['bus'][id, 4] * self.BasePower
+            for id, i in enumerate(self.iter_bus):
+                obj = obj + self.rho[i, t] * self.index.bus_load_P[id] * self.time_weight[t] * self.BasePower
 
         self.model.addConstr(self.ObjVar == obj)
 
@@ -418,6 +390,28 @@ class OutageManageGurobi(OutageManage):
 
 
 
+    def get_solution_family(self, VariableName):
+        """
+        the variables of a family are gathered once in the order of their index sets and queried in one call
+        """
+        variable = operator.attrgetter(VariableName)(self)
+        if not hasattr(self, 'SolutionFamily'):
+            self.SolutionFamily = OrderedDict()
+        if VariableName not in self.SolutionFamily or self.SolutionFamily[VariableName][0] is not variable:
+            keys = [k if isinstance(k, tuple) else (k,) for k in variable.keys()]
+            sets = [list(OrderedDict.fromkeys(k[d] for k in keys)) for d in range(len(keys[0]))]
+            shape = tuple(len(k) for k in sets)
+            if len(keys) != int(np.prod(shape)):
+                raise ValueError('the index of {} is not a full product of its index sets'.format(VariableName))
+            key = itertools.product(*sets) if len(sets) > 1 else sets[0]
+            self.SolutionFamily[VariableName] = (variable, [variable[k] for k in key], sets, shape)
+
+        _, VarList, sets, shape = self.SolutionFamily[VariableName]
+        return np.reshape(np.asarray(self.get_value(VarList), dtype=float), shape), sets
+
+
+
+    @profile('extract')
     def get_solution_2d(self, VariableName, NameKey, ListIndex, SolDict=None):
         """
         get solution and store into a one name key structured dictionary
@@ -427,26 +421,15 @@ class OutageManageGurobi(OutageManage):
         :param SolDict: dictionary object with plot methods
         :return: SolDict
         """
-        if SolDict == None:
-            SolDict = SolutionDict()
-        else:
-            pass
-
-        # # get string type attribute name
-        variable = operator.attrgetter(VariableName)(self)
-
-        for i in NameKey:
-            SolDict[i] = []
-            for j in ListIndex:
-                SolDict[i].append(variable[i, j].x)
-
-        return SolDict
+        value = self.get_solution_array(VariableName, NameKey, ListIndex)
+        return SolutionDict.from_array(value, NameKey, SolDict)
 
 
 
+    @profile('extract')
     def get_solution_3d(self, VariableName, NameKey, ListIndex1, ListIndex2, SolDict=None):
         """
-        get solution and store into a one name key structured dictionary
+        get solution and store into a two name key structured dictionary
         :param VariableName: variable name in string format
         :param NameKey: desired key set in list or range format that you would like to retrieve
         :param ListIndex: desired index range in list format that you would like to retrieve
@@ -458,35 +441,33 @@ class OutageManageGurobi(OutageManage):
         else:
             pass
 
-        # # get string type attribute name
-        variable = operator.attrgetter(VariableName)(self)
-
-        for i in NameKey:
-            SolDict[i] = []
-            for j in ListIndex1:
-                SolDict[j] = []
-                for k in ListIndex2:
-                    SolDict[i][j].append(variable[i, j, k].x)
+        value = self.get_solution_array(VariableName, NameKey, ListIndex1, ListIndex2)
+        for k, i in enumerate(NameKey):
+            SolDict[i] = SolutionDict.from_array(value[k], ListIndex1)
+        SolDict.array = value
 
         return SolDict
 
 
 
+    @profile('extract')
     def get_solution_route(self):
         """
         get crew dispatch route and plot
         """
         vrp = self.vrp
 
+        value = self.get_solution_array('x', self.iter_crew, self.ordered_vertex, self.ordered_vertex)
+
         SolDict = OrderedDict()
-        for c in self.iter_crew:
+        for k, c in enumerate(self.iter_crew):
             SolDict[c] = OrderedDict()
             SolDict[c]['x'] = OrderedDict()
             SolDict[c]['route'] = []
-            for i in self.ordered_vertex:
-                for j in self.ordered_vertex:
-                    SolDict[c]['x'][i, j] = self.x[c, i, j].x
-                    if self.x[c, i, j].x == 1:
+            for i_row, i in enumerate(self.ordered_vertex):
+                for j_row, j in enumerate(self.ordered_vertex):
+                    SolDict[c]['x'][i, j] = value[k, i_row, j_row]
+                    if round(value[k, i_row, j_row]) == 1:
                         SolDict[c]['route'].append((i, j))
 
         # # hard coded for single crew plot
@@ -500,6 +481,7 @@ class OutageManageGurobi(OutageManage):
 
 
 
+    @profile('form')
     def form_cop(self):
         """
         formulate the co-optimization problem in MIP
@@ -513,6 +495,7 @@ class OutageManageGurobi(OutageManage):
 
 
 
+    @profile('form')
     def form_mp(self):
         """
         formulate the master problem in MIP
@@ -526,6 +509,7 @@ class OutageManageGurobi(OutageManage):
 
 
 
+    @profile('form')
     def form_sp(self):
         """
         formulate the subproblem in MIP
@@ -537,6 +521,181 @@ class OutageManageGurobi(OutageManage):
 
 
 
+    @profile('solve')
+    def solve_problem(self, callback=None):
+        """
+        solve the model
+        :param callback: function called at each new incumbent solution with lazy constraints enabled,
+                         the solution getters and add_benders_cut work on the incumbent inside the callback
+        """
+        if callback is None:
+            self.model.optimize()
+        else:
+            self.model.Params.LazyConstraints = 1
+
+            def incumbent(model, where):
+                if where == gb.GRB.Callback.MIPSOL:
+                    self.in_callback = True
+                    callback()
+                    self.in_callback = False
+
+            self.model.optimize(incumbent)
+
+
+
+    def get_value(self, variables):
+        """
+        get the values of a list of variables from the solution, from the incumbent inside a callback
+        or from the solution of the pool given by solution_number
+        """
+        if getattr(self, 'in_callback', False):
+            return self.model.cbGetSolution(variables)
+        elif getattr(self, 'solution_number', None) is not None:
+            return self.model.getAttr('Xn', variables)
+        else:
+            return self.model.getAttr('X', variables)
+
+
+
+    def get_objective(self):
+        return self.get_value([self.ObjVar])[0]
+
+
+
+    @profile('extract')
+    def get_route(self):
+        value, sets = self.get_solution_family('x')
+        return tuple((sets[0][k], sets[1][i], sets[2][j]) for k, i, j in np.argwhere(value > 0.5))
+
+
+
+    @profile('extract')
+    def get_repair_status(self):
+        return self.get_solution_array('z', self.ordered_vertex, self.iter_time)
+
+
+
+    @profile('extract')
+    def get_candidates(self, number=1):
+        """
+        get the best solutions of the solution pool, only the incumbent inside a callback
+        """
+        if getattr(self, 'in_callback', False):
+            return [(self.get_route(), self.get_repair_status())]
+
+        candidates = []
+        for k in range(min(number, self.model.SolCount)):
+            self.model.Params.SolutionNumber = k
+            self.solution_number = k
+            candidates.append((self.get_route(), self.get_repair_status()))
+        self.solution_number = None
+        return candidates
+
+
+
+    @profile('update')
+    def set_repair_schedule(self, repair_status):
+        """
+        damaged line cannot function before it is repaired, only the upper bounds of the damaged line status change
+        so that the re-solve keeps the model and starts from the previous solution
+        """
+        if not hasattr(self, 'RepairVar'):
+            self.RepairVar = [self.ul[self.iter_line[id_line], t] for id_line in self.index.damaged_line for t in self.iter_time]
+            self.model.update()
+            self.RepairBound = np.array(self.model.getAttr('UB', self.RepairVar))
+
+        repair_status = np.asarray(repair_status, dtype=float)[self.index.damaged_vertex].ravel()
+        self.model.setAttr('UB', self.RepairVar, list(np.minimum(self.RepairBound, repair_status)))
+
+
+
+    @profile('extract')
+    def get_network_status(self):
+        return (self.get_solution_array('ul', self.iter_line, self.iter_time),
+                self.get_solution_array('rho', self.iter_bus, self.iter_time))
+
+
+
+    @profile('cut')
+    def add_benders_cut(self, route, ObjVal_sp=None):
+        """
+        add the optimality cut or the no-good cut of a route, as a lazy constraint inside a callback
+        """
+        x_route = gb.quicksum(self.x[i] for i in route)
+        if ObjVal_sp is None:
+            cut = x_route <= len(route) - 1
+        else:
+            ## If Route = Route_scenario, then ObjVar <= ObjVal_sp
+            cut = self.ObjVar <= ObjVal_sp + max(self.get_objective_max() - ObjVal_sp, 0) * (len(route) - x_route)
+
+        if getattr(self, 'in_callback', False):
+            self.model.cbLazy(cut)
+            return None
+        else:
+            return self.model.addConstr(cut)
+
+
+
+    def remove_benders_cut(self, handle):
+        self.model.remove(handle)
+
+
+
+    def get_cut_slack(self, handle):
+        return handle.Slack
+
+
+
+    def get_arrival_time(self):
+        keys = list(self.AT.keys())
+        return OrderedDict(zip(keys, self.get_value(list(self.AT.values()))))
+
+
+
+    def fix_route(self, route, arrival):
+        self.model.update()
+        for k in route:
+            self.x[k].LB = 1
+        for k, value in arrival.items():
+            self.AT[k].LB = value
+            self.AT[k].UB = value
+
+
+
+    def set_initial_status(self, line_status, load_status, t=0):
+        self.model.update()
+        for tau in self.iter_time[:t]:
+            for i in self.iter_bus:
+                self.rho[i, tau].UB = 0
+        for id_line in self.index.damaged_line:
+            if line_status[id_line] > 0.5:
+                self.ul[self.iter_line[id_line], self.iter_time[t]].LB = 1
+        for id, i in enumerate(self.iter_bus):
+            if load_status[id] > 0.5:
+                self.rho[i, self.iter_time[t]].LB = 1
+
+
+
+    def set_start(self, route, arrival):
+        """
+        MIP start of the crew dispatch and the repair timing, gurobi completes the other variables
+        """
+        self.model.update()
+        f, z = self.get_repair_start(route, arrival)
+        route = set(route)
+        for k, v in self.x.items():
+            v.Start = 1 if k in route else 0
+        for (c, m), v in self.y.items():
+            v.Start = 1 if any(k[0] == c and m in k[1:] for k in route) else 0
+        for k, value in arrival.items():
+            self.AT[k].Start = value
+        for id, m in enumerate(self.ordered_vertex):
+            for t in self.iter_time:
+                self.f[m, t].Start = f[id, t]
+                self.z[m, t].Start = z[id, t]
+
+
+
     def test_crew_dispatch(self):
         """
         test the crew dispatch and repairing
@@ -0,0 +1,502 @@
+import time
+import numpy as np
+from collections import OrderedDict
+
+from formulation_general import *
+
+plt = LazyModule('matplotlib.pyplot')
+nx = LazyModule('networkx')
+
+
+
+class OutageManageHighs(OutageManage):
+    """
+    distribution system outage management formulation assembled directly in sparse matrix form
+    and solved by the HiGHS solver through scipy.optimize.milp
+    The formulation mirrors OutageManagePyomo, so both report the same objective
+    """
+
+    def define_problem_object(self):
+        self.model = SparseModel()
+
+
+
+    def get_model_size(self):
+        return (self.model.number_column, self.model.number_row, self.model.nnz)
+
+
+
+    @profile('form')
+    def form_crew_dispatch(self, Route_Example=None):
+        """
+        formulate crew dispatch problem (constraints 30-44)
+        """
+        vrp = self.vrp
+        model = self.model
+        layout = model.layout
+        idx = self.index
+
+        C = len(self.iter_crew)
+        V = self.number_vertex
+        T = len(self.iter_time)
+        o = idx.vertex_row['0']
+        d = idx.vertex_row['d']
+        damaged = idx.damaged_vertex
+        vertex = np.arange(V)
+        time_step = np.arange(T)
+
+        ## repair time of each crew and travel time in the order of vertex rows
+        repair = np.array([[vrp['repair'][c][m] for m in self.ordered_vertex] for c in self.iter_crew], dtype=float)
+        travel = self.ordered_travel_time
+
+        ## repairing variables
+        model.add_var('AT', [self.iter_crew, self.ordered_vertex], lb=0)
+        model.add_var('f', [self.ordered_vertex, self.iter_time], lb=0, ub=1, integer=True)
+        model.add_var('x', [self.iter_crew, self.ordered_vertex, self.ordered_vertex], lb=0, ub=1, integer=True)
+        model.add_var('y', [self.iter_crew, self.ordered_vertex], lb=0, ub=1, integer=True)
+        model.add_var('z', [self.ordered_vertex, self.iter_time], lb=0, ub=1, integer=True)  # line availability indicator
+        if self.Repair_Encoding == 'cumulative':
+            model.add_var('g', [self.ordered_vertex, self.iter_time], lb=0, ub=1)  # cumulative sum of f
+
+        ## crew visited constraint
+        # 30: a crew arriving at a damaged component leaves it after finishing the repair
+        c, m, n = np.meshgrid(np.arange(C), np.arange(damaged.shape[0]), vertex, indexing='ij')
+        keep = n != damaged[m]
+        row = (c * damaged.shape[0] + m)[keep]
+        c, m, n = c[keep], damaged[m[keep]], n[keep]
+        con_30 = SparseBlock.build(row[None, :], np.stack((layout.column('x', c, m, n), layout.column('x', c, n, m))),
+                                   np.array([1, -1])[:, None], 0, 0, C * damaged.shape[0])
+
+        # 31: the crews start from depots
+        c, n = np.meshgrid(np.arange(C), np.setdiff1d(vertex, [o]), indexing='ij')
+        con_31 = SparseBlock.build(c.ravel()[None, :], np.stack((layout.column('x', c, o, n).ravel(), layout.column('x', c, n, o).ravel())),
+                                   np.array([1, -1])[:, None], 1, 1, C)
+
+        # 32: all crews return to the depots
+        c, n = np.meshgrid(np.arange(C), np.setdiff1d(vertex, [d]), indexing='ij')
+        con_32 = SparseBlock.build(0, layout.column('x', c, n, d).ravel(), 1, 1, 1, 1)
+
+        # 33: a damaged component is fixed by only one crew
+        m, c = np.meshgrid(np.arange(damaged.shape[0]), np.arange(C), indexing='ij')
+        con_33 = SparseBlock.build(m.ravel(), layout.column('y', c, damaged[m]).ravel(), 1, 1, 1, damaged.shape[0])
+
+        # 34: couples the binary variables x and y
+        start = np.setdiff1d(vertex, [d])
+        c, m, n = np.meshgrid(np.arange(C), np.arange(start.shape[0]), vertex, indexing='ij')
+        keep = (n != o) & (n != start[m])
+        row = c * start.shape[0] + m
+        con_34 = SparseBlock.build(np.concatenate((row[:, :, 0].ravel(), row[keep])),
+                                   np.concatenate((layout.column('y', c[:, :, 0], start[m[:, :, 0]]).ravel(),
+                                                   layout.column('x', c[keep], start[m[keep]], n[keep]))),
+                                   np.concatenate((np.ones(C * start.shape[0]), -np.ones(int(keep.sum())))),
+                                   0, 0, C * start.shape[0])
+
+        ## enforcement
+        c, i = np.meshgrid(np.arange(C), vertex, indexing='ij')
+        con_self = SparseBlock.build(np.arange(C * V), layout.column('x', c, i, i).ravel(), 1, 0, 0, C * V)
+
+        model.add_constr('vehicle_routing', SparseBlock.stack(con_30, con_31, con_32, con_33, con_34, con_self))
+
+        ## define constraint of repairing damaged components
+        # 39: arrival time
+        c, n, m = np.meshgrid(np.arange(C), vertex, start, indexing='ij')
+        c, n, m = c.ravel(), n.ravel(), m.ravel()
+        con_39 = SparseBlock.build(np.arange(c.shape[0])[None, :],
+                                   np.stack((layout.column('AT', c, m), layout.column('AT', c, n), layout.column('x', c, m, n))),
+                                   np.array([1, -1, self.BigM])[:, None],
+                                   -np.inf, self.BigM - repair[c, m] - travel[m, n], c.shape[0])
+
+        # 40-42: the time a damaged component is repaired
+        m, t = np.meshgrid(vertex, time_step, indexing='ij')
+        if self.Repair_Encoding == 'cumulative':
+            con_40 = SparseBlock.build(vertex, layout.column('g', vertex, T - 1), 1, 1, 1, V)
+        else:
+            con_40 = SparseBlock.build(m.ravel(), layout.column('f', m, t).ravel(), 1, 1, 1, V)
+        m_c, c = np.meshgrid(vertex, np.arange(C), indexing='ij')
+        row = np.concatenate((m.ravel(), m_c.ravel(), m_c.ravel()))
+        col = np.concatenate((layout.column('f', m, t).ravel(), layout.column('AT', c, m_c).ravel(), layout.column('y', c, m_c).ravel()))
+        ## on the time grid the repair finishes in the time steps (time_point[t - 1], time_point[t]] of f[m, t] = 1
+        val = np.concatenate((self.time_point[t].ravel().astype(float), -np.ones(C * V), -repair[c, m_c].ravel()))
+        con_41 = SparseBlock.build(row, col, val, 0, np.inf, V)
+        val = np.concatenate(((self.time_point - self.time_weight + 1)[t].ravel().astype(float), -np.ones(C * V), -repair[c, m_c].ravel()))
+        con_42 = SparseBlock.build(row, col, val, -np.inf, 1 - self.epsilon, V)
+
+        # 43: arrival time is zero if the crew does not repair the component
+        c, m = np.meshgrid(np.arange(C), vertex, indexing='ij')
+        con_43 = SparseBlock.build(np.arange(C * V)[None, :], np.stack((layout.column('AT', c, m).ravel(), layout.column('y', c, m).ravel())),
+                                   np.array([1, -self.BigM])[:, None], -np.inf, 0, C * V)
+
+        # 44: the restored component becomes available in all subsequent time periods
+        if self.Repair_Encoding == 'cumulative':
+            # g[m, t] = g[m, t - 1] + f[m, t] and z[m, t] <= g[m, t - 1]
+            t, m = np.meshgrid(time_step, vertex, indexing='ij')
+            row = np.arange(T * V).reshape(T, V)
+            con_44 = SparseBlock.stack(
+                SparseBlock.build(np.concatenate((row.ravel(), row.ravel(), row[1:].ravel())),
+                                  np.concatenate((layout.column('g', m, t).ravel(), layout.column('f', m, t).ravel(),
+                                                  layout.column('g', m[1:], t[1:] - 1).ravel())),
+                                  np.concatenate((np.ones(T * V), -np.ones(T * V), -np.ones((T - 1) * V))), 0, 0, T * V),
+                SparseBlock.build(np.concatenate((row.ravel(), row[1:].ravel())),
+                                  np.concatenate((layout.column('z', m, t).ravel(), layout.column('g', m[1:], t[1:] - 1).ravel())),
+                                  np.concatenate((np.ones(T * V), -np.ones((T - 1) * V))), -np.inf, 0, T * V))
+        else:
+            t, m, tau = np.meshgrid(time_step, vertex, time_step, indexing='ij')
+            keep = tau < t
+            row = t * V + m
+            con_44 = SparseBlock.build(np.concatenate((row[:, :, 0].ravel(), row[keep])),
+                                       np.concatenate((layout.column('z', m[:, :, 0], t[:, :, 0]).ravel(), layout.column('f', m[keep], tau[keep]))),
+                                       np.concatenate((np.ones(T * V), -np.ones(int(keep.sum())))),
+                                       -np.inf, 0, T * V)
+
+        model.add_constr('repair', SparseBlock.stack(con_39, SparseBlock.interleave(con_40, con_41, con_42), con_43, con_44))
+
+
+
+    @profile('form')
+    def form_network_operation(self):
+        """
+        formulate the network operation from the sparse network matrix
+        """
+        model = self.model
+        layout = model.layout
+        network = self.network
+        T = len(self.iter_time)
+
+        ## network operation variables
+        model.add_var('p', [self.iter_gen, self.iter_time])
+        model.add_var('q', [self.iter_gen, self.iter_time])
+        model.add_var('P', [self.iter_line, self.iter_time])
+        model.add_var('Q', [self.iter_line, self.iter_time])
+        model.add_var('V', [self.iter_bus, self.iter_time], lb=0)
+        model.add_var('rho', [self.iter_bus, self.iter_time], lb=0, ub=1, integer=True)
+        model.add_var('ul', [self.iter_line, self.iter_time], lb=0, ub=1, integer=True)
+        model.add_var('beta', [self.iter_line, self.iter_orientation, self.iter_time], lb=0, ub=1, integer=True)
+
+        model.add_constr('con_distflow_bus', SparseBlock.interleave(
+            network.block_power_balance(layout, T, 'P', 'p', self.index.bus_load_P),
+            network.block_power_balance(layout, T, 'Q', 'q', self.index.bus_load_Q)))
+        model.add_constr('con_distflow_line', SparseBlock.interleave(
+            *network.block_voltage_drop(layout, T, self.BigM, self.Voltage_Substation)))
+        model.add_constr('con_lim_line', SparseBlock.interleave(
+            *(network.block_line_limit(layout, T, 'P', network.Pmax) + network.block_line_limit(layout, T, 'Q', network.Qmax))))
+        model.add_constr('con_lim_voltage', SparseBlock.interleave(
+            *network.block_voltage_limit(layout, T, self.Voltage_Substation, self.Voltage_Variation)))
+        model.add_constr('con_radiality', network.block_radiality(layout, T))
+        model.add_constr('status_line', network.block_line_status(layout, T))
+        model.add_constr('status_load', network.block_load_status(layout, T))
+
+
+
+    @profile('form')
+    def form_network_operation_int(self):
+        """
+        formulate the simplified pure integer network operation from the sparse network matrix
+        """
+        model = self.model
+        layout = model.layout
+        network = self.network
+        T = len(self.iter_time)
+
+        ## network operation variables
+        model.add_var('p', [self.iter_gen, self.iter_time], integer=True)
+        model.add_var('P', [self.iter_line, self.iter_time], integer=True)
+        model.add_var('rho', [self.iter_bus, self.iter_time], lb=0, ub=1, integer=True)
+        model.add_var('ul', [self.iter_line, self.iter_time], lb=0, ub=1, integer=True)
+        model.add_var('beta', [self.iter_line, self.iter_orientation, self.iter_time], lb=0, ub=1, integer=True)
+
+        model.add_constr('con_distflow_bus', network.block_power_balance(layout, T, 'P', 'p', np.ones(self.number_bus)))
+        model.add_constr('con_lim_line', SparseBlock.interleave(*network.block_line_limit(layout, T, 'P', 100)))
+        model.add_constr('con_radiality', network.block_radiality(layout, T))
+        model.add_constr('status_line', network.block_line_status(layout, T))
+        model.add_constr('status_load', network.block_load_status(layout, T))
+
+
+
+    @profile('form')
+    def form_coupling(self):
+        """
+        Coupling: line availability and repairing indicator
+        """
+        layout = self.model.layout
+        idx = self.index
+        T = len(self.iter_time)
+
+        t = np.repeat(np.arange(T), idx.damaged_line.shape[0])
+        k = np.tile(np.arange(idx.damaged_line.shape[0]), T)
+        self.model.add_constr('coupling', SparseBlock.build(
+            np.arange(t.shape[0])[None, :],
+            np.stack((layout.column('ul', idx.damaged_line[k], t), layout.column('z', idx.damaged_vertex[k], t))),
+            np.array([1, -1])[:, None], -np.inf, 0, t.shape[0]))
+
+
+
+    @profile('form')
+    def define_objective(self):
+        """
+        minimize the negative load pickup, as in the pyomo formulation
+        """
+        self.model.set_cost('rho', -self.index.bus_load_P[:, None] * self.time_weight[None, :])
+
+
+
+    @profile('solve')
+    def solve(self, mip_rel_gap=None, time_limit=None, disp=False):
+        """
+        solve the model by HiGHS
+        :param mip_rel_gap: relative MIP gap, e.g. 0.02
+        :param time_limit: time limit in seconds
+        :param disp: print the solver log
+        :return: scipy.optimize.OptimizeResult, the solution may be an incumbent if the time limit is reached
+        :raise RuntimeError: if HiGHS ends without a solution, e.g. the model is infeasible or the time limit is
+                             reached before the first incumbent, the result is kept in self.result
+        """
+        from scipy.optimize import milp, Bounds, LinearConstraint
+
+        A, lower, upper = self.model.get_matrix()
+
+        options = {'disp': disp}
+        if mip_rel_gap is not None:
+            options['mip_rel_gap'] = mip_rel_gap
+        if time_limit is not None:
+            options['time_limit'] = time_limit
+
+        self.result = milp(self.model.cost, integrality=self.model.integrality,
+                           bounds=Bounds(self.model.lb, self.model.ub),
+                           constraints=LinearConstraint(A, lower, upper), options=options)
+        if self.result.x is None:
+            self.solution = None
+            self.ObjVal = None
+            raise RuntimeError('HiGHS found no solution (status {}): {}'.format(self.result.status, self.result.message))
+        self.solution = self.result.x
+        self.ObjVal = self.result.fun
+
+        return self.result
+
+
+
+    def get_solution_family(self, VariableName):
+        """
+        the solution of a variable family is a view of the contiguous columns of the family in the solution vector
+        """
+        layout = self.model.layout
+        return self.solution[layout.slice(VariableName)].reshape(layout.shape[VariableName]), self.model.index_sets[VariableName]
+
+
+
+    @profile('extract')
+    def get_solution_2d(self, VariableName, NameKey, ListIndex, SolDict=None):
+        """
+        get solution and store into a one name key structured dictionary
+        :param VariableName: variable name in string format
+        :param NameKey: desired key set in list or range format that you would like to retrieve
+        :param ListIndex: desired index range in list format that you would like to retrieve
+        :param SolDict: dictionary object with plot methods
+        :return: SolDict
+        """
+        value = self.get_solution_array(VariableName, NameKey, ListIndex)
+        return SolutionDict.from_array(value, NameKey, SolDict)
+
+
+
+    @profile('extract')
+    def get_solution_route(self):
+        """
+        get crew dispatch route and plot
+        """
+        vrp = self.vrp
+
+        value = self.get_solution_array('x', self.iter_crew, self.ordered_vertex, self.ordered_vertex)
+
+        SolDict = OrderedDict()
+        for k, c in enumerate(self.iter_crew):
+            SolDict[c] = OrderedDict()
+            SolDict[c]['x'] = OrderedDict()
+            SolDict[c]['route'] = []
+            for i_row, i in enumerate(self.ordered_vertex):
+                for j_row, j in enumerate(self.ordered_vertex):
+                    SolDict[c]['x'][i, j] = value[k, i_row, j_row]
+                    if round(value[k, i_row, j_row]) == 1:
+                        SolDict[c]['route'].append((i, j))
+
+        ## hard coded for single crew plot
+        plt.figure(figsize=(7, 5))
+        for i in SolDict[0]['route']:
+            vrp['graph'].add_edge(i[0], i[1])
+        nx.draw(vrp['graph'], vrp['fault']['location'], with_labels=True)
+        plt.show()
+
+        return SolDict
+
+
+
+    @profile('form')
+    def form_cop(self):
+        """
+        formulate co-optimization problem
+        """
+        self.define_problem_object()
+        self.form_crew_dispatch()
+        self.form_network_operation()
+        self.form_coupling()
+        self.define_objective()
+
+
+
+    @profile('form')
+    def form_mp(self):
+        """
+        define the master problem in MIP
+        """
+        self.define_problem_object()
+        self.form_crew_dispatch()
+        self.form_network_operation_int()
+        self.form_coupling()
+        self.define_objective()
+
+
+
+    @profile('form')
+    def form_sp(self):
+        """
+        define the subproblem in MIP
+        """
+        self.define_problem_object()
+        self.form_network_operation()
+        self.define_objective()
+
+
+
+    def solve_problem(self):
+        return self.solve()
+
+
+
+    def get_objective(self):
+        return -self.ObjVal * self.BasePower
+
+
+
+    @profile('extract')
+    def get_route(self):
+        value, sets = self.get_solution_family('x')
+        return tuple((sets[0][k], sets[1][i], sets[2][j]) for k, i, j in np.argwhere(value > 0.5))
+
+
+
+    @profile('extract')
+    def get_repair_status(self):
+        return self.get_solution_array('z')
+
+
+
+    @profile('update')
+    def set_repair_schedule(self, repair_status):
+        """
+        damaged line cannot function before it is repaired, only the upper bounds of the damaged line status change
+        """
+        columns = self.model.layout.column('ul', self.index.damaged_line[:, None], np.arange(len(self.iter_time))[None, :])
+        if not hasattr(self, 'RepairBound'):
+            self.RepairBound = self.model.ub[columns].copy()
+        self.model.ub[columns] = np.minimum(self.RepairBound, np.asarray(repair_status, dtype=float)[self.index.damaged_vertex])
+
+
+
+    @profile('extract')
+    def get_network_status(self):
+        return self.get_solution_array('ul'), self.get_solution_array('rho')
+
+
+
+    @profile('cut')
+    def add_benders_cut(self, route, ObjVal_sp=None):
+        """
+        add the optimality cut or the no-good cut of a route as a block of its own
+        """
+        layout = self.model.layout
+        sets = self.model.index_sets['x']
+        route_columns = np.array([layout.column('x', sets[0].index(k), sets[1].index(i), sets[2].index(j)) for k, i, j in route])
+
+        if ObjVal_sp is None:
+            cut = SparseBlock.build(0, route_columns, 1, -np.inf, len(route) - 1, 1)
+        else:
+            ## If Route = Route_scenario, then served energy <= ObjVal_sp
+            M = max(self.get_objective_max() - ObjVal_sp, 0)
+            rho_columns = layout.columns('rho')
+            col = np.concatenate((rho_columns, route_columns))
+            val = np.concatenate((-self.model.cost[rho_columns] * self.BasePower, np.full(len(route), M)))
+            cut = SparseBlock.build(0, col, val, -np.inf, ObjVal_sp + M * len(route), 1)
+
+        self.CutCounter = getattr(self, 'CutCounter', 0) + 1
+        handle = 'benders_cut_{}'.format(self.CutCounter)
+        self.model.add_constr(handle, cut)
+        return handle
+
+
+
+    def remove_benders_cut(self, handle):
+        del self.model.blocks[handle]
+
+
+
+    def get_cut_slack(self, handle):
+        cut = self.model.blocks[handle]
+        activity = np.sum(cut.val * self.solution[cut.col])
+        return min(activity - cut.lower[0], cut.upper[0] - activity)
+
+
+
+    def get_arrival_time(self):
+        value, sets = self.get_solution_family('AT')
+        return OrderedDict(((c, m), value[k, i]) for k, c in enumerate(sets[0]) for i, m in enumerate(sets[1]))
+
+
+
+    def fix_route(self, route, arrival):
+        """
+        fix the committed crew dispatch by the bounds, scipy's milp takes no start solution so set_start is not available
+        """
+        layout = self.model.layout
+        sets = self.model.index_sets['x']
+        for k, i, j in route:
+            self.model.lb[layout.column('x', sets[0].index(k), sets[1].index(i), sets[2].index(j))] = 1
+        for (k, m), value in arrival.items():
+            column = layout.column('AT', sets[0].index(k), sets[1].index(m))
+            self.model.lb[column] = value
+            self.model.ub[column] = value
+
+
+
+    def set_initial_status(self, line_status, load_status, t=0):
+        layout = self.model.layout
+        self.model.ub[layout.column('rho', np.arange(self.number_bus)[:, None], np.arange(t)[None, :])] = 0
+        damaged = self.index.damaged_line[np.asarray(line_status, dtype=float)[self.index.damaged_line] > 0.5]
+        self.model.lb[layout.column('ul', damaged, t)] = 1
+        self.model.lb[layout.column('rho', np.flatnonzero(np.asarray(load_status, dtype=float) > 0.5), t)] = 1
+
+
+
+
+if __name__=="__main__":
+
+    # import testcase data
+    import Fun_IEEETestCase as case
+    import Fun_Crew_Dispatch as c_d
+    ppc = case.case33_noDG_tieline()
+    vrp = c_d.crew_dispatch_determ()
+
+    # test co-optimization
+    cop = OutageManageHighs()
+    cop.data_preparation(ppc, vrp)
+    build_start = time.time()
+    cop.form_cop()
+    print('build time {}'.format(time.time() - build_start))
+    solver_start = time.time()
+    results = cop.solve(mip_rel_gap=0.02, disp=True)
+    print('solver time {}'.format(time.time() - solver_start))
+    print(results.message)
+    print('objective is {}'.format(-cop.ObjVal))
+    cop.get_solution_route()
+    load_status = cop.get_solution_2d('rho', cop.iter_bus, cop.iter_time)
+    load_status.plot_bin_2d()
+    line_status = cop.get_solution_2d('ul', cop.iter_line, cop.iter_time)
+    line_status.plot_bin_2d()
@@ -1,35 +1,41 @@
 import sys
 import os
 import time
-import pandas as pd
 import numpy as np
 import math
-import sympy as sy
-import matplotlib
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-import os
-import ast
-import networkx as nx
 import operator
+import itertools
 from collections import OrderedDict
 
 
 import pyomo.environ as pm
+from pyomo.core.expr.numeric_expr import LinearExpression, MonomialTermExpression
+from pyomo.solvers.plugins.solvers.persistent_solver import PersistentSolver
 from formulation_general import *
 
+plt = LazyModule('matplotlib.pyplot')
+nx = LazyModule('networkx')
+
 
 
 class OutageManagePyomo(OutageManage):
     """
     distribution system outage management formulation using Pyomo
     """
+    SolverName = 'gurobi'
 
     def define_problem_object(self):
         self.model = pm.ConcreteModel()
 
 
 
+    def get_model_size(self):
+        ## counting the nonzeros of a pyomo model walks all constraint expressions, so they are not counted
+        return (self.model.nvariables(), self.model.nconstraints(), None)
+
+
+
+    @profile('form')
     def form_crew_dispatch(self, Route_Example=None):
 
         vrp = self.vrp
@@ -82,13 +88,22 @@ class OutageManagePyomo(OutageManage):
                     self.model.repair.add(self.model.AT[c, m] + vrp['repair'][c][m] + vrp['travel'][m][n] <= self.model.AT[c, n] + (
                                 1 - self.model.x[c, m, n]) * self.BigM)
 
-        # # 40-42: the time a damaged component is repaired
+        # # cumulative encoding: g[m, t] is the sum of f[m, tau] for tau <= t, linked step by step
+        if self.Repair_Encoding == 'cumulative':
+            self.model.g = pm.Var(self.iter_vertex, self.iter_time, bounds=(0, 1))
+
+        # # 40-42: the time a damaged component is repaired, on the time grid the repair finishes in the time steps
+        # # (time_point[t - 1], time_point[t]] of the time index t with f[m, t] = 1
         for m in self.iter_vertex:
-            self.model.repair.add(sum(self.model.f[m, t] for t in self.iter_time) == 1)
-            self.model.repair.add(sum(t * self.model.f[m, t] for t in self.iter_time) >= sum(
-                self.model.AT[c, m] + vrp['repair'][c][m] * self.model.y[c, m] for c in self.iter_crew))
-            self.model.repair.add(sum(t * self.model.f[m, t] for t in self.iter_time) <= sum(
-                self.model.AT[c, m] + vrp['repair'][c][m] * self.model.y[c, m] for c in self.iter_crew) + 1 - self.epsilon)
+            repair_time = sum(self.time_point[t] * self.model.f[m, t] for t in self.iter_time)
+            repair_start = sum((self.time_point[t] - self.time_weight[t] + 1) * self.model.f[m, t] for t in self.iter_time)
+            finish_time = sum(self.model.AT[c, m] + vrp['repair'][c][m] * self.model.y[c, m] for c in self.iter_crew)
+            if self.Repair_Encoding == 'cumulative':
+                self.model.repair.add(self.model.g[m, self.iter_time[-1]] == 1)
+            else:
+                self.model.repair.add(sum(self.model.f[m, t] for t in self.iter_time) == 1)
+            self.model.repair.add(repair_time >= finish_time)
+            self.model.repair.add(repair_start <= finish_time + 1 - self.epsilon)
 
         # # 43
         for c in self.iter_crew:
@@ -96,15 +111,78 @@ class OutageManagePyomo(OutageManage):
                 self.model.repair.add(self.model.AT[c, m] <= self.model.y[c, m] * self.BigM)
 
         # # 44
-        for t in self.iter_time:
-            for m in self.iter_vertex:
-                self.model.repair.add(self.model.z[m, t] <= sum(self.model.f[m, tau] for tau in np.arange(0, t)))
+        if self.Repair_Encoding == 'cumulative':
+            for t in self.iter_time:
+                for m in self.iter_vertex:
+                    if t == self.iter_time[0]:
+                        self.model.repair.add(self.model.g[m, t] == self.model.f[m, t])
+                        self.model.repair.add(self.model.z[m, t] <= 0)
+                    else:
+                        self.model.repair.add(self.model.g[m, t] == self.model.g[m, t - 1] + self.model.f[m, t])
+                        self.model.repair.add(self.model.z[m, t] <= self.model.g[m, t - 1])
+        else:
+            for t in self.iter_time:
+                for m in self.iter_vertex:
+                    self.model.repair.add(self.model.z[m, t] <= sum(self.model.f[m, tau] for tau in np.arange(0, t)))
 
 
 
-    def form_network_operation(self):
+    def get_columns(self, families):
+        """
+        map pyomo variable families onto a column layout of the sparse network matrix
+        :param families: list of (variable name, list of index lists)
+        :return: ColumnLayout and the list of pyomo variables of each column
+        """
+        layout = ColumnLayout()
+        var = []
+        for name, sets in families:
+            layout.add(name, [len(s) for s in sets])
+            variable = getattr(self.model, name)
+            var.extend(variable[i] for i in itertools.product(*sets))
 
-        ppc = self.ppc
+        return layout, var
+
+
+
+    def add_block(self, con, block, layout, var):
+        """
+        add a block of sparse rows to a constraint list
+        Each row is passed to pyomo as a LinearExpression so no expression tree is built term by term
+        :param con: pyomo ConstraintList
+        :param block: SparseBlock
+        :param layout: ColumnLayout of the block columns
+        :param var: list of pyomo variables of each column
+        """
+        A = block.tocsr(layout.number_column)
+        indptr = A.indptr.tolist()
+        indices = A.indices.tolist()
+        data = A.data.tolist()
+        lower = block.lower.tolist()
+        upper = block.upper.tolist()
+
+        for r in range(block.number_row):
+            # unit coefficients are passed as bare variables, which pyomo handles much faster than monomials
+            body = LinearExpression([var[k] if a == 1 else MonomialTermExpression((a, var[k]))
+                                     for k, a in zip(indices[indptr[r]:indptr[r + 1]], data[indptr[r]:indptr[r + 1]])])
+            if lower[r] == upper[r]:
+                con.add(body == upper[r])
+            elif lower[r] == -np.inf:
+                con.add(body <= upper[r])
+            elif upper[r] == np.inf:
+                con.add(body >= lower[r])
+            else:
+                con.add((lower[r], body, upper[r]))
+
+
+
+    @profile('form')
+    def form_network_operation(self):
+        """
+        formulate the network operation from the sparse network matrix,
+        build time scales with the number of nonzeros times the number of time steps
+        """
+        network = self.network
+        T = len(self.iter_time)
 
         ## network operation variables
         self.model.p = pm.Var(self.iter_gen, self.iter_time, within=pm.Reals)
@@ -115,237 +193,93 @@ class OutageManagePyomo(OutageManage):
         self.model.rho = pm.Var(self.iter_bus, self.iter_time, within=pm.Binary)
         self.model.ug = pm.Var(self.iter_gen, self.iter_time, within=pm.Binary)
         self.model.ul = pm.Var(self.iter_line, self.iter_time, within=pm.Binary)
-        self.model.beta = pm.Var(self.iter_bus, self.iter_bus, self.iter_time, within=pm.Binary)
+        self.model.beta = pm.Var(self.iter_line, self.iter_orientation, self.iter_time, within=pm.Binary)
         self.model.nb = pm.Var(self.iter_time, within=pm.NonNegativeReals)
 
+        layout, var = self.get_columns([('p', [self.iter_gen, self.iter_time]), ('q', [self.iter_gen, self.iter_time]),
+                                        ('P', [self.iter_line, self.iter_time]), ('Q', [self.iter_line, self.iter_time]),
+                                        ('V', [self.iter_bus, self.iter_time]), ('rho', [self.iter_bus, self.iter_time]),
+                                        ('ul', [self.iter_line, self.iter_time]),
+                                        ('beta', [self.iter_line, self.iter_orientation, self.iter_time])])
+
         ## distflow constraint: power balance at bus i
         self.model.con_distflow_bus = pm.ConstraintList()  # In pyomo formulation, use ConstraintList() is a generic way to add constraints
-        for t in self.iter_time:
-            for i in self.iter_bus:
-                P_out = 0
-                Q_out = 0
-                P_in = 0
-                Q_in = 0
-
-                # get the matrix index from the component name
-                id = int(i[i.find('_') + 1:]) - 1
-
-                # get power flow variables flowing out from this bus
-                iter_out = np.arange(0, len(self.bus_line[i]["line_from_this_bus"]))
-
-                if iter_out.shape[0] == 0:
-                    P_out = P_out
-                    Q_out = Q_out
-                else:
-                    for k in iter_out:
-                        P_out = P_out + self.model.P['line_{}'.format(self.bus_line[i]["line_from_this_bus"][k]), t]
-                        Q_out = Q_out + self.model.Q['line_{}'.format(self.bus_line[i]["line_from_this_bus"][k]), t]
-
-                # get power flow variables flowing into from this bus
-                iter_in = np.arange(0, len(self.bus_line[i]["line_to_this_bus"]))
-
-                if iter_in.shape[0] == 0:
-                    P_in = P_in
-                    Q_in = Q_in
-                else:
-                    for k in iter_in:
-                        P_in = P_in + self.model.P['line_{}'.format(self.bus_line[i]["line_to_this_bus"][k]), t]
-                        Q_in = Q_in + self.model.Q['line_{}'.format(self.bus_line[i]["line_to_this_bus"][k]), t]
-
-                # if this is a bus with generation capability and load, the power flow balance is
-                if ppc['bus'][id, 1] == 1:
-                    self.model.con_distflow_bus.add(
-                        P_in + self.model.p['gen_{}'.format(self.bus_gen[i][0]), t] == P_out + ppc['bus'][id, 4] * self.model.rho[i, t])
-                    self.model.con_distflow_bus.add(
-                        Q_in + self.model.q['gen_{}'.format(self.bus_gen[i][0]), t] == Q_out + ppc['bus'][id, 5] * self.model.rho[i, t])
-
-                # if this is a bus with only load
-                else:
-                    self.model.con_distflow_bus.add(P_in == P_out + ppc['bus'][id, 4] * self.model.rho[i, t])
-                    self.model.con_distflow_bus.add(Q_in == Q_out + ppc['bus'][id, 5] * self.model.rho[i, t])
+        self.add_block(self.model.con_distflow_bus, SparseBlock.interleave(
+            network.block_power_balance(layout, T, 'P', 'p', self.index.bus_load_P),
+            network.block_power_balance(layout, T, 'Q', 'q', self.index.bus_load_Q)), layout, var)
 
         ## distflow constraint: voltage drop along line k
         self.model.con_distflow_line = pm.ConstraintList()
-        for t in self.iter_time:
-            for i in self.iter_line:
-                # get the matrix index from the component name
-                id = int(i[i.find('_') + 1:]) - 1
-
-                # for this line, get the bus index
-                f_bus = int(ppc['line'][id, 1])
-                t_bus = int(ppc['line'][id, 2])
-
-                self.model.con_distflow_line.add(
-                    self.model.V['bus_{}'.format(t_bus), t] - self.model.V['bus_{}'.format(f_bus), t]
-                    + (ppc['line'][id, 3] * self.model.P[i, t] + ppc['line'][id, 4] * self.model.Q[i, t]) / self.Voltage_Substation <= (1 - self.model.ul[i, t]) * self.BigM)
-                self.model.con_distflow_line.add(
-                    self.model.V['bus_{}'.format(t_bus), t] - self.model.V['bus_{}'.format(f_bus), t]
-                    + (ppc['line'][id, 3] * self.model.P[i, t] + ppc['line'][id, 4] * self.model.Q[i, t]) / self.Voltage_Substation >= -(1 - self.model.ul[i, t]) * self.BigM)
+        self.add_block(self.model.con_distflow_line, SparseBlock.interleave(
+            *network.block_voltage_drop(layout, T, self.BigM, self.Voltage_Substation)), layout, var)
 
         ## operation limits
-        # self.model.con_lim_gen = pm.ConstraintList()
-        # for t in self.iter_time:
-        #     for i in self.iter_gen:
-        #         # get the matrix index from the component name
-        #         id = int(i[i.find('_') + 1:]) - 1
-        #         self.model.con_lim_gen.add(self.model.p[i, t] >= ppc['gen'][id, 2] * self.model.ug[i, t])
-        #         self.model.con_lim_gen.add(self.model.p[i, t] <= ppc['gen'][id, 3] * self.model.ug[i, t])
-        #         self.model.con_lim_gen.add(self.model.q[i, t] >= ppc['gen'][id, 4] * self.model.ug[i, t])
-        #         self.model.con_lim_gen.add(self.model.q[i, t] <= ppc['gen'][id, 5] * self.model.ug[i, t])
-
         self.model.con_lim_line = pm.ConstraintList()
-        for t in self.iter_time:
-            for i in self.iter_line:
-                # get the matrix index from the component name
-                id = int(i[i.find('_') + 1:]) - 1
-                self.model.con_lim_line.add(self.model.P[i, t] <= self.model.ul[i, t] * ppc['line'][id, 5])  #ppc['line'][id, 5]
-                self.model.con_lim_line.add(self.model.P[i, t] >= -self.model.ul[i, t] * ppc['line'][id, 5])
-                self.model.con_lim_line.add(self.model.Q[i, t] <= self.model.ul[i, t] * ppc['line'][id, 6]) # ppc['line'][id, 6]
-                self.model.con_lim_line.add(self.model.Q[i, t] >= -self.model.ul[i, t] * ppc['line'][id, 6])
+        self.add_block(self.model.con_lim_line, SparseBlock.interleave(
+            *(network.block_line_limit(layout, T, 'P', network.Pmax) + network.block_line_limit(layout, T, 'Q', network.Qmax))),
+            layout, var)
 
         self.model.con_lim_voltage = pm.ConstraintList()
-        for t in self.iter_time:
-            for i in self.iter_bus:
-                if i == 'bus_1':
-                    self.model.con_lim_voltage.add(self.model.V[i, t] == self.Voltage_Substation)
-                else:
-                    self.model.con_lim_voltage.add(self.model.V[i, t] >= 1 - self.Voltage_Variation)
-                    self.model.con_lim_voltage.add(self.model.V[i, t] <= 1 + self.Voltage_Variation)
-
+        self.add_block(self.model.con_lim_voltage, SparseBlock.interleave(
+            *network.block_voltage_limit(layout, T, self.Voltage_Substation, self.Voltage_Variation)), layout, var)
 
         ## tree topology constraints
         self.model.con_radiality = pm.ConstraintList()
+        self.add_block(self.model.con_radiality, network.block_radiality(layout, T), layout, var)
 
-        # substation bus does not have parent bus
-        for t in self.iter_time:
-            self.model.con_radiality.add(self.model.beta['bus_2', 'bus_1', t] == 0)  # hard coded
-
-        # each bus will only at least have one parent bus
-        for t in self.iter_time:
-            for j in self.iter_bus:
-                self.model.con_radiality.add(sum(self.model.beta[i, j, t] for i in self.iter_bus) <= 1)
-
-        for t in self.iter_time:
-            for i in self.iter_line:
-                # get the matrix index from the component name
-                id = int(i[i.find('_') + 1:]) - 1
-                # for this line, get the bus index
-                f_bus = int(ppc['line'][id, 1])
-                t_bus = int(ppc['line'][id, 2])
-                self.model.con_radiality.add(self.model.beta['bus_{}'.format(f_bus), 'bus_{}'.format(t_bus), t]
-                                        + self.model.beta['bus_{}'.format(t_bus), 'bus_{}'.format(f_bus), t] == self.model.ul[i, t])
-
-        ## line status constraints
+        ## line status constraints: static line cannot change, repaired and closed damaged line cannot open again
         self.model.status_line = pm.ConstraintList()
-
-        ## static line cannot change
-        for t in self.iter_time:
-            for i in self.line_static:
-                self.model.status_line.add(self.model.ul[i, t] == 1)
-
-        ## Repaired and closed damaged line cannot open again
-        for t in range(1, self.Total_Time):
-            for i in self.line_damaged:
-                self.model.status_line.add(self.model.ul[i, t] >= self.model.ul[i, t - 1])
+        self.add_block(self.model.status_line, network.block_line_status(layout, T), layout, var)
 
         ## load status constraints
         self.model.status_load = pm.ConstraintList()
-        for t in range(1, self.Total_Time):
-            for i in self.iter_bus:
-                self.model.status_load.add(self.model.rho[i, t] >= self.model.rho[i, t - 1])
+        self.add_block(self.model.status_load, network.block_load_status(layout, T), layout, var)
 
 
 
+    @profile('form')
     def form_network_operation_int(self):
-        ppc = self.ppc
+        """
+        formulate the simplified pure integer network operation from the sparse network matrix
+        """
+        network = self.network
+        T = len(self.iter_time)
 
         ## network operation variables
         self.model.p = pm.Var(self.iter_gen, self.iter_time, within=pm.Integers)
         self.model.P = pm.Var(self.iter_line, self.iter_time, within=pm.Integers)
         self.model.rho = pm.Var(self.iter_bus, self.iter_time, within=pm.Binary)
         self.model.ul = pm.Var(self.iter_line, self.iter_time, within=pm.Binary)
-        self.model.beta = pm.Var(self.iter_bus, self.iter_bus, self.iter_time, within=pm.Binary)
+        self.model.beta = pm.Var(self.iter_line, self.iter_orientation, self.iter_time, within=pm.Binary)
 
-        ## distflow constraint: power balance at bus i
+        layout, var = self.get_columns([('p', [self.iter_gen, self.iter_time]), ('P', [self.iter_line, self.iter_time]),
+                                        ('rho', [self.iter_bus, self.iter_time]), ('ul', [self.iter_line, self.iter_time]),
+                                        ('beta', [self.iter_line, self.iter_orientation, self.iter_time])])
+
+        ## distflow constraint: power balance at bus i with unit load
         self.model.con_distflow_bus = pm.ConstraintList()  # In pyomo formulation, use ConstraintList() is a generic way to add constraints
-        for t in self.iter_time:
-            for i in self.iter_bus:
-                P_out = 0
-                P_in = 0
-                id = int(i[i.find('_') + 1:]) - 1  # get the matrix index from the component name
-                # get power flow variables flowing out from this bus
-                iter_out = np.arange(0, len(self.bus_line[i]["line_from_this_bus"]))
-                if iter_out.shape[0] == 0:
-                    P_out = P_out
-                else:
-                    for k in iter_out:
-                        P_out = P_out + self.model.P['line_{}'.format(self.bus_line[i]["line_from_this_bus"][k]), t]
-                # get power flow variables flowing into from this bus
-                iter_in = np.arange(0, len(self.bus_line[i]["line_to_this_bus"]))
-
-                if iter_in.shape[0] == 0:
-                    P_in = P_in
-                else:
-                    for k in iter_in:
-                        P_in = P_in + self.model.P['line_{}'.format(self.bus_line[i]["line_to_this_bus"][k]), t]
-
-                # if this is a bus with generation capability and load, the power flow balance is
-                if ppc['bus'][id, 1] == 1:
-                    self.model.con_distflow_bus.add(
-                        P_in + self.model.p['gen_{}'.format(self.bus_gen[i][0]), t] == P_out + self.model.rho[i, t])
-                # if this is a bus with only load
-                else:
-                    self.model.con_distflow_bus.add(P_in == P_out + self.model.rho[i, t])
+        self.add_block(self.model.con_distflow_bus,
+                       network.block_power_balance(layout, T, 'P', 'p', np.ones(self.number_bus)), layout, var)
 
         self.model.con_lim_line = pm.ConstraintList()
-        for t in self.iter_time:
-            for i in self.iter_line:
-                self.model.con_lim_line.add(self.model.P[i, t] <= self.model.ul[i, t] * 100)  # ppc['line'][id, 5]
-                self.model.con_lim_line.add(self.model.P[i, t] >= -self.model.ul[i, t] * 100)
+        self.add_block(self.model.con_lim_line, SparseBlock.interleave(*network.block_line_limit(layout, T, 'P', 100)),
+                       layout, var)
 
         ## tree topology constraints
         self.model.con_radiality = pm.ConstraintList()
-
-        # substation bus does not have parent bus
-        for t in self.iter_time:
-            self.model.con_radiality.add(self.model.beta['bus_2', 'bus_1', t] == 0)  # hard coded
-
-        # each bus will only at least have one parent bus
-        for t in self.iter_time:
-            for j in self.iter_bus:
-                self.model.con_radiality.add(sum(self.model.beta[i, j, t] for i in self.iter_bus) <= 1)
-
-        for t in self.iter_time:
-            for i in self.iter_line:
-                # get the matrix index from the component name
-                id = int(i[i.find('_') + 1:]) - 1
-                # for this line, get the bus index
-                f_bus = int(ppc['line'][id, 1])
-                t_bus = int(ppc['line'][id, 2])
-                self.model.con_radiality.add(self.model.beta['bus_{}'.format(f_bus), 'bus_{}'.format(t_bus), t]
-                            + self.model.beta['bus_{}'.format(t_bus), 'bus_{}'.format(f_bus), t] == self.model.ul[i, t])
+        self.add_block(self.model.con_radiality, network.block_radiality(layout, T), layout, var)
 
         ## line status constraints
         self.model.status_line = pm.ConstraintList()
-
-        ## static line cannot change
-        for t in self.iter_time:
-            for i in self.line_static:
-                self.model.status_line.add(self.model.ul[i, t] == 1)
-
-        ## Repaired and closed damaged line cannot open again
-        for t in range(1, self.Total_Time):
-            for i in self.line_damaged:
-                self.model.status_line.add(self.model.ul[i, t] >= self.model.ul[i, t - 1])
+        self.add_block(self.model.status_line, network.block_line_status(layout, T), layout, var)
 
         ## load status constraints
         self.model.status_load = pm.ConstraintList()
-        for t in range(1, self.Total_Time):
-            for i in self.iter_bus:
-                self.model.status_load.add(self.model.rho[i, t] >= self.model.rho[i, t - 1])
+        self.add_block(self.model.status_load, network.block_load_status(layout, T), layout, var)
 
 
 
+    @profile('form')
     def form_coupling(self):
         """
         Coupling: line availability and repairing indicator
@@ -358,6 +292,7 @@ class OutageManagePyomo(OutageManage):
 
 
 
+    @profile('form')
     def define_objective(self):
 
         ppc = self.ppc
@@ -366,15 +301,28 @@ class OutageManagePyomo(OutageManage):
             obj = 0 # initialize the objective function
             ## load pickups
             for t in self.iter_time:
-                for i in self.iter_bus:
-                    id = int(i[i.find('_') + 1:]) - 1 # get the matrix index from the component name
-                    obj = obj - model.rho[i, t] * ppc['bus'][id, 4]
+                for id, i in enumerate(self.iter_bus):
+                    obj = obj - model.rho[i, t] * self.index.bus_load_P[id] * self.time_weight[t]
             return obj
 
         self.model.obj = pm.Objective(rule=obj_restoration)
 
 
 
+    def get_solution_family(self, VariableName):
+        """
+        pyomo loads the solution into the variable objects, so the values are gathered in one pass over the family,
+        an unset value is nan
+        """
+        variable = operator.attrgetter(VariableName)(self.model)
+        index_set = variable.index_set()
+        sets = [list(k) for k in index_set.subsets()] if index_set.dimen > 1 else [list(index_set)]
+        value = np.array([v.value for v in variable.values()], dtype=float)
+        return value.reshape(tuple(len(k) for k in sets)), sets
+
+
+
+    @profile('extract')
     def get_solution_2d(self, VariableName, NameKey, ListIndex, SolDict=None):
         """
         get solution and store into a one name key structured dictionary
@@ -384,38 +332,29 @@ class OutageManagePyomo(OutageManage):
         :param SolDict: dictionary object with plot methods
         :return: SolDict
         """
-        if SolDict == None:
-            SolDict = SolutionDict()
-        else:
-            pass
-
-        ## get string type attribute name
-        variable = operator.attrgetter(VariableName)(self.model)
-
-        for i in NameKey:
-            SolDict[i] = []
-            for j in ListIndex:
-                SolDict[i].append(variable[i, j].value)
-
-        return SolDict
+        value = self.get_solution_array(VariableName, NameKey, ListIndex)
+        return SolutionDict.from_array(value, NameKey, SolDict)
 
 
 
+    @profile('extract')
     def get_solution_route(self):
         """
         get crew dispatch route and plot
         """
         vrp = self.vrp
 
+        value = self.get_solution_array('x', self.iter_crew, self.ordered_vertex, self.ordered_vertex)
+
         SolDict = OrderedDict()
-        for c in self.iter_crew:
+        for k, c in enumerate(self.iter_crew):
             SolDict[c] = OrderedDict()
             SolDict[c]['x'] = OrderedDict()
             SolDict[c]['route'] = []
-            for i in self.ordered_vertex:
-                for j in self.ordered_vertex:
-                    SolDict[c]['x'][i, j] = self.model.x[c, i, j].value
-                    if self.model.x[c, i, j].value == 1:
+            for i_row, i in enumerate(self.ordered_vertex):
+                for j_row, j in enumerate(self.ordered_vertex):
+                    SolDict[c]['x'][i, j] = value[k, i_row, j_row]
+                    if round(value[k, i_row, j_row]) == 1:
                         SolDict[c]['route'].append((i, j))
 
         ## hard coded for single crew plot
@@ -425,8 +364,11 @@ class OutageManagePyomo(OutageManage):
         nx.draw(vrp['graph'], vrp['fault']['location'], with_labels=True)
         plt.show()
 
+        return SolDict
+
 
 
+    @profile('form')
     def form_cop(self):
         """
         formulate co-optimization problem
@@ -444,6 +386,7 @@ class OutageManagePyomo(OutageManage):
 
 
 
+    @profile('form')
     def form_mp(self):
         """
         define the master problem in MIP
@@ -457,18 +400,176 @@ class OutageManagePyomo(OutageManage):
 
 
 
+    @profile('form')
     def form_sp(self):
         """
-        define the subproblem in MIP
+        define the subproblem in MIP, the repair schedule is set by set_repair_schedule
         :return:
         """
         self.define_problem_object()
         self.form_network_operation()
-        self.form_coupling()
         self.define_objective()
 
 
 
+    @profile('solve')
+    def solve_problem(self):
+        """
+        solve the model by the solver in SolverName, the solver is kept between solves
+        persistent solvers, e.g. gurobi_persistent, get the instance once and only the changes afterwards
+        """
+        if not hasattr(self, 'solver'):
+            self.solver = pm.SolverFactory(self.SolverName)
+            if self.is_persistent():
+                self.solver.set_instance(self.model)
+
+        ## the values given by set_start are passed to the solver as the start solution
+        if self.is_persistent():
+            return self.solver.solve(warmstart=getattr(self, 'warmstart', False))
+        else:
+            return self.solver.solve(self.model, warmstart=getattr(self, 'warmstart', False))
+
+
+
+    def is_persistent(self):
+        return isinstance(getattr(self, 'solver', None), PersistentSolver)
+
+
+
+    def get_objective(self):
+        return -pm.value(self.model.obj) * self.BasePower
+
+
+
+    @profile('extract')
+    def get_route(self):
+        value, sets = self.get_solution_family('x')
+        return tuple((sets[0][k], sets[1][i], sets[2][j]) for k, i, j in np.argwhere(value > 0.5))
+
+
+
+    @profile('extract')
+    def get_repair_status(self):
+        return self.get_solution_array('z', self.ordered_vertex, self.iter_time)
+
+
+
+    @profile('update')
+    def set_repair_schedule(self, repair_status):
+        """
+        damaged line cannot function before it is repaired, only the upper bounds of the damaged line status change
+        """
+        if not hasattr(self, 'RepairVar'):
+            self.RepairVar = [self.model.ul[self.iter_line[id_line], t] for id_line in self.index.damaged_line for t in self.iter_time]
+            self.RepairBound = np.array([v.ub for v in self.RepairVar], dtype=float)
+
+        repair_status = np.asarray(repair_status, dtype=float)[self.index.damaged_vertex].ravel()
+        for v, ub in zip(self.RepairVar, np.minimum(self.RepairBound, repair_status)):
+            v.setub(float(ub))
+            if self.is_persistent():
+                self.solver.update_var(v)
+
+
+
+    @profile('extract')
+    def get_network_status(self):
+        return (self.get_solution_array('ul', self.iter_line, self.iter_time),
+                self.get_solution_array('rho', self.iter_bus, self.iter_time))
+
+
+
+    @profile('cut')
+    def add_benders_cut(self, route, ObjVal_sp=None):
+        """
+        add the optimality cut or the no-good cut of a route
+        """
+        if not hasattr(self.model, 'benders_cut'):
+            self.model.benders_cut = pm.ConstraintList()
+
+        x_route = sum(self.model.x[i] for i in route)
+        if ObjVal_sp is None:
+            handle = self.model.benders_cut.add(x_route <= len(route) - 1)
+        else:
+            ## If Route = Route_scenario, then served energy <= ObjVal_sp
+            handle = self.model.benders_cut.add(-self.model.obj.expr * self.BasePower <=
+                                                ObjVal_sp + max(self.get_objective_max() - ObjVal_sp, 0) * (len(route) - x_route))
+        if self.is_persistent():
+            self.solver.add_constraint(handle)
+        return handle
+
+
+
+    def remove_benders_cut(self, handle):
+        if self.is_persistent():
+            self.solver.remove_constraint(handle)
+        del self.model.benders_cut[handle.index()]
+
+
+
+    def get_cut_slack(self, handle):
+        return handle.slack()
+
+
+
+    def get_arrival_time(self):
+        return OrderedDict((k, self.model.AT[k].value) for k in self.model.AT)
+
+
+
+    def set_bound(self, v, lb=None, ub=None):
+        """
+        change the bounds of a variable, also in the persistent solver
+        """
+        if lb is not None:
+            v.setlb(lb)
+        if ub is not None:
+            v.setub(ub)
+        if self.is_persistent():
+            self.solver.update_var(v)
+
+
+
+    def fix_route(self, route, arrival):
+        for k in route:
+            self.set_bound(self.model.x[k], lb=1)
+        for k, value in arrival.items():
+            self.set_bound(self.model.AT[k], lb=value, ub=value)
+
+
+
+    def set_initial_status(self, line_status, load_status, t=0):
+        for tau in self.iter_time[:t]:
+            for i in self.iter_bus:
+                self.set_bound(self.model.rho[i, tau], ub=0)
+        for id_line in self.index.damaged_line:
+            if line_status[id_line] > 0.5:
+                self.set_bound(self.model.ul[self.iter_line[id_line], self.iter_time[t]], lb=1)
+        for id, i in enumerate(self.iter_bus):
+            if load_status[id] > 0.5:
+                self.set_bound(self.model.rho[i, self.iter_time[t]], lb=1)
+
+
+
+    def set_start(self, route, arrival):
+        """
+        start values of the crew dispatch and the repair timing, passed to the solver with warmstart
+        """
+        f, z = self.get_repair_start(route, arrival)
+        route = set(route)
+        for k in self.model.x:
+            self.model.x[k].value = 1 if k in route else 0
+        for c, m in self.model.y:
+            self.model.y[c, m].value = 1 if any(k[0] == c and m in k[1:] for k in route) else 0
+        for k, value in arrival.items():
+            self.model.AT[k].value = value
+        for id, m in enumerate(self.ordered_vertex):
+            for t in self.iter_time:
+                self.model.f[m, t].value = f[id, t]
+                self.model.z[m, t].value = z[id, t]
+        self.warmstart = True
+
+
+
     def test_crew_dispatch(self):
         self.define_problem_object()
         self.form_crew_dispatch()
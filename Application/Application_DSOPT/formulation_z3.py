@@ -1,16 +1,8 @@
 import sys
 import os
 import time
-import pandas as pd
 import numpy as np
 import math
-import sympy as sy
-import matplotlib
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-import os
-import ast
-import networkx as nx
 import operator
 from collections import OrderedDict
 
@@ -28,6 +20,13 @@ class OutageManageZ3(OutageManage):
     crew dispatch and flow-driven crew dispatch in z3
     """
 
+    ## solution families by the names of the other backends: (attribute of the z3 variables, index sets)
+    family = OrderedDict([('rho', ('Rho', ['iter_bus', 'iter_time'])),
+                          ('ul', ('Ul', ['iter_line', 'iter_time'])),
+                          ('z', ('Line_bin', ['ordered_vertex', 'iter_time'])),
+                          ('beta', ('Beta', ['iter_line', 'iter_orientation', 'iter_time'])),
+                          ('Pl', ('Pl', ['iter_line', 'iter_time']))])
+
 
     ## define If-then constraints for total time
     def time_fn(self, c1, c2):
@@ -51,6 +50,12 @@ class OutageManageZ3(OutageManage):
 
 
 
+    def get_model_size(self):
+        return (None, len(self.s.assertions()), None)
+
+
+
+    @profile('form')
     def form_crew_dispatch(self, Route_Example=None):
         """
 
@@ -97,12 +102,11 @@ class OutageManageZ3(OutageManage):
         ## Convert the line time availability instant into a vector
         for i in range(self.number_vertex):
             for j in self.iter_time:
-                self.s.add(self.Line_bin[i][j] == z3.If(self.Line_ava[i] >= j, False, True))
+                self.s.add(self.Line_bin[i][j] == z3.If(self.Line_ava[i] >= int(self.time_point[j] - self.time_weight[j] + 1), False, True))
 
         ## Add the crew dispatch valid inequalities
         ## Minimum time that line k could be available if the crew repair k first
-        for i in self.line_damaged:
-            idd = self.ordered_vertex.index(i)
+        for idd in self.index.damaged_vertex:
             self.s.add(self.Line_ava[idd] >= self.ordered_total_time[0, idd])
 
         if Route_Example != None:
@@ -112,6 +116,7 @@ class OutageManageZ3(OutageManage):
 
 
 
+    @profile('form')
     def form_network_operation(self, ppc):
         ## line switch variables
         self.Ul = [[z3.Bool('ul_{}_time_{}'.format(i, t)) for t in self.iter_time] for i in range(self.number_line)]
@@ -120,7 +125,7 @@ class OutageManageZ3(OutageManage):
         self.Pl = [[z3.Int('pl_{}_time_{}'.format(i, t)) for t in self.iter_time] for i in range(self.number_line)]
 
         ## tree topology constraint variables
-        self.Beta = [[[z3.Bool('beta_{}_{}_time_{}'.format(i, j, t)) for t in self.iter_time] for j in range(self.number_bus)] for i in range(self.number_bus)]
+        self.Beta = [[[z3.Bool('beta_{}_{}_time_{}'.format(i, o, t)) for t in self.iter_time] for o in self.iter_orientation] for i in range(self.number_line)]
 
         ## load status variables
         self.Rho = [[z3.Bool('rho_{}_time_{}'.format(i, t)) for t in self.iter_time] for i in range(self.number_bus)]
@@ -130,45 +135,39 @@ class OutageManageZ3(OutageManage):
             for i in range(self.number_bus):
                 self.s.add(z3.If(self.Rho[i][t], 1, 0) >= z3.If(self.Rho[i][t - 1], 1, 0))
 
+        idx = self.index
+
         ## static line cannot change
         for t in self.iter_time:
-            for i in self.line_static:
-                # get the matrix index from the component name
-                id = int(i[i.find('_') + 1:]) - 1
+            for id in idx.line_static:
                 self.s.add(self.Ul[id][t] == True)
 
         ## Damaged line can be closed if and only if it is repaired first
         for t in self.iter_time:
-            for i in self.line_damaged:
-                # get the matrix index from the component name
-                id_line = int(i[i.find('_') + 1:]) - 1
-                # get the index from the component name corresponding to the index in the crew dispatch problem
-                id_route = self.ordered_vertex.index(i)
+            # the line index and the corresponding index in the crew dispatch problem
+            for id_route, id_line in zip(idx.damaged_vertex, idx.damaged_line):
                 self.s.add(z3.If(self.Ul[id_line][t], 1, 0) <= z3.If(self.Line_bin[id_route][t], 1, 0))
 
         # # # # Once a damaged line is closed, it cannot be opened
         for t in range(1, self.Total_Time):  # use set type as iterators are easy to implement N\{m} type of constraints
-            for i in self.line_damaged:
-                # get the matrix index from the component name
-                id = int(i[i.find('_') + 1:]) - 1
+            for id in idx.damaged_line:
                 self.s.add(z3.If(self.Ul[id][t], 1, 0) >= z3.If(self.Ul[id][t - 1], 1, 0))
 
         # # substation bus does not have parent bus
         for t in self.iter_time:
-            self.s.add(self.Beta[1][0][t] == False)  # hard coded
+            for k, o in idx.bus_arc_in[idx.substation]:
+                self.s.add(self.Beta[k][o][t] == False)
 
         # # each bus will only at least have one parent bus
         for t in self.iter_time:
             for j in range(self.number_bus):
-                self.s.add(sum(z3.If(self.Beta[i][j][t], 1, 0) for i in range(self.number_bus)) <= 1)
+                if len(idx.bus_arc_in[j]) > 0:
+                    self.s.add(sum(z3.If(self.Beta[k][o][t], 1, 0) for k, o in idx.bus_arc_in[j]) <= 1)
 
+        # # a closed line has exactly one orientation
         for t in self.iter_time:
             for i in range(self.number_line):
-                # for this line, get the bus index
-                f_bus = int(ppc['line'][i, 1]) - 1
-                t_bus = int(ppc['line'][i, 2]) - 1
-                self.s.add(z3.If(self.Beta[f_bus][t_bus][t], 1, 0) + z3.If(self.Beta[t_bus][f_bus][t], 1, 0) == z3.If(
-                    self.Ul[i][t], 1, 0))
+                self.s.add(z3.If(self.Beta[i][0][t], 1, 0) + z3.If(self.Beta[i][1][t], 1, 0) == z3.If(self.Ul[i][t], 1, 0))
 
         ## Fictitious power flow constraint
         ### Here we will use a power flow-like constraint, where each line contains an integer variable to represent its line flow line flow limit
@@ -181,31 +180,9 @@ class OutageManageZ3(OutageManage):
         ### DistFlow constraint: power balance at bus i
         for t in self.iter_time:
             for i in range(1, self.number_bus):  # looping from bus 1, substation bus will be considered specifically
-                P_out = 0
-                P_in = 0
-
-                # create bus name
-                bus_name = 'bus_{}'.format(i + 1)
-
-                # get power flow variables flowing out from this bus
-                iter_out = np.arange(0, len(self.bus_line[bus_name]["line_from_this_bus"]))
-
-                if iter_out.shape[0] == 0:
-                    P_out = P_out
-                else:
-                    for k in iter_out:
-                        aaa = int(self.bus_line[bus_name]["line_from_this_bus"][k]) - 1
-                        P_out = P_out + self.Pl[aaa][t]
-
-                # get power flow variables flowing into from this bus
-                iter_in = np.arange(0, len(self.bus_line[bus_name]["line_to_this_bus"]))
-
-                if iter_in.shape[0] == 0:
-                    P_in = P_in
-                else:
-                    for k in iter_in:
-                        aaa = int(self.bus_line[bus_name]["line_to_this_bus"][k]) - 1
-                        P_in = P_in + self.Pl[aaa][t]
+                # get power flow variables flowing out from and into this bus
+                P_out = sum(self.Pl[k][t] for k in idx.bus_line_out[i])
+                P_in = sum(self.Pl[k][t] for k in idx.bus_line_in[i])
 
                 # if this is a bus with generation capability and load, the power flow balance is
                 if ppc['bus'][i, 1] == 1:
@@ -217,6 +194,7 @@ class OutageManageZ3(OutageManage):
 
 
 
+    @profile('form')
     def define_objective(self, ppc):
         # # # objective 1: minimize total time
         # obj_1 = Time_accum[number_vertex - 1]
@@ -227,13 +205,14 @@ class OutageManageZ3(OutageManage):
         # objective 3: served energy should be maximized
         self.EnergyServed = z3.Int('EnergyServed')
         self.s.add(self.EnergyServed == sum(
-            sum(ppc['bus'][i, 4] * 1000 * z3.If(self.Rho[i][j], 1, 0) for i in range(self.number_bus)) for j in self.iter_time))
+            sum(ppc['bus'][i, 4] * 1000 * int(self.time_weight[j]) * z3.If(self.Rho[i][j], 1, 0) for i in range(self.number_bus)) for j in self.iter_time))
 
         # summation the objectives
         self.s.maximize(self.EnergyServed)
 
 
 
+    @profile('form')
     def form_mp(self, ppc, Route_Example=None):
         """
         formulate the master problem in Z3
@@ -244,6 +223,80 @@ class OutageManageZ3(OutageManage):
 
 
 
+    @profile('solve')
+    def solve_problem(self):
+        """
+        check the satisfiability and keep the model of the optimal solution
+        """
+        result = self.s.check()
+        if result == z3.sat:
+            self.solution = self.s.model()
+        return result
+
+
+
+    def get_solution_family(self, VariableName):
+        """
+        the values of all constants of the z3 model are read in one pass over the model and kept until the next solve,
+        a variable the model leaves unassigned is zero (false)
+        """
+        attribute, sets = self.family[VariableName]
+        variable = getattr(self, attribute)
+        sets = [list(getattr(self, k)) for k in sets]
+
+        if getattr(self, 'SolutionValue', (None,))[0] is not self.solution:
+            value = {}
+            for d in self.solution.decls():
+                v = self.solution[d]
+                if z3.is_true(v) or z3.is_false(v):
+                    value[d.name()] = float(z3.is_true(v))
+                elif z3.is_int_value(v):
+                    value[d.name()] = float(v.as_long())
+            self.SolutionValue = (self.solution, value)
+        value = self.SolutionValue[1]
+
+        for d in range(len(sets) - 1):
+            variable = [v for row in variable for v in row]
+        return np.reshape(np.array([value.get(v.decl().name(), 0) for v in variable]), tuple(len(k) for k in sets)), sets
+
+
+
+    def get_objective(self):
+        return float(self.solution[self.EnergyServed].as_long()) * self.BasePower / 1000
+
+
+
+    @profile('extract')
+    def get_route(self):
+        ## hard coded for single crew as the route of the SMT formulation
+        Route_scenario = [self.solution[self.Route[i]].as_long() for i in range(self.number_vertex)]
+        return tuple((0, self.ordered_vertex[i], self.ordered_vertex[j]) for i, j in zip(Route_scenario[:-1], Route_scenario[1:]))
+
+
+
+    @profile('extract')
+    def get_repair_status(self):
+        return self.get_solution_family('z')[0].astype(int)
+
+
+
+    @profile('cut')
+    def add_benders_cut(self, route, ObjVal_sp=None):
+        """
+        add the optimality cut: if Route = Route_scenario, then EnergyServed <= ObjVal_sp,
+        or the no-good cut: Route != Route_scenario
+        cuts of the optimize object cannot be removed, so no handle is returned
+        """
+        Route_scenario = [self.ordered_vertex.index(i[1]) for i in route] + [self.ordered_vertex.index(route[-1][2])]
+        selected = z3.And([self.Route[i] == Route_scenario[i] for i in range(len(Route_scenario))])
+        if ObjVal_sp is None:
+            self.s.add(z3.Not(selected))
+        else:
+            self.s.add(z3.Implies(selected, self.EnergyServed <= int(math.floor(ObjVal_sp * 1000 / self.BasePower + 1e-6))))
+        return None
+
+
+
 
 if __name__=="__main__":
 
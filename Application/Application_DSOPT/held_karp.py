@@ -0,0 +1,163 @@
+import time
+import numpy as np
+from collections import OrderedDict
+
+from formulation_general import SolutionDict
+from crew_heuristic import CrewRouting
+
+
+
+class HeldKarp(CrewRouting):
+    """
+    Exact crew dispatch of small instances by the Held-Karp dynamic program over the subsets of damaged vertices
+    The objective is the restoration-weighted completion time of CrewRouting. Travelling to vertex j delays all the
+    vertices still to be visited, so G[S, i], the cost of visiting the subset S after finishing at i, is
+    min over j in S of total_time[i, j] * weight(S) + G[S - {j}, j], computed for all S of the same size at once.
+    Several crews share the damaged vertices by combining the tables of the crews over the subsets.
+    The time and memory grow with 2^n for one crew and 4^n for several crews, n the number of damaged vertices.
+    """
+
+    def get_arc_time(self, c):
+        """
+        get the total time of crew c from the damaged vertices and the origin (last row) to the damaged vertices
+        """
+        return self.total_time[c][np.ix_(np.append(self.damaged, self.origin), self.damaged)]
+
+
+
+    def get_table(self, c, chunk_size=2 ** 22):
+        """
+        get the dynamic programming table of crew c
+        :return: G as an array of (subset, vertex), the last column is the origin
+        """
+        n = len(self.damaged)
+        total = self.get_arc_time(c)
+
+        subset = np.arange(1 << n)
+        member = ((subset[:, None] >> np.arange(n)[None, :]) & 1).astype(bool)
+        subset_weight = member.dot(self.weight[self.damaged])
+        size = member.sum(axis=1)
+
+        G = np.full((1 << n, n + 1), np.inf)
+        G[0] = 0
+        for k in range(1, n + 1):
+            S = subset[size == k]
+            for chunk in np.array_split(S, max(1, len(S) * (n + 1) * n // chunk_size)):
+                ## G[S - {j}, j] for j in S
+                previous = np.where(member[chunk], G[chunk[:, None] ^ (1 << np.arange(n))[None, :], np.arange(n)[None, :]], np.inf)
+                G[chunk] = (total[None, :, :] * subset_weight[chunk][:, None, None] + previous[:, None, :]).min(axis=2)
+        return G
+
+
+
+    def get_sequence(self, c, G, S):
+        """
+        get the visiting order of the subset S of crew c from its table G
+        """
+        n = len(self.damaged)
+        total = self.get_arc_time(c)
+        weight = self.weight[self.damaged]
+
+        sequence = []
+        i = n
+        while S:
+            j = np.flatnonzero((S >> np.arange(n)) & 1)
+            k = j[np.argmin(total[i, j] * weight[j].sum() + G[S ^ (1 << j), j])]
+            sequence.append(int(self.damaged[k]))
+            S = S ^ (1 << int(k))
+            i = k
+        return sequence
+
+
+
+    def solve(self):
+        """
+        solve the dynamic program of each crew and share the damaged vertices among the crews
+        :return: routes as a list of vertex rows for each crew from the origin to the end
+        """
+        start = time.time()
+        n = len(self.damaged)
+        subset = np.arange(1 << n)
+        table = [self.get_table(c) for c in range(self.number_crew)]
+
+        ## F[S]: best cost of the subset S served by the crews so far, choice[c][S]: subset of crew c in it
+        F = table[0][:, n]
+        choice = [None]
+        for c in range(1, self.number_crew):
+            F_crew = F.copy()
+            choice.append(np.zeros(1 << n, dtype=int))
+            for T in range(1, 1 << n):
+                S = subset[(subset & T) == T]
+                value = F[S ^ T] + table[c][T, n]
+                better = value < F_crew[S]
+                F_crew[S[better]] = value[better]
+                choice[c][S[better]] = T
+            F = F_crew
+
+        S = (1 << n) - 1
+        assigned = [0] * self.number_crew
+        for c in range(self.number_crew - 1, 0, -1):
+            assigned[c] = choice[c][S]
+            S = S ^ assigned[c]
+        assigned[0] = S
+
+        self.sequence = [self.get_sequence(c, table[c], assigned[c]) for c in range(self.number_crew)]
+        self.time = time.time() - start
+        self.ObjVal = self.get_objective()
+        return self.get_path()
+
+
+
+
+def solve_held_karp(vrp, weight=None):
+    """
+    solve the crew dispatch of a vehicle routing problem exactly
+    :param vrp: dictionary of the vehicle routing problem, e.g. from Fun_Crew_Dispatch
+    :param weight: dictionary of vertex name to restoration weight, one for each damaged vertex if None
+    :return: SolutionDict of crew to the arcs 'x', the 'route', the arrival time 'AT' and the repair completion time
+             'finish' of the vertices as in get_solution_route, with the restoration-weighted completion time in ObjVal
+    """
+    vertex = vrp['ordered_vertex']
+    if hasattr(vrp['travel'], 'get_matrix'):
+        travel = vrp['travel'].get_matrix(vertex).astype(float)
+    else:
+        travel = np.array([[vrp['travel'][i][j] for j in vertex] for i in vertex], dtype=float)
+    np.fill_diagonal(travel, 0)
+    repair = np.array([[vrp['repair'][c][m] for m in vertex] for c in vrp['iter_crew']], dtype=float)
+    damaged = [k for k, m in enumerate(vertex) if m not in ('0', 'd')]
+    w = np.array([0 if m in ('0', 'd') else (1 if weight is None else weight[m]) for m in vertex], dtype=float)
+
+    solver = HeldKarp(travel[None, :, :] + repair[:, None, :], damaged, vertex.index('0'), vertex.index('d'), w)
+    path = solver.solve()
+    finish = solver.get_finish_time()
+
+    SolDict = SolutionDict()
+    for k, c in enumerate(vrp['iter_crew']):
+        SolDict[c] = OrderedDict()
+        route = [(vertex[i], vertex[j]) for i, j in zip(path[k][:-1], path[k][1:])]
+        SolDict[c]['x'] = OrderedDict(((i, j), 1 if (i, j) in route else 0) for i in vertex for j in vertex)
+        SolDict[c]['route'] = route
+        SolDict[c]['AT'] = OrderedDict((vertex[j], finish[k, j] - repair[k, j]) for j in path[k])
+        SolDict[c]['finish'] = OrderedDict((vertex[j], finish[k, j]) for j in path[k])
+    SolDict.ObjVal = solver.ObjVal
+    SolDict.time = solver.time
+
+    return SolDict
+
+
+
+def oracle(om, max_damaged=15, weight=None):
+    """
+    candidate route of the master problem from the dynamic program if the instance is small enough,
+    e.g. as the oracle hook of BendersEngine
+    :param om: master problem after data_preparation
+    :param max_damaged: largest number of damaged vertices solved by the dynamic program
+    :return: list of (route, repair_status), empty for larger instances
+    """
+    if len(om.index.damaged_vertex) > max_damaged:
+        return []
+
+    solver = HeldKarp.from_model(om, weight)
+    solver.solve()
+    route, arrival = solver.get_start()
+    return [(route, om.get_repair_start(route, arrival)[1])]
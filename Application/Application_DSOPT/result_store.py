@@ -0,0 +1,346 @@
+import os
+import json
+import numpy as np
+from collections import OrderedDict
+
+from formulation_general import SolutionDict
+
+
+
+## dtype of the fields of add_model, status fields are binary and the others are single precision
+FIELD_DTYPE = OrderedDict([('rho', np.int8), ('ul', np.int8), ('z', np.int8), ('f', np.int8),
+                           ('P', np.float32), ('Q', np.float32), ('V', np.float32), ('p', np.float32), ('q', np.float32)])
+
+## records of the ragged fields of add_model, one row per repaired vertex of a scenario
+ROUTE_DTYPE = np.dtype([('crew', np.int32), ('start', 'U32'), ('end', 'U32')])
+REPAIR_DTYPE = np.dtype([('crew', np.int32), ('vertex', 'U32'), ('arrival', np.float32), ('finish', np.float32)])
+
+
+
+class ResultStore(object):
+    """
+    Columnar store of the solutions of many restoration scenarios in a directory
+    A dense field, e.g. the load status rho of (bus, time), has the same shape in all scenarios and is stored as an
+    array of (scenario, bus, time). A ragged field, e.g. the route, is a structured array of records per scenario
+    stored one scenario after the other with the offset of each scenario. The scenarios are written in segments of
+    segment_size scenarios, one .npy file per field and segment, so a reader memory-maps the segments and only reads
+    the scenarios it slices. store.json holds the fields with their dtype and labels, the segments and the scenario
+    names and metadata; it is replaced after each segment, so a reader sees the segments written so far.
+    Only one process writes a store.
+    """
+
+    def __init__(self, directory, mode='r', segment_size=256):
+        """
+        :param directory: directory of the store
+        :param mode: 'r' to read, 'w' to create a new store, 'a' to add scenarios to an existing store
+        :param segment_size: number of scenarios of a segment
+        """
+        self.directory = directory
+        self.mode = mode
+        self.segment_size = segment_size
+        self.buffer = []
+        self.mmap = OrderedDict()
+
+        filename = os.path.join(directory, 'store.json')
+        if mode == 'w' or (mode == 'a' and not os.path.isfile(filename)):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.info = OrderedDict([('field', OrderedDict()), ('segment', []), ('scenario', []), ('metadata', [])])
+        else:
+            with open(filename) as f:
+                self.info = json.load(f, object_pairs_hook=OrderedDict)
+        self.start = np.cumsum([0] + self.info['segment'])
+
+
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+
+    def __len__(self):
+        return len(self.info['scenario'])
+
+
+
+    def add(self, name, metadata=None, label=None, **field):
+        """
+        add the solution of a scenario
+        :param name: scenario name
+        :param metadata: dictionary of the scenario, e.g. the damaged lines and the fault center, written as json
+        :param label: dictionary of field to the labels of each dimension of a dense field, kept from the first scenario
+        :param field: array, SolutionDict or structured record array of each field, e.g. rho=..., route=...
+                      all scenarios of a store have the same fields
+        """
+        if self.mode == 'r':
+            raise IOError('the store {} is open for reading'.format(self.directory))
+
+        value = OrderedDict()
+        label = {} if label is None else label
+        for key, v in field.items():
+            if isinstance(v, SolutionDict):
+                label.setdefault(key, [list(v.keys())])
+                v = v.get_matrix()
+            v = np.asarray(v)
+            if key not in self.info['field']:
+                if len(self) + len(self.buffer) > 0:
+                    raise ValueError('the field {} is not in the scenarios of the store'.format(key))
+                self.info['field'][key] = OrderedDict([
+                    ('ragged', v.dtype.names is not None),
+                    ('dtype', v.dtype.descr if v.dtype.names is not None else v.dtype.str),
+                    ('shape', None if v.dtype.names is not None else list(v.shape)),
+                    ('label', [get_label(k) for k in label[key]] if key in label else None)])
+            value[key] = v
+
+        for key, info in self.info['field'].items():
+            if key not in value:
+                raise ValueError('the field {} of the store is missing'.format(key))
+            if not info['ragged'] and list(value[key].shape) != info['shape']:
+                raise ValueError('the field {} has the shape {} instead of {}'.format(key, value[key].shape, tuple(info['shape'])))
+
+        self.buffer.append((name, metadata if metadata is not None else {}, value))
+        if len(self.buffer) >= self.segment_size:
+            self.flush()
+
+
+
+    def add_model(self, om, name, metadata=None, field=tuple(FIELD_DTYPE.keys()), vrp=None):
+        """
+        add the solution of a solved outage management problem by the bulk extraction of get_solution_family,
+        the families in field the model does not have or the backend cannot extract are skipped
+        The route and the repair times are added as the ragged fields route and repair if the model has a crew dispatch
+        and the backend implements get_route and get_arrival_time.
+        :param om: solved OutageManage of any backend
+        :param vrp: vrp dictionary of the repair times, om.vrp if None
+        """
+        value, label = OrderedDict(), OrderedDict()
+        for key in field:
+            try:
+                array, label[key] = om.get_solution_family(key)
+            except (KeyError, AttributeError, NotImplementedError):
+                continue
+            value[key] = get_typed(array, FIELD_DTYPE.get(key, np.float64))
+
+        try:
+            route = om.get_route()
+            arrival = om.get_arrival_time()
+        except (KeyError, AttributeError, NotImplementedError):
+            route = None
+        if route is not None:
+            vrp = om.vrp if vrp is None else vrp
+            crew = OrderedDict((c, k) for k, c in enumerate(vrp['iter_crew']))
+            value['route'] = np.array([(crew[c], i, j) for c, i, j in route], dtype=ROUTE_DTYPE)
+            value['repair'] = np.array([(crew[c], j, arrival[c, j], arrival[c, j] + vrp['repair'][c][j])
+                                        for c, i, j in route if j != 'd'], dtype=REPAIR_DTYPE)
+
+        self.add(name, metadata, label, **value)
+
+
+
+    def flush(self):
+        """
+        write the buffered scenarios as a segment
+        """
+        if not self.buffer:
+            return
+
+        segment = len(self.info['segment'])
+        for key, info in self.info['field'].items():
+            value = [v[key] for _, _, v in self.buffer]
+            if info['ragged']:
+                dtype = np.dtype([tuple(k) for k in info['dtype']])
+                offset = np.cumsum([0] + [len(v) for v in value]).astype(np.int64)
+                save(self.get_file(key, segment, 'offset'), offset)
+                save(self.get_file(key, segment), np.concatenate([np.asarray(v, dtype=dtype) for v in value]))
+            else:
+                save(self.get_file(key, segment), np.stack(value).astype(info['dtype'], copy=False))
+
+        self.info['segment'].append(len(self.buffer))
+        self.info['scenario'].extend(name for name, _, _ in self.buffer)
+        self.info['metadata'].extend(metadata for _, metadata, _ in self.buffer)
+        self.start = np.cumsum([0] + self.info['segment'])
+        self.buffer = []
+
+        ## replace the index last so that a concurrent reader never sees a segment that is not complete
+        filename = os.path.join(self.directory, 'store.json')
+        temporary = '{}.{}.tmp'.format(filename, os.getpid())
+        with open(temporary, 'w') as f:
+            json.dump(self.info, f, default=get_json)
+        os.replace(temporary, filename)
+
+
+
+    def close(self):
+        if self.mode != 'r':
+            self.flush()
+        self.mmap = OrderedDict()
+
+
+
+    def get_file(self, key, segment, part=None):
+        return os.path.join(self.directory, '{}.{:05d}{}.npy'.format(key, segment, '' if part is None else '.' + part))
+
+
+
+    def load(self, key, segment, part=None):
+        """
+        get the memory map of a segment file, kept open for the next slices
+        """
+        filename = self.get_file(key, segment, part)
+        if filename not in self.mmap:
+            self.mmap[filename] = np.load(filename, mmap_mode='r')
+        return self.mmap[filename]
+
+
+
+    def get_scenario(self, scenario=None):
+        """
+        get the scenario rows of a selection
+        :param scenario: scenario row, slice, list of rows or scenario names, all if None
+        :return: integer array of rows
+        """
+        rows = np.arange(len(self))
+        if scenario is None:
+            return rows
+        if isinstance(scenario, str) or (isinstance(scenario, (list, tuple)) and scenario and isinstance(scenario[0], str)):
+            position = OrderedDict((name, k) for k, name in enumerate(self.info['scenario']))
+            return np.array([position[name] for name in ([scenario] if isinstance(scenario, str) else scenario)])
+        return np.atleast_1d(rows[scenario])
+
+
+
+    def get(self, key, scenario=None):
+        """
+        get a dense field of a selection of scenarios from the memory-mapped segments
+        :param scenario: scenario row, slice, list of rows or scenario names, all if None
+        :return: array of (row, ...) for a single scenario row or name and of (scenario, row, ...) otherwise,
+                 a read-only view of the memory map if the scenarios are in one segment and contiguous
+        """
+        if self.info['field'][key]['ragged']:
+            raise ValueError('{} is a ragged field, use get_records'.format(key))
+        rows = self.get_scenario(scenario)
+        segment = np.searchsorted(self.start, rows, side='right') - 1
+
+        if len(rows) > 0 and segment[0] == segment[-1] and np.all(np.diff(rows) == 1):
+            value = self.load(key, segment[0])[rows[0] - self.start[segment[0]]:rows[-1] - self.start[segment[0]] + 1]
+        elif len(rows) > 0:
+            value = np.concatenate([self.load(key, s)[rows[segment == s] - self.start[s]] for s in np.unique(segment)])
+            value = value[np.argsort(np.argsort(segment, kind='stable'), kind='stable')]
+        else:
+            value = np.empty([0] + self.info['field'][key]['shape'], dtype=self.info['field'][key]['dtype'])
+        return value[0] if np.isscalar(scenario) else value
+
+
+
+    def get_records(self, key, scenario):
+        """
+        get the records of a ragged field of one scenario, e.g. the route
+        :param scenario: scenario row or name
+        :return: read-only structured array
+        """
+        row = self.get_scenario(scenario)[0]
+        segment = np.searchsorted(self.start, row, side='right') - 1
+        offset = self.load(key, segment, 'offset')
+        return self.load(key, segment)[offset[row - self.start[segment]]:offset[row - self.start[segment] + 1]]
+
+
+
+    def get_solution_dict(self, key, scenario, SolDict=None):
+        """
+        get a dense field of one scenario as a SolutionDict of its row labels, e.g. for plot_bin_2d,
+        the rows are views of the memory map
+        """
+        label = self.info['field'][key]['label']
+        value = self.get(key, self.get_scenario(scenario)[0])
+        return SolutionDict.from_array(value, label[0] if label is not None else range(value.shape[0]), SolDict)
+
+
+
+    def get_metadata(self, scenario=None):
+        """
+        :return: list of the metadata dictionaries of a selection of scenarios
+        """
+        return [self.info['metadata'][k] for k in self.get_scenario(scenario)]
+
+
+
+    def to_npz(self, filename, field=None):
+        """
+        write the whole store or some fields to one compressed .npz file, e.g. to share a study,
+        a ragged field is written with its offset over all scenarios as <field>_offset
+        """
+        field = list(self.info['field'].keys()) if field is None else field
+        array = OrderedDict([('scenario', np.array(self.info['scenario'])),
+                             ('metadata', np.array(json.dumps(self.info['metadata'], default=get_json)))])
+        for key in field:
+            if self.info['field'][key]['ragged']:
+                offset = [self.load(key, s, 'offset') for s in range(len(self.info['segment']))]
+                total = np.cumsum([0] + [k[-1] for k in offset])
+                array[key] = np.concatenate([self.load(key, s) for s in range(len(offset))])
+                array[key + '_offset'] = np.concatenate([np.asarray(k[:-1]) + total[s] for s, k in enumerate(offset)] + [total[-1:]])
+            else:
+                array[key] = self.get(key)
+        np.savez_compressed(filename, **array)
+
+
+
+    def to_parquet(self, filename, key):
+        """
+        write a field to a Parquet table with one row per scenario and entry, e.g. for a dashboard,
+        needs pandas with pyarrow or fastparquet
+        """
+        import pandas as pd
+
+        info = self.info['field'][key]
+        if info['ragged']:
+            table = []
+            for k, name in enumerate(self.info['scenario']):
+                records = pd.DataFrame.from_records(np.asarray(self.get_records(key, k)))
+                records.insert(0, 'scenario', name)
+                table.append(records)
+            table = pd.concat(table, ignore_index=True)
+        else:
+            value = self.get(key)
+            label = info['label'] if info['label'] is not None else [list(range(n)) for n in info['shape']]
+            index = pd.MultiIndex.from_product([self.info['scenario']] + [[str(i) for i in k] for k in label],
+                                               names=['scenario'] + ['index_{}'.format(d) for d in range(len(label))])
+            table = pd.DataFrame({key: np.asarray(value).ravel()}, index=index).reset_index()
+        table.to_parquet(filename)
+
+
+
+
+def get_typed(value, dtype):
+    """
+    get an array in the dtype of a field, integer fields are rounded, e.g. binary status values of a MIP solution
+    """
+    value = np.asarray(value)
+    if np.issubdtype(dtype, np.integer):
+        return np.rint(np.nan_to_num(value)).astype(dtype)
+    return value.astype(dtype)
+
+
+
+def get_label(label):
+    return [k.item() if isinstance(k, np.generic) else k for k in label]
+
+
+
+def get_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+
+def save(filename, value):
+    temporary = '{}.{}.tmp.npy'.format(filename[:-len('.npy')], os.getpid())
+    np.save(temporary, value)
+    os.replace(temporary, filename)
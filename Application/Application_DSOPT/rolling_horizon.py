@@ -0,0 +1,165 @@
+import time
+import numpy as np
+from collections import OrderedDict
+
+from formulation_general import OutageManage
+
+
+
+class RollingHorizon(object):
+    """
+    Rolling-horizon solution of the co-optimization (form_cop) over overlapping windows of the horizon
+    Each window is formulated on a time grid of its own, see get_time_bucket: one bucket for the steps committed before
+    the window, unit steps in the window and coarse buckets for the rest of the horizon, so that the repairs after the
+    window still count in the served energy. Only the first step steps of a window are committed.
+    Between the windows the travelled arcs and their arrival times are fixed, the damaged lines already closed and
+    the loads already picked up are carried to the first step of the next window, and the crew dispatch of the
+    previous window is the start solution of the next one.
+    Any OutageManage backend that implements form_cop, solve_problem, get_objective, get_route, get_network_status,
+    get_arrival_time, fix_route and set_initial_status can solve the windows. The warm start is skipped for a backend
+    that does not implement set_start, e.g. OutageManageHighs.
+
+    Hooks:
+    setup: function called with each formulated window before it is solved, e.g. to set the solver parameters
+    """
+
+    def __init__(self, cls, ppc, vrp, window=20, step=10, Total_Time=None, tail_width=10, warm_start=True, setup=None,
+                 verbose=True):
+        """
+        :param cls: OutageManage backend class of the windows
+        :param window: number of unit time steps of a window
+        :param step: number of unit time steps committed per window, at most window
+        :param Total_Time: number of unit time steps of the horizon, Total_Time of cls if None
+        :param tail_width: width of the buckets after the window, None for a single bucket
+        :param warm_start: start each window from the crew dispatch of the previous one if cls implements set_start
+        """
+        if not 0 < step <= window:
+            raise ValueError('the committed steps must be a positive number not larger than the window')
+
+        self.cls = cls
+        self.ppc = ppc
+        self.vrp = vrp
+        self.window = window
+        self.step = step
+        self.Total_Time = cls.Total_Time if Total_Time is None else Total_Time
+        self.tail_width = tail_width
+        self.warm_start = warm_start and cls.set_start is not OutageManage.set_start
+        self.setup = setup
+        self.verbose = verbose
+
+        self.history = []
+
+
+
+    def get_time_bucket(self, start):
+        """
+        get the time grid of the window starting at unit time step start
+        :return: list of bucket widths, time index of the unit time step start
+        """
+        end = min(start + self.window, self.Total_Time)
+        tail = self.Total_Time - end
+        if self.tail_width is None or tail <= self.tail_width:
+            tail_bucket = [tail] if tail > 0 else []
+        else:
+            tail_bucket = [self.tail_width] * (tail // self.tail_width) + ([tail % self.tail_width] if tail % self.tail_width else [])
+
+        if start > 0:
+            return [start] + [1] * (end - start) + tail_bucket, 1
+        else:
+            return [1] * (end - start) + tail_bucket, 0
+
+
+
+    def get_committed_route(self, route, arrival, end):
+        """
+        get the arcs the crews have started to travel before the unit time step end and the arrival times on them
+        """
+        route_commit = tuple(k for k in route if arrival[k[0], k[1]] + self.vrp['repair'][k[0]][k[1]] < end)
+        arrival_commit = OrderedDict()
+        for c, i, j in route_commit:
+            arrival_commit[c, i] = arrival[c, i]
+            arrival_commit[c, j] = arrival[c, j]
+        return route_commit, arrival_commit
+
+
+
+    def run(self):
+        """
+        solve the windows from the start to the end of the horizon
+        :return: served energy of the committed steps, route
+        """
+        line_status = None
+        load_status = None
+        route = ()
+        arrival = OrderedDict()
+        route_commit = ()
+        arrival_commit = OrderedDict()
+
+        start = 0
+        while start < self.Total_Time:
+            record = OrderedDict([('window', len(self.history) + 1), ('start', start)])
+            time_bucket, offset = self.get_time_bucket(start)
+            end = self.Total_Time if start + self.window >= self.Total_Time else start + self.step
+
+            # ---------------------------------------------------
+            #       Formulate the window and fix the committed decisions
+            # ---------------------------------------------------
+            build_start = time.time()
+            model = self.cls()
+            model.data_preparation(self.ppc, self.vrp, time_bucket)
+            model.form_cop()
+            if start > 0:
+                model.fix_route(route_commit, arrival_commit)
+                model.set_initial_status(line_status[:, -1], load_status[:, -1], offset)
+                if self.warm_start:
+                    model.set_start(route, arrival)
+            if self.setup is not None:
+                self.setup(model)
+            record['time_build'] = time.time() - build_start
+
+            # ---------------------------------------------------
+            #       Solve the window
+            # ---------------------------------------------------
+            solve_start = time.time()
+            model.solve_problem()
+            record['time_solve'] = time.time() - solve_start
+
+            # ---------------------------------------------------
+            #       Commit the first steps and carry the state
+            # ---------------------------------------------------
+            route = model.get_route()
+            arrival = model.get_arrival_time()
+            line, load = model.get_network_status()
+            line = np.rint(line[:, offset:offset + end - start])
+            load = np.rint(load[:, offset:offset + end - start])
+            line_status = line if line_status is None else np.hstack((line_status, line))
+            load_status = load if load_status is None else np.hstack((load_status, load))
+            route_commit, arrival_commit = self.get_committed_route(route, arrival, end)
+
+            record['end'] = end
+            record['ObjVal'] = model.get_objective()
+            record['ObjVal_commit'] = np.dot(model.index.bus_load_P, load).sum() * model.BasePower
+            record['route_commit'] = len(route_commit)
+            self.history.append(record)
+            self.log(record)
+
+            start = end
+
+        self.line_status = line_status
+        self.load_status = load_status
+        self.route = route
+        self.arrival = arrival
+
+        return sum(record['ObjVal_commit'] for record in self.history), route
+
+
+
+    def log(self, record):
+        """
+        print the record of a window
+        """
+        if not self.verbose:
+            return
+        print('Window {}: steps {} to {}, objective {}, committed served energy {}, committed arcs {}'.format(
+            record['window'], record['start'], record['end'], record['ObjVal'], record['ObjVal_commit'], record['route_commit']))
+        print('    ' + ', '.join('{} {:.3f} s'.format(k, v) for k, v in record.items() if k.startswith('time_')))
@@ -0,0 +1,62 @@
+import sys
+import time
+import numpy as np
+
+import Fun_IEEETestCase as case
+import Fun_Crew_Dispatch as c_d
+import formulation_highs as fh
+from formulation_general import get_time_bucket
+
+## check the graph-based restoration bounds against the HiGHS subproblem on a synthetic feeder with DG:
+## lower bound <= served energy of the subproblem <= upper bound for random repair schedules of random damage scenarios
+## the exit status is 1 if a bound is violated
+## usage: python run_benchmark_bound.py [number of scenarios] [number of schedules] [number of DG] [seed]
+number_scenario = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+number_schedule = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+number_dg = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+seed = int(sys.argv[4]) if len(sys.argv) > 4 else 5
+
+## relative tolerance of the comparison, the subproblem is solved to the default MIP gap of HiGHS
+tolerance = 1e-3
+
+
+
+def random_schedule(sp, rng):
+    """
+    repair status of (vertex, time) where each damaged component is repaired at a random time step of the horizon
+    """
+    finish = rng.integers(0, sp.time_point[-1] + 2, sp.number_vertex)
+    return (sp.time_point[None, :] >= finish[:, None]).astype(float)
+
+
+
+if __name__ == "__main__":
+
+    ppc = case.case_synthetic(14, number_tieline=2, number_dg=number_dg, seed=seed, chain=0.5)
+    vrp_list = c_d.crew_dispatch_scenario(ppc, number_scenario=number_scenario, seed=seed)
+    rng = np.random.default_rng(seed)
+
+    violation = 0
+    for vrp in vrp_list:
+        sp = fh.OutageManageHighs()
+        sp.data_preparation(ppc, vrp, get_time_bucket())
+        sp.form_sp()
+        for k in range(number_schedule):
+            repair_status = random_schedule(sp, rng)
+            upper, lower = sp.get_restoration_bound(repair_status)
+            ObjVal_ub = np.dot(upper, sp.time_weight) * sp.BasePower
+            ObjVal_lb = np.dot(lower, sp.time_weight) * sp.BasePower
+
+            start = time.time()
+            sp.set_repair_schedule(repair_status)
+            sp.solve_problem()
+            ObjVal_sp = sp.get_objective()
+            slack = tolerance * max(ObjVal_ub, 1)
+            status = 'ok' if ObjVal_lb - slack <= ObjVal_sp <= ObjVal_ub + slack else 'VIOLATED'
+            violation += status != 'ok'
+            print('scenario {:3d} schedule {:3d}   lower {:10.2f}   subproblem {:10.2f}   upper {:10.2f}   {:6.2f} s   {}'.format(
+                vrp['scenario'], k, ObjVal_lb, ObjVal_sp, ObjVal_ub, time.time() - start, status))
+            sys.stdout.flush()
+
+    print('{} violated bounds'.format(violation))
+    sys.exit(1 if violation else 0)
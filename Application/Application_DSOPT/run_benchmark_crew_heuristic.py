@@ -0,0 +1,64 @@
+import sys
+import time
+import itertools
+import numpy as np
+
+import Fun_IEEETestCase as case
+import Fun_Crew_Dispatch as c_d
+import formulation_highs as fh
+from crew_heuristic import CrewRouting
+
+## wall time and quality gap of the crew dispatch heuristic against the optimal route by enumeration
+## usage: python run_benchmark_crew_heuristic.py [number of random instances] [largest number of damaged components]
+number_instance = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+max_damaged = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+
+
+def solve_enumeration(heuristic):
+    """
+    get the optimal single crew route of the heuristic objective by enumerating the visiting orders
+    """
+    start = time.time()
+    sequence = np.array(list(itertools.permutations(heuristic.damaged)), dtype=int)
+    ObjVal = heuristic.get_cost(0, sequence).min()
+    return ObjVal, time.time() - start
+
+
+
+def random_instance(number_damaged, rng):
+    """
+    random single crew instance: vertex 0 is the depot, travel time is the rounded distance of random locations
+    """
+    location = rng.uniform(-5, 5, (number_damaged + 1, 2))
+    travel = np.rint(np.sqrt(((location[:, None, :] - location[None, :, :]) ** 2).sum(axis=2)))
+    repair = np.concatenate(([0], rng.integers(1, 10, number_damaged)))
+    weight = np.concatenate(([0], rng.uniform(0, 1, number_damaged)))
+    return CrewRouting((travel + repair[None, :])[None, :, :], np.arange(1, number_damaged + 1), 0, None, weight)
+
+
+
+def report(name, heuristic, ObjVal_opt, time_opt):
+    print('{:24s} heuristic {:10.3f} in {:8.4f} s   optimal {:10.3f} in {:8.4f} s   gap {:6.2f} %'.format(
+        name, heuristic.ObjVal, heuristic.time, ObjVal_opt, time_opt, 100 * (heuristic.ObjVal - ObjVal_opt) / ObjVal_opt))
+
+
+
+if __name__ == "__main__":
+
+    ppc = case.case33_noDG_tieline()
+    vrp = c_d.crew_dispatch_determ()
+
+    om = fh.OutageManageHighs()
+    om.data_preparation(ppc, vrp)
+    heuristic = CrewRouting.from_model(om)
+    path = heuristic.solve()
+    report('crew_dispatch_determ', heuristic, *solve_enumeration(heuristic))
+    print('route {}'.format([vrp['ordered_vertex'][i] for i in path[0]]))
+
+    rng = np.random.default_rng(0)
+    for k in range(number_instance):
+        number_damaged = rng.integers(4, max_damaged + 1)
+        heuristic = random_instance(number_damaged, rng)
+        heuristic.solve()
+        report('random {} damaged'.format(number_damaged), heuristic, *solve_enumeration(heuristic))
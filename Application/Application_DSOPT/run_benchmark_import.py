@@ -0,0 +1,136 @@
+import sys
+import os
+import time
+import json
+import platform
+import subprocess
+from collections import OrderedDict
+
+## import time of the DSOPT modules, of the modules a headless worker loads and of the top-level imports of the run
+## scripts (the scripts themselves are not run), each import in a fresh interpreter
+## a worker must not load the plotting and modelling packages it does not use, e.g. the HiGHS worker loads neither
+## matplotlib nor pyomo, the exit status is 1 if one of them is loaded or an import got slower than the baseline
+## usage: python run_benchmark_import.py [repeat] [output] [baseline json or none]
+repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+output = sys.argv[2] if len(sys.argv) > 2 else 'benchmark_import'
+baseline = sys.argv[3] if len(sys.argv) > 3 and sys.argv[3] != 'none' else None
+
+## packages loaded on first use only
+heavy = ['matplotlib', 'mpl_toolkits', 'networkx', 'pandas', 'sympy', 'pyomo', 'gurobipy', 'z3']
+
+## target name: (modules imported, heavy packages the target is allowed to load)
+target = OrderedDict([
+    ('formulation_general', (['formulation_general'], [])),
+    ('formulation_highs', (['formulation_highs'], [])),
+    ('formulation_pyomo', (['formulation_pyomo'], ['pyomo'])),
+    ('formulation_gurobipy', (['formulation_gurobipy'], ['gurobipy'])),
+    ('formulation_z3', (['formulation_z3'], ['z3'])),
+    ('Fun_IEEETestCase', (['Fun_IEEETestCase'], [])),
+    ('Fun_Crew_Dispatch', (['Fun_Crew_Dispatch'], [])),
+    ('benders', (['benders'], [])),
+    ('held_karp', (['held_karp'], [])),
+    ('worker_highs', (['Fun_IEEETestCase', 'Fun_Crew_Dispatch', 'formulation_highs', 'benders'], [])),
+    ('worker_pyomo', (['Fun_IEEETestCase', 'Fun_Crew_Dispatch', 'formulation_pyomo', 'benders'], ['pyomo'])),
+    ('run_iter', (['run_iter.py'], ['gurobipy'])),
+    ('run_iter_pool', (['run_iter_pool.py'], ['gurobipy'])),
+    ('run_callback', (['run_callback.py'], ['gurobipy'])),
+    ('run_rolling_horizon', (['run_rolling_horizon.py'], ['gurobipy'])),
+    ('run_iter_z3', (['run_iter_z3.py'], ['matplotlib', 'mpl_toolkits', 'gurobipy', 'z3'])),
+    ('run_test_gurobipy', (['run_test_gurobipy.py'], ['gurobipy', 'pyomo'])),
+    ('run_test_pyomo', (['run_test_pyomo.py'], ['pyomo', 'z3'])),
+    ('run_test_z3', (['run_test_z3.py'], ['gurobipy', 'pyomo', 'z3'])),
+])
+
+## largest ratio to the baseline before a target is flagged, with an absolute slack in seconds
+tolerance = 1.3
+time_slack = 0.05
+
+## a target ending in .py is a script, only its top-level import statements are run
+code = """
+import sys, time, json, ast
+script = {{}}
+for name in {module}:
+    if name.endswith('.py'):
+        with open(name) as f:
+            tree = ast.parse(f.read())
+        script[name] = compile(ast.Module([k for k in tree.body if isinstance(k, (ast.Import, ast.ImportFrom))], []), name, 'exec')
+start = time.perf_counter()
+for name in {module}:
+    if name in script:
+        exec(script[name], {{}})
+    else:
+        __import__(name)
+end = time.perf_counter()
+print(json.dumps([end - start, sorted(set(k.split('.')[0] for k in sys.modules) & set({heavy}))]))
+"""
+
+
+
+def run_target(module):
+    """
+    import the modules in a fresh interpreter
+    :return: import time in seconds, list of the heavy packages loaded
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([directory, os.environ.get('PYTHONPATH', '')]))
+    result = subprocess.run([sys.executable, '-c', code.format(module=module, heavy=heavy)], env=env, cwd=directory,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        raise ImportError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+
+def measure(name):
+    """
+    :return: OrderedDict of the record of a target
+    """
+    module, allowed = target[name]
+    res = OrderedDict([('target', name), ('min_time', None), ('median_time', None), ('loaded', None), ('status', 'ok')])
+    try:
+        sample = [run_target(module) for k in range(repeat)]
+    except ImportError as e:
+        res['status'] = 'unavailable: {}'.format(e)
+        return res
+
+    elapsed = sorted(k[0] for k in sample)
+    res['min_time'], res['median_time'] = elapsed[0], elapsed[len(elapsed) // 2]
+    res['loaded'] = sample[-1][1]
+    unexpected = [k for k in res['loaded'] if k not in allowed]
+    if unexpected:
+        res['status'] = 'loads {}'.format(', '.join(unexpected))
+    return res
+
+
+
+if __name__ == "__main__":
+
+    records = []
+    for name in target:
+        res = measure(name)
+        records.append(res)
+        if res['min_time'] is None:
+            print('{:22s} {}'.format(name, res['status']))
+        else:
+            print('{:22s} min {:6.3f} s  median {:6.3f} s  loads {:30s} {}'.format(
+                name, res['min_time'], res['median_time'], ','.join(res['loaded']) or '-', res['status']))
+        sys.stdout.flush()
+
+    with open(output + '.json', 'w') as f:
+        json.dump(OrderedDict([('python', platform.python_version()), ('machine', platform.platform()),
+                               ('date', time.strftime('%Y-%m-%d %H:%M:%S')), ('repeat', repeat), ('records', records)]), f, indent=1)
+    print('records written to {}.json'.format(output))
+
+    failure = [res for res in records if res['status'].startswith('loads')]
+    if baseline is not None:
+        with open(baseline) as f:
+            base = OrderedDict((res['target'], res) for res in json.load(f)['records'])
+        for res in records:
+            old = base.get(res['target'])
+            if old is None or old['min_time'] is None or res['min_time'] is None:
+                continue
+            if res['min_time'] > old['min_time'] * tolerance + time_slack:
+                print('REGRESSION {:22s} min time {:.3f} -> {:.3f} s'.format(res['target'], old['min_time'], res['min_time']))
+                failure.append(res)
+        print('{} failures against {}'.format(len(failure), baseline))
+    sys.exit(1 if failure else 0)
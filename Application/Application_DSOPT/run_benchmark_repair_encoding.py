@@ -0,0 +1,89 @@
+import sys
+import os
+import time
+import numpy as np
+from collections import OrderedDict
+import pyomo.environ as pm
+from pyomo.core.expr.visitor import identify_variables
+
+import Fun_IEEETestCase as case
+import Fun_Crew_Dispatch as c_d
+
+## compare the one-hot (O(T^2) nonzeros) and cumulative (O(T) nonzeros) repair timing encodings
+## usage: python run_benchmark_repair_encoding.py [pyomo solver name] [backend ...]
+pyomo_solver = sys.argv[1] if len(sys.argv) > 1 else 'gurobi'
+backends = sys.argv[2:] if len(sys.argv) > 2 else ['pyomo', 'gurobipy']
+encodings = ['onehot', 'cumulative']
+
+
+
+def count_nonzero_pyomo(model):
+    """
+    count the nonzeros of all active constraints of a pyomo model
+    """
+    return sum(len(list(identify_variables(c.body, include_fixed=False)))
+               for c in model.component_data_objects(pm.Constraint, active=True))
+
+
+
+def run_pyomo(ppc, vrp, encoding):
+    import formulation_pyomo as fm
+
+    res = OrderedDict()
+    test = fm.OutageManagePyomo()
+    test.Repair_Encoding = encoding
+    test.data_preparation(ppc, vrp)
+
+    start = time.time()
+    test.test_crew_dispatch()
+    res['build time'] = time.time() - start
+    res['nonzeros'] = count_nonzero_pyomo(test.model)
+
+    start = time.time()
+    opt = pm.SolverFactory(pyomo_solver)
+    opt.solve(test.model)
+    res['solve time'] = time.time() - start
+    res['objective'] = pm.value(test.model.obj)
+    res['repair step'] = [int(round(sum(t * pm.value(test.model.f[m, t]) for t in test.iter_time))) for m in test.ordered_vertex]
+
+    return res
+
+
+
+def run_gurobipy(ppc, vrp, encoding):
+    import formulation_gurobipy as fg
+
+    res = OrderedDict()
+    test = fg.OutageManageGurobi()
+    test.Repair_Encoding = encoding
+    test.data_preparation(ppc, vrp)
+
+    start = time.time()
+    test.test_crew_dispatch()
+    test.model.update()
+    res['build time'] = time.time() - start
+    res['nonzeros'] = test.model.NumNZs
+
+    start = time.time()
+    test.model.Params.OutputFlag = 0
+    test.model.optimize()
+    res['solve time'] = time.time() - start
+    res['objective'] = test.model.objVal
+    res['repair step'] = [int(round(sum(t * test.f[m, t].x for t in test.iter_time))) for m in test.ordered_vertex]
+
+    return res
+
+
+
+if __name__ == "__main__":
+
+    ppc = case.case33_noDG_tieline()
+    vrp = c_d.crew_dispatch_determ()
+
+    run = {'pyomo': run_pyomo, 'gurobipy': run_gurobipy}
+    for backend in backends:
+        for encoding in encodings:
+            res = run[backend](ppc, vrp, encoding)
+            print('{:10s} {:12s} build {:8.3f} s   nonzeros {:8d}   solve {:8.3f} s   objective {:.4f}'.format(
+                backend, encoding, res['build time'], res['nonzeros'], res['solve time'], res['objective']))
+            print('{:10s} {:12s} repair step {}'.format('', '', res['repair step']))
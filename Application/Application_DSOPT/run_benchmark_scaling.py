@@ -0,0 +1,301 @@
+import sys
+import os
+import time
+import json
+import csv
+import platform
+import resource
+import importlib
+import multiprocessing
+from collections import OrderedDict
+
+import Fun_IEEETestCase as case
+import Fun_Crew_Dispatch as c_d
+
+## scaling of the model build and solve of the co-optimization with the number of buses, damaged components, crews and
+## time steps, one dimension swept at a time around a base point on synthetic feeders and damage scenarios
+## each case runs in a fresh process so that its peak memory is its own
+## the records are written to <output>.json and <output>.csv and compared with the records of a baseline json file,
+## the exit status is 1 if a case got slower, larger or used more memory than the tolerance
+## usage: python run_benchmark_scaling.py [quick|full|build] [output] [baseline json or none] [backend ...]
+sweep_name = sys.argv[1] if len(sys.argv) > 1 else 'quick'
+output = sys.argv[2] if len(sys.argv) > 2 else 'benchmark_scaling'
+baseline = sys.argv[3] if len(sys.argv) > 3 and sys.argv[3] != 'none' else None
+backends = sys.argv[4:] if len(sys.argv) > 4 else ['highs', 'pyomo', 'gurobipy', 'z3']
+
+sweep = {
+    'quick': {'base': OrderedDict([('number_bus', 33), ('number_damaged', 6), ('number_crew', 1), ('Total_Time', 50)]),
+              'dimension': OrderedDict([('number_bus', [33, 100, 300]), ('number_damaged', [4, 6, 8]),
+                                        ('number_crew', [1, 2]), ('Total_Time', [25, 50, 100])]),
+              'time_limit': 20, 'case_limit': 300},
+    'full': {'base': OrderedDict([('number_bus', 100), ('number_damaged', 8), ('number_crew', 1), ('Total_Time', 100)]),
+             'dimension': OrderedDict([('number_bus', [33, 100, 300, 1000, 3000]), ('number_damaged', [4, 8, 16, 32]),
+                                       ('number_crew', [1, 2, 4]), ('Total_Time', [50, 100, 200, 400])]),
+             'time_limit': 300, 'case_limit': 3600},
+}
+## the build sweep is the full sweep without solving, e.g. as a quick check of the model size and build time
+sweep['build'] = dict(sweep['full'], time_limit=0)
+
+## largest ratio to the baseline before a record is flagged, times also get an absolute slack in seconds
+tolerance = OrderedDict([('build_time', 1.5), ('solve_time', 1.5), ('peak_rss_mb', 1.2),
+                         ('variables', 1.0), ('constraints', 1.0), ('nonzeros', 1.0)])
+time_slack = 0.05
+
+field = ['backend', 'dimension', 'number_bus', 'number_damaged', 'number_crew', 'Total_Time',
+         'prepare_time', 'build_time', 'solve_time', 'peak_rss_mb', 'build_rss_mb', 'solve_rss_mb',
+         'variables', 'constraints', 'nonzeros', 'objective', 'status']
+
+
+
+def get_rss():
+    """
+    get the peak resident memory of this process in MB
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+
+def count_nonzero_pyomo(model):
+    """
+    count the nonzeros of all active constraints of a pyomo model
+    """
+    import pyomo.environ as pm
+    from pyomo.core.expr.visitor import identify_variables
+    return sum(len(list(identify_variables(c.body, include_fixed=False)))
+               for c in model.component_data_objects(pm.Constraint, active=True))
+
+
+
+def build_highs(ppc, vrp, time_bucket, res):
+    import formulation_highs as fh
+
+    test = fh.OutageManageHighs()
+    test.data_preparation(ppc, vrp, time_bucket)
+    res['prepare_time'] = time.time() - res['start']
+
+    start = time.time()
+    test.form_cop()
+    A, _, _ = test.model.get_matrix()
+    res['build_time'] = time.time() - start
+    res['variables'], res['constraints'], res['nonzeros'] = A.shape[1], A.shape[0], A.nnz
+
+    def solve(time_limit):
+        try:
+            test.solve(time_limit=time_limit)
+        except RuntimeError:
+            return None, test.result.message
+        return test.get_objective(), test.result.message
+    return solve
+
+
+
+def build_pyomo(ppc, vrp, time_bucket, res):
+    import pyomo.environ as pm
+    import formulation_pyomo as fm
+
+    test = fm.OutageManagePyomo()
+    test.data_preparation(ppc, vrp, time_bucket)
+    res['prepare_time'] = time.time() - res['start']
+
+    start = time.time()
+    test.form_cop()
+    res['build_time'] = time.time() - start
+    res['variables'], res['constraints'] = test.model.nvariables(), test.model.nconstraints()
+    res['nonzeros'] = count_nonzero_pyomo(test.model)
+
+    def solve(time_limit):
+        result = pm.SolverFactory('appsi_highs').solve(test.model, timelimit=time_limit, load_solutions=False)
+        if len(result.solution) > 0:
+            test.model.solutions.load_from(result)
+            return pm.value(test.model.obj) * test.BasePower, str(result.solver.termination_condition)
+        return None, str(result.solver.termination_condition)
+    return solve
+
+
+
+def build_gurobipy(ppc, vrp, time_bucket, res):
+    import formulation_gurobipy as fg
+
+    test = fg.OutageManageGurobi()
+    test.data_preparation(ppc, vrp, time_bucket)
+    res['prepare_time'] = time.time() - res['start']
+
+    start = time.time()
+    test.form_cop()
+    test.model.update()
+    res['build_time'] = time.time() - start
+    res['variables'], res['constraints'], res['nonzeros'] = test.model.NumVars, test.model.NumConstrs, test.model.NumNZs
+
+    def solve(time_limit):
+        test.model.Params.OutputFlag = 0
+        test.model.Params.TimeLimit = time_limit
+        test.model.optimize()
+        return (test.model.objVal if test.model.SolCount > 0 else None), 'status {}'.format(test.model.Status)
+    return solve
+
+
+
+def build_z3(ppc, vrp, time_bucket, res):
+    import formulation_z3 as fz
+
+    if vrp['number_crew'] > 1:
+        raise NotImplementedError('the SMT formulation routes a single crew')
+    test = fz.OutageManageZ3()
+    test.data_preparation(ppc, vrp, time_bucket)
+    res['prepare_time'] = time.time() - res['start']
+
+    start = time.time()
+    test.form_mp(ppc)
+    res['build_time'] = time.time() - start
+    res['constraints'] = len(test.s.assertions())
+
+    def solve(time_limit):
+        test.s.set('timeout', int(time_limit * 1000))
+        result = test.solve_problem()
+        return (test.get_objective() if hasattr(test, 'solution') else None), str(result)
+    return solve
+
+
+
+def run_case(backend, dimension, point, time_limit):
+    """
+    build and solve one case, called in a fresh process
+    :param point: OrderedDict of the swept dimensions
+    :return: OrderedDict of the record
+    """
+    res = OrderedDict((name, None) for name in field)
+    res.update(backend=backend, dimension=dimension, **point)
+    try:
+        importlib.import_module('formulation_' + backend)
+    except ImportError as e:
+        res['status'] = 'unavailable: {}'.format(e)
+        return res
+
+    ## synthetic feeder and a damage scenario of the point, the same for all backends
+    ppc = case.case_synthetic(point['number_bus'], number_tieline=max(5, point['number_bus'] // 50),
+                              number_dg=point['number_bus'] // 100, seed=0)
+    vrp = c_d.crew_dispatch_scenario(ppc, 1, point['number_damaged'], point['number_crew'], seed=0)[0]
+    time_bucket = [1] * point['Total_Time']
+
+    rss = get_rss()
+    res['start'] = time.time()
+    try:
+        solve = globals()['build_' + backend](ppc, vrp, time_bucket, res)
+        res['build_rss_mb'] = get_rss() - rss
+        if time_limit > 0:
+            start = time.time()
+            res['objective'], res['status'] = solve(time_limit)
+            res['solve_time'] = time.time() - start
+            res['solve_rss_mb'] = get_rss() - rss
+        else:
+            res['status'] = 'built'
+    except Exception as e:
+        res['status'] = 'error: {}: {}'.format(type(e).__name__, str(e).splitlines()[0] if str(e) else '')
+    del res['start']
+    res['peak_rss_mb'] = get_rss()
+
+    return res
+
+
+
+def get_case(sweep_name):
+    """
+    get the cases of a sweep, the base point is only run once
+    :return: list of (dimension, point)
+    """
+    config = sweep[sweep_name]
+    cases, seen = [], set()
+    for dimension, values in config['dimension'].items():
+        for value in values:
+            point = OrderedDict(config['base'])
+            point[dimension] = value
+            key = tuple(point.values())
+            if key not in seen:
+                seen.add(key)
+                cases.append(('base' if point == config['base'] else dimension, point))
+    return cases
+
+
+
+def get_key(res):
+    return tuple(res[name] for name in ['backend', 'number_bus', 'number_damaged', 'number_crew', 'Total_Time'])
+
+
+
+def compare(records, baseline_records):
+    """
+    compare the records with the baseline records of the same backend and point
+    :return: list of (record, metric, baseline value, value) that exceed the tolerance
+    """
+    base = OrderedDict((get_key(res), res) for res in baseline_records)
+    regression = []
+    for res in records:
+        if get_key(res) not in base:
+            continue
+        old = base[get_key(res)]
+        for metric, ratio in tolerance.items():
+            if res[metric] is None or old[metric] is None:
+                continue
+            slack = time_slack if metric.endswith('time') else 0
+            if res[metric] > old[metric] * ratio + slack:
+                regression.append((res, metric, old[metric], res[metric]))
+    return regression
+
+
+
+def write(records, output):
+    """
+    write the records to output.json with the machine description and to output.csv
+    """
+    with open(output + '.json', 'w') as f:
+        json.dump(OrderedDict([('sweep', sweep_name), ('python', platform.python_version()),
+                               ('machine', platform.platform()), ('cpu', os.cpu_count()),
+                               ('date', time.strftime('%Y-%m-%d %H:%M:%S')), ('records', records)]), f, indent=1)
+    with open(output + '.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=field)
+        writer.writeheader()
+        writer.writerows(records)
+
+
+
+def report(res):
+    def show(value, form):
+        return form.format(value) if value is not None else ' ' * len(form.format(0))
+    print('{:9s} {:15s} bus {:5d} damaged {:3d} crew {:2d} T {:4d} | build {} s  rss {} MB  var {}  con {}  nnz {} | solve {} s  {}'.format(
+        res['backend'], res['dimension'], res['number_bus'], res['number_damaged'], res['number_crew'], res['Total_Time'],
+        show(res['build_time'], '{:7.2f}'), show(res['peak_rss_mb'], '{:7.1f}'), show(res['variables'], '{:8d}'),
+        show(res['constraints'], '{:8d}'), show(res['nonzeros'], '{:9d}'), show(res['solve_time'], '{:7.2f}'), res['status']))
+    sys.stdout.flush()
+
+
+
+if __name__ == "__main__":
+
+    config = sweep[sweep_name]
+    context = multiprocessing.get_context('spawn')
+    records = []
+    for backend in backends:
+        for dimension, point in get_case(sweep_name):
+            pool = context.Pool(1, maxtasksperchild=1)
+            try:
+                res = pool.apply_async(run_case, (backend, dimension, point, config['time_limit'])).get(config['case_limit'])
+            except multiprocessing.TimeoutError:
+                res = OrderedDict((name, None) for name in field)
+                res.update(backend=backend, dimension=dimension, status='timeout after {} s'.format(config['case_limit']), **point)
+            finally:
+                pool.terminate()
+                pool.join()
+            records.append(res)
+            report(res)
+
+    write(records, output)
+    print('records written to {}.json and {}.csv'.format(output, output))
+
+    if baseline is not None:
+        with open(baseline) as f:
+            regression = compare(records, json.load(f)['records'])
+        for res, metric, old, new in regression:
+            print('REGRESSION {:9s} bus {} damaged {} crew {} T {}: {} {:.4g} -> {:.4g}'.format(
+                res['backend'], res['number_bus'], res['number_damaged'], res['number_crew'], res['Total_Time'], metric, old, new))
+        print('{} regressions against {}'.format(len(regression), baseline))
+        sys.exit(1 if regression else 0)
@@ -0,0 +1,73 @@
+import sys
+import os
+import time
+import numpy as np
+from collections import OrderedDict
+
+import Fun_IEEETestCase as case
+import Fun_Crew_Dispatch as c_d
+from formulation_general import get_time_bucket
+
+## compare the model size of the co-optimization on unit time steps and on time buckets, fine near the start and coarse later
+## usage: python run_benchmark_time_bucket.py [backend ...]
+backends = sys.argv[1:] if len(sys.argv) > 1 else ['gurobipy', 'highs']
+
+
+
+def run_gurobipy(ppc, vrp, time_bucket):
+    import formulation_gurobipy as fg
+
+    res = OrderedDict()
+    test = fg.OutageManageGurobi()
+    test.data_preparation(ppc, vrp, time_bucket)
+
+    start = time.time()
+    test.form_cop()
+    test.model.update()
+    res['build time'] = time.time() - start
+    res['variables'] = test.model.NumVars
+    res['constraints'] = test.model.NumConstrs
+    res['nonzeros'] = test.model.NumNZs
+    res['loss bound'] = test.get_time_bucket_loss()
+
+    return res
+
+
+
+def run_highs(ppc, vrp, time_bucket):
+    import formulation_highs as fh
+
+    res = OrderedDict()
+    test = fh.OutageManageHighs()
+    test.data_preparation(ppc, vrp, time_bucket)
+
+    start = time.time()
+    test.form_cop()
+    A, _, _ = test.model.get_matrix()
+    res['build time'] = time.time() - start
+    res['variables'] = A.shape[1]
+    res['constraints'] = A.shape[0]
+    res['nonzeros'] = A.nnz
+    res['loss bound'] = test.get_time_bucket_loss()
+
+    return res
+
+
+
+if __name__ == "__main__":
+
+    ppc = case.case33_noDG_tieline()
+    vrp = c_d.crew_dispatch_determ()
+
+    time_bucket = get_time_bucket()
+    print('time buckets {}'.format(time_bucket))
+
+    run = {'gurobipy': run_gurobipy, 'highs': run_highs}
+    for backend in backends:
+        res_unit = run[backend](ppc, vrp, None)
+        res_bucket = run[backend](ppc, vrp, time_bucket)
+        for name, res in [('unit', res_unit), ('bucket', res_bucket)]:
+            print('{:10s} {:8s} build {:8.3f} s   variables {:8d}   constraints {:8d}   nonzeros {:9d}'.format(
+                backend, name, res['build time'], res['variables'], res['constraints'], res['nonzeros']))
+        print('{:10s} {:8s} reduction of nonzeros {:.2f}x, served energy given up at most {:.2f}'.format(
+            backend, '', res_unit['nonzeros'] / res_bucket['nonzeros'], res_bucket['loss bound']))
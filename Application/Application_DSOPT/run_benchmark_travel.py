@@ -0,0 +1,67 @@
+import sys
+import os
+import time
+import math
+import tempfile
+import numpy as np
+import networkx as nx
+
+import Fun_Crew_Dispatch as c_d
+
+## travel time matrices of many damage sites and depots: straight-line distance and shortest paths on a road graph
+## usage: python run_benchmark_travel.py [number of damage sites] [number of depots] [road grid size]
+number_site = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+number_depot = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+grid_size = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+
+
+def get_travel_loop(location):
+    """
+    travel time by the nested loop of the dictionary form
+    """
+    travel = {}
+    for i in range(len(location)):
+        travel[i] = {}
+        for j in range(len(location)):
+            travel[i][j] = int(round(math.sqrt((location[i][0] - location[j][0]) ** 2 + (location[i][1] - location[j][1]) ** 2)))
+    return travel
+
+
+
+def get_road_graph(grid_size, rng):
+    """
+    grid road graph over the square [0, grid_size) with node positions and random road lengths
+    """
+    graph = nx.grid_2d_graph(grid_size, grid_size)
+    for n in graph.nodes:
+        graph.nodes[n]['pos'] = n
+    for i, j in graph.edges:
+        graph.edges[i, j]['weight'] = rng.uniform(1, 2)
+    return graph
+
+
+
+if __name__ == "__main__":
+
+    rng = np.random.default_rng(0)
+    location = rng.uniform(0, grid_size - 1, (number_site + number_depot, 2))
+
+    start = time.time()
+    travel_loop = get_travel_loop(location.tolist())
+    time_loop = time.time() - start
+
+    start = time.time()
+    travel = c_d.get_travel_matrix(location)
+    time_vector = time.time() - start
+    print('straight line {} x {}: loop {:.3f} s, vectorized {:.3f} s, equal {}'.format(
+        travel.shape[0], travel.shape[1], time_loop, time_vector,
+        all(travel_loop[i][j] == travel[i, j] for i in range(0, len(location), 37) for j in range(len(location)))))
+
+    graph = get_road_graph(grid_size, rng)
+    cache_dir = tempfile.mkdtemp()
+    for name in ['road (computed)', 'road (cached)']:
+        start = time.time()
+        site = c_d.get_nearest_node(graph, location)
+        travel = c_d.get_travel_matrix_road(graph, site, cache_dir=cache_dir)
+        print('{} on {} nodes: {:.3f} s'.format(name, graph.number_of_nodes(), time.time() - start))
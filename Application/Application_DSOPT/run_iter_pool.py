@@ -0,0 +1,56 @@
+import sys
+import functools
+
+import Fun_IEEETestCase as case
+import Fun_Crew_Dispatch as c_d
+import formulation_gurobipy as fg
+from benders import BendersEngine, SubproblemCache, SubproblemPool, CutPool
+
+## Benders iteration with several candidate routes per iteration from the solution pool of the master problem,
+## the subproblems are evaluated in parallel by a process pool
+## usage: python run_iter_pool.py [number of candidates] [number of processes]
+number_candidate = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+
+
+def build_sp(ppc, vrp):
+    """
+    build the subproblem of a worker process
+    """
+    sp = fg.OutageManageGurobi()
+    sp.data_preparation(ppc, vrp)
+    sp.form_sp()
+    sp.model.Params.OutputFlag = 0
+    sp.model.update()
+    return sp
+
+
+
+if __name__ == "__main__":
+
+    ## get data
+    ppc = case.case33_noDG_tieline()
+    vrp = c_d.crew_dispatch_determ()
+
+    ## formulate master problem
+    print('Begin to formulate master problem')
+    mp = fg.OutageManageGurobi()
+    mp.data_preparation(ppc, vrp)
+    mp.form_mp()
+    mp.model.Params.PoolSolutions = number_candidate
+    mp.model.update()
+
+    ## formulate subproblem for the graph-based bounds, the pool workers solve the subproblems
+    sp = fg.OutageManageGurobi()
+    sp.data_preparation(ppc, vrp)
+
+    ## starting loops
+    print('Start the iteration')
+    with SubproblemPool(functools.partial(build_sp, ppc, vrp), processes) as pool:
+        engine = BendersEngine(mp, sp, gap=1e-4, cache=SubproblemCache(sp.index), pool=pool, number_candidate=number_candidate,
+                               cut_pool=CutPool(mp))
+        ObjVal_best, route_best = engine.run()
+
+    print('Best objective {} with route {}'.format(ObjVal_best, route_best))
+    print('Schedules evaluated by {}'.format(dict(engine.count)))
@@ -0,0 +1,36 @@
+import sys
+
+import Fun_IEEETestCase as case
+import Fun_Crew_Dispatch as c_d
+import formulation_gurobipy as fg
+from rolling_horizon import RollingHorizon
+
+## rolling-horizon solution of the co-optimization over overlapping windows
+## usage: python run_rolling_horizon.py [window] [committed steps per window]
+window = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+step = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+
+
+def setup(model):
+    """
+    solver parameters of each window
+    """
+    model.model.Params.OutputFlag = 0
+    model.model.Params.MIPGap = 0.01
+
+
+
+if __name__ == "__main__":
+
+    ## get data
+    ppc = case.case33_noDG_tieline()
+    vrp = c_d.crew_dispatch_determ()
+
+    print('Start the rolling horizon')
+    rh = RollingHorizon(fg.OutageManageGurobi, ppc, vrp, window=window, step=step, setup=setup)
+    ObjVal, route = rh.run()
+
+    print('Served energy {} with route {}'.format(ObjVal, route))
+    print('Build time {:.3f} s, solve time {:.3f} s'.format(sum(r['time_build'] for r in rh.history),
+                                                            sum(r['time_solve'] for r in rh.history)))
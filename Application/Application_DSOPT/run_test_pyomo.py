@@ -1,20 +1,12 @@
 import sys
 import os
 import time
-import pandas as pd
 import numpy as np
 import math
-import sympy as sy
-import matplotlib
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
 import os
-import ast
-import networkx as nx
 import operator
 from collections import OrderedDict
 # import gurobipy as gb
-import pyomo.environ as pm
 
 dir_path = os.path.dirname(os.path.realpath(__file__)) # add Z3 binary distribution to the system path
 # sys.path.append(dir_path+'/SatEX/solver/z3/z3-4.4.1-x64-osx-10.11/bin/')  # version 4.4